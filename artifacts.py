@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+
+from compiled_model import LinearPolitenessModel
+from features.vocabulary import save_vocabulary
+
+"""
+Packed, memory-mappable model artifact.
+
+Replaces politeness-svm.p, featunigrams.p and featbigrams.p
+with a directory of flat arrays:
+
+    manifest.json- format version, model version, intercept,
+        Platt sigmoid parameters, classes
+    coef.npy- linear weights, one per feature column
+    feature_names.npy, unigrams.npy, bigrams.npy, ...-
+        vectorizer column mapping (see features/vocabulary.py)
+
+Arrays are opened with mmap_mode='r', so all processes
+on a host share the same read-only pages instead of each
+unpickling private copies.
+"""
+
+FORMAT_VERSION = 1
+
+ARTIFACT_DIRNAME = os.path.join(os.path.split(__file__)[0], 'politeness-model')
+
+
+def write_artifact(compiled, vectorizer, dirname=ARTIFACT_DIRNAME):
+    """
+    :param compiled- LinearPolitenessModel (see compiled_model.py)
+    :param vectorizer- PolitenessFeatureVectorizer whose
+        columns the model's weights are in
+    """
+    if len(compiled.coef_) != len(vectorizer.feature_names):
+        raise ValueError("Model has %d weights, vectorizer has %d features" % (len(compiled.coef_), len(vectorizer.feature_names)))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    save_vocabulary(vectorizer, dirname)
+    np.save(os.path.join(dirname, "coef.npy"), compiled.coef_)
+    version = hashlib.sha1(compiled.coef_.tostring())
+    for f in vectorizer.feature_names:
+        version.update(f)
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'version': version.hexdigest(),
+        'n_features': len(vectorizer.feature_names),
+        'intercept': compiled.intercept_,
+        'probA': compiled.probA_,
+        'probB': compiled.probB_,
+        'classes': compiled.classes_.tolist(),
+    }
+    json.dump(manifest, open(os.path.join(dirname, "manifest.json"), 'w'), indent=2)
+    return manifest
+
+
+def read_manifest(dirname=ARTIFACT_DIRNAME):
+    manifest = json.load(open(os.path.join(dirname, "manifest.json")))
+    if manifest['format_version'] != FORMAT_VERSION:
+        raise ValueError("Unsupported artifact format version %s" % manifest['format_version'])
+    return manifest
+
+
+def load_artifact(dirname=ARTIFACT_DIRNAME):
+    """
+    returns (LinearPolitenessModel, PolitenessFeatureVectorizer),
+    both backed by memory-mapped arrays
+    """
+    from features.vectorizer import PolitenessFeatureVectorizer
+    manifest = read_manifest(dirname)
+    coef = np.load(os.path.join(dirname, "coef.npy"), mmap_mode='r')
+    compiled = LinearPolitenessModel(coef, manifest['intercept'], manifest['probA'],
+                                     manifest['probB'], manifest['classes'])
+    vectorizer = PolitenessFeatureVectorizer(artifact=dirname)
+    return compiled, vectorizer
+
+
+def convert_pickles(dirname=ARTIFACT_DIRNAME, model_filename=None):
+    """
+    Convert the pickled SVM and unigram/bigram lists
+    into an artifact directory
+    """
+    import model
+    from features.vectorizer import PolitenessFeatureVectorizer
+    clf = model.load(model_filename or model.MODEL_FILENAME)
+    compiled = LinearPolitenessModel.from_svc(clf)
+    return write_artifact(compiled, PolitenessFeatureVectorizer(), dirname)
+
+
+
+if __name__ == "__main__":
+
+    """
+    Convert the pickles, then check the artifact
+    scores the test documents like the pickles do
+    """
+
+    import copy
+    import model
+    from test_documents import TEST_DOCUMENTS
+
+    dirname = sys.argv[1] if len(sys.argv) > 1 else ARTIFACT_DIRNAME
+    manifest = convert_pickles(dirname)
+    print "Wrote artifact %s (version %s)" % (dirname, manifest['version'])
+
+    expected = model.score_batch(copy.deepcopy(TEST_DOCUMENTS), as_dicts=False)
+    compiled, vectorizer = load_artifact(dirname)
+    X = vectorizer.transform(copy.deepcopy(TEST_DOCUMENTS))
+    print "TEST_DOCUMENTS max |diff| = %g" % np.abs(compiled.predict_proba(X) - expected).max()
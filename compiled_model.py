@@ -0,0 +1,269 @@
+import numpy as np
+
+"""
+A compiled form of the linear politeness SVM.
+
+The pre-trained model is a linear-kernel svm.SVC with
+probability estimates, so its decision function is a
+dot product and its probabilities are libsvm's Platt
+sigmoid. This file extracts those parameters into plain
+numpy arrays, so scoring needs no sklearn object (and
+no pickle tied to an sklearn version).
+"""
+
+
+class LinearPolitenessModel:
+
+    """
+    Linear decision function + Platt sigmoid.
+
+    Exposes predict_proba and decision_function with the
+    same conventions as the svm.SVC it was exported from,
+    so it can stand in for model.clf.
+    """
+
+    # libsvm clips pairwise probabilities to [MIN_PROB, 1 - MIN_PROB]
+    MIN_PROB = 1e-7
+
+    def __init__(self, coef, intercept, probA, probB, classes=(0, 1)):
+        """
+        :param coef- weight per feature column, in sorted feature-name order
+        :param intercept- decision function bias
+        :param probA, probB- Platt sigmoid parameters, as stored by libsvm
+        :param classes- class labels, (negative, positive)
+        """
+        self.coef_ = np.asarray(coef, dtype=np.float64).ravel()
+        self.intercept_ = float(intercept)
+        self.probA_ = float(probA)
+        self.probB_ = float(probB)
+        self.classes_ = np.asarray(classes)
+
+    @classmethod
+    def from_svc(cls, clf):
+        """
+        Extract parameters from a fitted binary,
+        linear-kernel svm.SVC(probability=True)
+        """
+        if getattr(clf, 'kernel', None) != 'linear':
+            raise ValueError("Only linear-kernel SVMs can be compiled")
+        if len(clf.classes_) != 2:
+            raise ValueError("Only binary SVMs can be compiled")
+        if len(getattr(clf, 'probA_', [])) != 1:
+            raise ValueError("SVM must be trained with probability=True")
+        coef = clf.coef_
+        if hasattr(coef, 'toarray'):
+            coef = coef.toarray()
+        return cls(coef, clf.intercept_[0], clf.probA_[0], clf.probB_[0], clf.classes_)
+
+    @classmethod
+    def from_linear_classifier(cls, clf, X, y):
+        """
+        Wrap a fitted binary linear classifier (e.g.
+        SGDClassifier, LinearSVC), calibrating its decision
+        function with a Platt sigmoid fit on held-out X, y.
+        """
+        if len(clf.classes_) != 2:
+            raise ValueError("Only binary classifiers can be compiled")
+        compiled = cls(clf.coef_, clf.intercept_[0], 0.0, 0.0, clf.classes_)
+        compiled.calibrate(X, y)
+        return compiled
+
+    def calibrate(self, X, y):
+        """
+        Refit probA_, probB_ on held-out X, y
+        """
+        d = self.decision_function(X)
+        # Same convention as libsvm (see predict_proba):
+        # fit P(classes_[0]) on the negated decision value
+        self.probA_, self.probB_ = fit_platt_sigmoid(-d, np.asarray(y) == self.classes_[0])
+
+    def save(self, filename):
+        np.savez(filename, coef=self.coef_, intercept=self.intercept_,
+                 probA=self.probA_, probB=self.probB_, classes=self.classes_)
+
+    @classmethod
+    def load(cls, filename):
+        arrays = np.load(filename)
+        return cls(arrays['coef'], arrays['intercept'], arrays['probA'],
+                   arrays['probB'], arrays['classes'])
+
+    def decision_function(self, X):
+        """
+        X - (n_samples, n_features) sparse or dense matrix
+        """
+        return np.asarray(X.dot(self.coef_)).ravel() + self.intercept_
+
+    def predict_proba(self, X):
+        """
+        Returns (n_samples, 2) array of class probabilities,
+        columns ordered as self.classes_
+        """
+        return self.proba_from_decision(self.decision_function(X))
+
+    def proba_from_decision(self, d):
+        """
+        predict_proba, given decision_function values
+        """
+        d = np.asarray(d, dtype=np.float64)
+        # libsvm stores the decision value with the opposite
+        # sign, and its sigmoid gives P(classes_[0])
+        r = 1.0 / (1.0 + np.exp(-self.probA_ * d + self.probB_))
+        r = np.clip(r, self.MIN_PROB, 1.0 - self.MIN_PROB)
+        p = _couple_pairwise_probabilities(r)
+        return np.column_stack((p, 1.0 - p))
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+
+def _couple_pairwise_probabilities(r):
+    """
+    libsvm's multiclass_probability, specialized to two
+    classes and vectorized over rows. For k=2 the exact
+    solution is r itself, but libsvm stops iterating at
+    a tolerance, and we must match its output.
+
+    r - array of P(class 0) from the sigmoid
+    returns array of coupled P(class 0)
+    """
+    k, max_iter, eps = 2, 100, 0.005 / 2
+    a, b = r, 1.0 - r
+    Q = [[b * b, -b * a], [-a * b, a * a]]
+    p = [np.full(r.shape, 1.0 / k), np.full(r.shape, 1.0 / k)]
+    for _ in xrange(max_iter):
+        Qp = [Q[0][0] * p[0] + Q[0][1] * p[1], Q[1][0] * p[0] + Q[1][1] * p[1]]
+        pQp = p[0] * Qp[0] + p[1] * Qp[1]
+        max_error = np.maximum(np.abs(Qp[0] - pQp), np.abs(Qp[1] - pQp))
+        active = max_error >= eps
+        if not active.any():
+            break
+        for t in xrange(k):
+            diff = np.where(active, (-Qp[t] + pQp) / Q[t][t], 0.0)
+            p[t] = p[t] + diff
+            pQp = (pQp + diff * (diff * Q[t][t] + 2 * Qp[t])) / (1 + diff) / (1 + diff)
+            for j in xrange(k):
+                Qp[j] = (Qp[j] + diff * Q[t][j]) / (1 + diff)
+                p[j] = p[j] / (1 + diff)
+    return p[0]
+
+
+def fit_platt_sigmoid(decision_values, labels):
+    """
+    libsvm's sigmoid_train: Newton's method with backtracking
+    for A, B in P(label) = 1 / (1 + exp(A * f + B)).
+
+    decision_values - array of decision values f
+    labels - boolean array, True for the positive label
+    returns (A, B)
+    """
+    f = np.asarray(decision_values, dtype=np.float64)
+    labels = np.asarray(labels, dtype=bool)
+    prior1 = float(labels.sum())
+    prior0 = len(labels) - prior1
+    max_iter, min_step, sigma, eps = 100, 1e-10, 1e-12, 1e-5
+    # Smoothed targets, to avoid overfitting small sets
+    t = np.where(labels, (prior1 + 1.0) / (prior1 + 2.0), 1.0 / (prior0 + 2.0))
+
+    def objective(A, B):
+        fApB = f * A + B
+        return np.sum(t * fApB + np.logaddexp(0.0, -fApB))
+
+    A, B = 0.0, np.log((prior0 + 1.0) / (prior1 + 1.0))
+    fval = objective(A, B)
+    for _ in xrange(max_iter):
+        fApB = f * A + B
+        # 1 / (1 + exp(fApB)), without overflow
+        p = 0.5 * (1.0 - np.tanh(0.5 * fApB))
+        d2 = p * (1.0 - p)
+        h11 = sigma + np.sum(f * f * d2)
+        h22 = sigma + np.sum(d2)
+        h21 = np.sum(f * d2)
+        d1 = t - p
+        g1, g2 = np.sum(f * d1), np.sum(d1)
+        if abs(g1) < eps and abs(g2) < eps:
+            break
+        det = h11 * h22 - h21 * h21
+        dA = -(h22 * g1 - h21 * g2) / det
+        dB = -(-h21 * g1 + h11 * g2) / det
+        gd = g1 * dA + g2 * dB
+        stepsize = 1.0
+        while stepsize >= min_step:
+            newA, newB = A + stepsize * dA, B + stepsize * dB
+            newf = objective(newA, newB)
+            if newf < fval + 0.0001 * stepsize * gd:
+                A, B, fval = newA, newB, newf
+                break
+            stepsize /= 2.0
+        if stepsize < min_step:
+            # Line search failed
+            break
+    return float(A), float(B)
+
+
+def export_linear_model(clf, filename):
+    """
+    Compile a fitted svm.SVC and save it as a numpy .npz
+    """
+    compiled = LinearPolitenessModel.from_svc(clf)
+    compiled.save(filename)
+    return compiled
+
+
+def load_linear_model(filename):
+    return LinearPolitenessModel.load(filename)
+
+
+# (svm.SVC, its LinearPolitenessModel), for as_linear_model
+_last_compiled = None
+
+def as_linear_model(clf):
+    """
+    clf as a LinearPolitenessModel. The compiled form of
+    the last SVC seen is kept, so callers that compile
+    model.clf per object (IncrementalScorer, FeatureBits
+    scoring) extract its parameters once. An SVC refit in
+    place is not recompiled.
+    """
+    global _last_compiled
+    if isinstance(clf, LinearPolitenessModel):
+        return clf
+    last = _last_compiled
+    if last is None or last[0] is not clf:
+        last = _last_compiled = (clf, LinearPolitenessModel.from_svc(clf))
+    return last[1]
+
+
+def check_parity(clf, compiled, X, tolerance=1e-9):
+    """
+    Max absolute difference between clf.predict_proba
+    and compiled.predict_proba on X. Raises AssertionError
+    if it exceeds tolerance.
+    """
+    diff = np.abs(clf.predict_proba(X) - compiled.predict_proba(X)).max()
+    assert diff <= tolerance, "Compiled model differs from SVM by %g" % diff
+    return diff
+
+
+
+if __name__ == "__main__":
+
+    """
+    Compile the pre-trained SVM and check
+    parity against sklearn's predict_proba
+    """
+
+    import model
+    from test_documents import TEST_DOCUMENTS
+
+    model.load()
+    compiled = export_linear_model(model.clf, model.COMPILED_MODEL_FILENAME)
+    print "Saved compiled model to %s" % model.COMPILED_MODEL_FILENAME
+
+    X = model._feature_matrix(TEST_DOCUMENTS)
+    print "TEST_DOCUMENTS max |diff| = %g" % check_parity(model.clf, compiled, X)
+
+    # Synthetic corpus: random sparse binary feature rows
+    from scipy.sparse import csr_matrix
+    rng = np.random.RandomState(0)
+    X = csr_matrix((rng.rand(5000, X.shape[1]) < 0.02).astype(np.float64))
+    print "Synthetic corpus max |diff| = %g" % check_parity(model.clf, compiled, X)
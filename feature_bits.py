@@ -0,0 +1,230 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from compiled_model import as_linear_model
+
+"""
+Bit-packed storage of feature vectors.
+
+All features are binary, so a feature row is stored as
+ceil(n_features / 8) bytes (numpy.packbits order: column
+0 is the high bit of byte 0), in the vectorizer's column
+order. A feature directory holds--
+
+    bits.bin- raw uint8 rows, appended chunk by chunk
+    feature_names.npy- the column order
+    manifest.json- format version, row count, row size
+        and a sha1 of the feature names
+
+Rows are read back memory-mapped. A linear model scores
+them without unpacking: its weights are precomputed as a
+(row bytes, 256) table of the summed weight of every byte
+value at every byte position, so a decision value is one
+table lookup per byte.
+
+Usage--
+    writer = FeatureBitsWriter("features.bits", model.vectorizer.feature_names)
+    writer.write(model.vectorizer.transform(documents))
+    writer.close()
+    probs = FeatureBits("features.bits").predict_proba(model.clf)
+"""
+
+FORMAT_VERSION = 1
+
+
+def feature_names_hash(feature_names):
+    version = hashlib.sha1()
+    for f in feature_names:
+        version.update(f.encode('utf-8') if isinstance(f, unicode) else str(f))
+        version.update("\n")
+    return version.hexdigest()
+
+
+def pack_rows(X, n_features=None):
+    """
+    :param X- binary sparse (or dense) matrix
+    returns (n_rows, ceil(n_features / 8)) uint8 array
+    """
+    n_features = X.shape[1] if n_features is None else n_features
+    if not hasattr(X, 'tocsr'):
+        return np.packbits(np.asarray(X) != 0, axis=1)
+    X = X.tocsr()
+    bits = np.zeros((X.shape[0], (n_features + 7) // 8), dtype=np.uint8)
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    columns = X.indices[X.data != 0]
+    rows = rows[X.data != 0]
+    np.bitwise_or.at(bits, (rows, columns >> 3), (128 >> (columns & 7)).astype(np.uint8))
+    return bits
+
+
+def unpack_rows(bits, n_features):
+    """
+    returns CSR matrix of packed rows
+    """
+    return csr_matrix(np.unpackbits(bits, axis=1)[:, :n_features], dtype=np.float64)
+
+
+def weight_table(coef):
+    """
+    :param coef- weight per feature column
+    returns (row bytes, 256) array: summed weight of
+        the columns set in each byte value, per byte
+    """
+    coef = np.asarray(coef, dtype=np.float64).ravel()
+    row_bytes = (len(coef) + 7) // 8
+    padded = np.zeros(row_bytes * 8)
+    padded[:len(coef)] = coef
+    byte_bits = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)
+    return padded.reshape(row_bytes, 8).dot(byte_bits.T)
+
+
+def decision_function(bits, table, intercept):
+    """
+    linear decision values of packed rows
+    """
+    bits = np.asarray(bits)
+    return table[np.arange(bits.shape[1]), bits].sum(axis=1) + intercept
+
+
+class FeatureBitsWriter(object):
+
+    """
+    Appends packed feature rows to a feature directory
+    """
+
+    def __init__(self, dirname, feature_names):
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.dirname = dirname
+        self.feature_names = list(feature_names)
+        self.n_rows = 0
+        self._file = open(os.path.join(dirname, "bits.bin"), "wb")
+
+    def write(self, X):
+        """
+        :param X- rows to append, columns in feature_names order
+        """
+        if X.shape[1] != len(self.feature_names):
+            raise ValueError("Rows have %d columns, expected %d" % (X.shape[1], len(self.feature_names)))
+        bits = pack_rows(X)
+        self._file.write(bits.tostring())
+        self.n_rows += bits.shape[0]
+
+    def close(self):
+        self._file.close()
+        np.save(os.path.join(self.dirname, "feature_names.npy"), np.array(self.feature_names))
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'n_rows': self.n_rows,
+            'n_features': len(self.feature_names),
+            'row_bytes': (len(self.feature_names) + 7) // 8,
+            'feature_names_sha1': feature_names_hash(self.feature_names),
+        }
+        json.dump(manifest, open(os.path.join(self.dirname, "manifest.json"), 'w'), indent=2, sort_keys=True)
+        return manifest
+
+
+def write_feature_bits(dirname, matrices, feature_names):
+    """
+    :param matrices- iterable of feature matrices (chunks)
+    returns manifest
+    """
+    writer = FeatureBitsWriter(dirname, feature_names)
+    for X in matrices:
+        writer.write(X)
+    return writer.close()
+
+
+class FeatureBits(object):
+
+    """
+    Memory-mapped packed feature rows
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.manifest = json.load(open(os.path.join(dirname, "manifest.json")))
+        if self.manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError("Unsupported feature bits format version %s" % self.manifest['format_version'])
+        self.n_features = self.manifest['n_features']
+        if self.manifest['n_rows']:
+            self.bits = np.memmap(os.path.join(dirname, "bits.bin"), dtype=np.uint8, mode='r',
+                                  shape=(self.manifest['n_rows'], self.manifest['row_bytes']))
+        else:
+            self.bits = np.zeros((0, self.manifest['row_bytes']), dtype=np.uint8)
+
+    def __len__(self):
+        return self.manifest['n_rows']
+
+    @property
+    def feature_names(self):
+        return np.load(os.path.join(self.dirname, "feature_names.npy")).tolist()
+
+    def check_feature_names(self, feature_names):
+        if feature_names_hash(feature_names) != self.manifest['feature_names_sha1']:
+            raise ValueError("Feature rows in %s were written with a different column order" % self.dirname)
+
+    def matrix(self, start=0, stop=None):
+        """
+        rows [start, stop) as a CSR matrix
+        """
+        return unpack_rows(self.bits[start:stop], self.n_features)
+
+    def iter_matrices(self, chunksize=100000):
+        for start in xrange(0, len(self), chunksize):
+            yield self.matrix(start, start + chunksize)
+
+    def decision_function(self, clf, chunksize=100000):
+        """
+        :param clf- linear model, as in predict_proba
+        """
+        clf = as_linear_model(clf)
+        if len(clf.coef_) != self.n_features:
+            raise ValueError("Model has %d weights, rows have %d features" % (len(clf.coef_), self.n_features))
+        table = weight_table(clf.coef_)
+        if not len(self):
+            return np.zeros(0)
+        return np.concatenate([decision_function(self.bits[start:start + chunksize], table, clf.intercept_)
+                               for start in xrange(0, len(self), chunksize)])
+
+    def predict_proba(self, clf, chunksize=100000):
+        """
+        :param clf- linear-kernel svm.SVC or LinearPolitenessModel,
+            with weights in this file's column order
+        returns (n_rows, 2) class probabilities, as clf.predict_proba
+        """
+        clf = as_linear_model(clf)
+        return clf.proba_from_decision(self.decision_function(clf, chunksize))
+
+
+
+if __name__ == "__main__":
+
+    """
+    Store the test documents' features as bits,
+    and score them from the bits
+    """
+
+    import copy
+    import shutil
+    import tempfile
+    import model
+    from test_documents import TEST_DOCUMENTS
+
+    model.ensure_loaded()
+    X = model.vectorizer.transform(copy.deepcopy(TEST_DOCUMENTS))
+    dirname = tempfile.mkdtemp()
+    try:
+        manifest = write_feature_bits(dirname, [X], model.vectorizer.feature_names)
+        print "%d rows of %d features in %d bytes each" % (manifest['n_rows'], manifest['n_features'], manifest['row_bytes'])
+        stored = FeatureBits(dirname)
+        stored.check_feature_names(model.vectorizer.feature_names)
+        print "Rows identical: %s" % ((stored.matrix() != X).nnz == 0)
+        print "From bits:", stored.predict_proba(model.clf)[:, 1]
+        print "From rows:", model.clf.predict_proba(X)[:, 1]
+    finally:
+        shutil.rmtree(dirname)
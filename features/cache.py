@@ -0,0 +1,153 @@
+import sqlite3
+import cPickle
+from collections import OrderedDict
+
+"""
+Small caches shared by the tokenizer and scorer:
+    LRUCache- bounded in-memory cache with hit/miss counters
+    SqliteCache- persistent on-disk key/value store, which
+        several processes (or runs) can share
+"""
+
+
+class LRUCache(object):
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # Re-insert as most recently used
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self._data:
+            del self._data[key]
+        elif len(self._data) >= self.maxsize:
+            self._data.popitem(last=False)
+        self._data[key] = value
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+
+class SqliteCache(object):
+
+    """
+    Persistent cache of picklable values in an sqlite file,
+    which several processes can share.
+
+    Puts are buffered in memory and written in one short
+    transaction every `commit_every` puts, on commit() and
+    on close, so no write lock is held between calls. The
+    file is put in WAL mode, so readers never wait for a
+    writer. If the database stays locked past `timeout`
+    seconds, a get is a miss and buffered puts are dropped
+    (counted in stats()['errors']): a cache failure never
+    fails the caller.
+    """
+
+    def __init__(self, filename, table="cache", commit_every=1000, timeout=5.0):
+        self.filename = filename
+        self.table = table
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._buffer = {}
+        # May be used from a thread other than the creating
+        # one (e.g. server.py's batching thread), but never
+        # from two threads at once
+        self._conn = sqlite3.connect(filename, timeout=timeout, check_same_thread=False)
+        self._conn.text_factory = str
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.OperationalError:
+            # Locked by another process: keep the current mode
+            pass
+        try:
+            with self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value BLOB)" % table)
+        except sqlite3.OperationalError:
+            # Every get is then a miss, and every commit drops
+            self.errors += 1
+
+    def get(self, key, default=None):
+        if key in self._buffer:
+            self.hits += 1
+            return self._buffer[key]
+        try:
+            row = self._conn.execute("SELECT value FROM %s WHERE key = ?" % self.table, (key,)).fetchone()
+        except sqlite3.OperationalError:
+            self.errors += 1
+            row = None
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return cPickle.loads(str(row[0]))
+
+    def put(self, key, value):
+        self._buffer[key] = value
+        if len(self._buffer) >= self.commit_every:
+            self.commit()
+
+    def __len__(self):
+        self.commit()
+        return self._conn.execute("SELECT COUNT(*) FROM %s" % self.table).fetchone()[0]
+
+    def commit(self):
+        """
+        Write buffered puts. They are dropped if the
+        database is locked: this is only a cache.
+        """
+        if not self._buffer:
+            return
+        rows = [(key, sqlite3.Binary(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)))
+                for key, value in self._buffer.iteritems()]
+        self._buffer = {}
+        try:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)" % self.table, rows)
+        except sqlite3.OperationalError:
+            self.errors += 1
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'errors': self.errors,
+            'buffered': len(self._buffer),
+        }
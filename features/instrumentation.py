@@ -0,0 +1,142 @@
+import time
+from functools import wraps
+from collections import defaultdict
+
+"""
+Opt-in hot-path instrumentation.
+
+Records, while enabled--
+    - cumulative time and call count per stage
+      (tokenization, strategy detection, vectorization,
+      prediction, ...)
+    - per-strategy evaluation counts, hit counts and time
+    - exceptions swallowed while evaluating strategies
+      (previously only printed when VERBOSE_ERRORS is set)
+
+Usage--
+    from politeness.features import instrumentation
+    instrumentation.enable()
+    ... score documents ...
+    instrumentation.snapshot()          # dict
+    instrumentation.prometheus_text()   # text exposition format
+
+When disabled (the default), instrumented code only
+checks the module-level ENABLED flag.
+"""
+
+ENABLED = False
+
+_clock = time.time
+
+_stage_seconds = defaultdict(float)
+_stage_calls = defaultdict(int)
+_strategy_evaluations = defaultdict(int)
+_strategy_hits = defaultdict(int)
+_strategy_seconds = defaultdict(float)
+_exceptions = defaultdict(int)
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    for counter in (_stage_seconds, _stage_calls, _strategy_evaluations,
+                    _strategy_hits, _strategy_seconds, _exceptions):
+        counter.clear()
+
+
+def record_stage(stage, seconds):
+    _stage_seconds[stage] += seconds
+    _stage_calls[stage] += 1
+
+
+def record_strategy(strategy, evaluations, hit, seconds=0.0):
+    _strategy_evaluations[strategy] += evaluations
+    if hit:
+        _strategy_hits[strategy] += 1
+    _strategy_seconds[strategy] += seconds
+
+
+def record_exception(strategy):
+    _exceptions[strategy] += 1
+
+
+def timed(stage):
+    """
+    Decorator: time each call under `stage` while enabled
+    """
+    def decorate(fnc):
+        @wraps(fnc)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fnc(*args, **kwargs)
+            start = _clock()
+            try:
+                return fnc(*args, **kwargs)
+            finally:
+                record_stage(stage, _clock() - start)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """
+    returns dict of all counters
+    """
+    from politeness_strategies import ingestion_counts
+    stages = dict((s, {'calls': _stage_calls[s], 'seconds': _stage_seconds[s]}) for s in _stage_calls)
+    strategies = dict((s, {
+        'evaluations': _strategy_evaluations[s],
+        'hits': _strategy_hits.get(s, 0),
+        'seconds': _strategy_seconds.get(s, 0.0),
+    }) for s in _strategy_evaluations)
+    return {
+        'enabled': ENABLED,
+        'stages': stages,
+        'strategies': strategies,
+        'swallowed_exceptions': dict(_exceptions),
+        'parse_elements': dict(ingestion_counts),
+    }
+
+
+def _escape(label):
+    return label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(prefix="politeness"):
+    """
+    returns snapshot() in the Prometheus text exposition format
+    """
+    snap = snapshot()
+    lines = []
+
+    def metric(name, help_text, label, values):
+        name = "%s_%s" % (prefix, name)
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s counter" % name)
+        for key in sorted(values):
+            lines.append('%s{%s="%s"} %r' % (name, label, _escape(key), values[key]))
+
+    stages, strategies = snap['stages'], snap['strategies']
+    metric("stage_seconds_total", "Cumulative time per stage.", "stage",
+           dict((s, v['seconds']) for s, v in stages.iteritems()))
+    metric("stage_calls_total", "Calls per stage.", "stage",
+           dict((s, v['calls']) for s, v in stages.iteritems()))
+    metric("strategy_evaluations_total", "Strategy evaluations.", "strategy",
+           dict((s, v['evaluations']) for s, v in strategies.iteritems()))
+    metric("strategy_hits_total", "Documents or sentences where a strategy was found.", "strategy",
+           dict((s, v['hits']) for s, v in strategies.iteritems()))
+    metric("strategy_seconds_total", "Cumulative time evaluating a strategy.", "strategy",
+           dict((s, v['seconds']) for s, v in strategies.iteritems()))
+    metric("swallowed_exceptions_total", "Exceptions swallowed while evaluating a strategy.", "strategy",
+           snap['swallowed_exceptions'])
+    metric("parse_elements_total", "Ingested parse elements.", "status",
+           snap['parse_elements'])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,170 @@
+import re
+from collections import deque
+
+"""
+Precompiled multi-pattern matching for the text and
+term politeness strategies.
+
+Text strategies (SUBJUNCTIVE, INDICATIVE) declare the
+phrases they look for as `fnc.phrases`; term strategies
+(HASHEDGE, HASPOSITIVE, HASNEGATIVE) declare their word
+list as `fnc.lexicon`. The LexiconMatcher compiles--
+    all phrases into one regex, scanned once over a
+        document's lowercased sentences. Matches are
+        substrings, as with the `in` checks it replaces.
+    all lexicon entries into one Aho-Corasick automaton
+        over tokens, run once over the document's terms.
+By default each lexicon entry is matched as one whole
+token, as the set intersections it replaces did, so
+multi-word hedges ("in my opinion") never match. With
+multiword=True, entries are split into token sequences.
+
+Strategies without phrases/lexicon are still supported:
+the matcher falls back to calling the strategy function.
+"""
+
+
+class TokenAutomaton(object):
+
+    """
+    Aho-Corasick automaton whose symbols are tokens.
+    labels(tokens) returns the labels of all patterns
+    occurring in tokens as contiguous subsequences.
+    """
+
+    def __init__(self, patterns):
+        """
+        :param patterns- iterable of (tuple of tokens, label)
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        self.max_length = 0
+        for tokens, label in patterns:
+            state = 0
+            for t in tokens:
+                if t not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][t] = len(self.goto) - 1
+                state = self.goto[state][t]
+            self.output[state].add(label)
+            self.max_length = max(self.max_length, len(tokens))
+        # Breadth-first failure links
+        queue = deque(self.goto[0].itervalues())
+        while queue:
+            r = queue.popleft()
+            for t, s in self.goto[r].iteritems():
+                queue.append(s)
+                f = self.fail[r]
+                while f and t not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[s] = self.goto[f].get(t, 0)
+                self.output[s] |= self.output[self.fail[s]]
+        # Single-token patterns: token --> labels
+        self._single = dict((t, frozenset(self.output[s])) for t, s in self.goto[0].iteritems() if self.output[s])
+
+    def labels(self, tokens):
+        if self.max_length <= 1:
+            # No state to carry: a dict lookup per token
+            return set().union(*filter(None, map(self._single.get, tokens)))
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for t in tokens:
+            while state and t not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(t, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class PhraseMatcher(object):
+
+    """
+    Substring matching of many phrases in one regex scan.
+    labels(text) returns the labels of all phrases in text.
+    """
+
+    def __init__(self, phrases):
+        """
+        :param phrases- iterable of (phrase, label)
+        """
+        phrase2labels = {}
+        for phrase, label in phrases:
+            phrase2labels.setdefault(phrase, set()).add(label)
+        # The alternation reports one phrase per start position,
+        # the longest; it implies all phrases that are its prefixes
+        self._labels = dict((p, frozenset().union(*[l for q, l in phrase2labels.iteritems() if p.startswith(q)]))
+                            for p in phrase2labels)
+        alternatives = "|".join(re.escape(p) for p in sorted(phrase2labels, key=len, reverse=True))
+        # Lookahead, so overlapping occurrences are all found
+        self._re = re.compile("(?=(%s))" % alternatives) if phrase2labels else None
+
+    def labels(self, text):
+        if self._re is None:
+            return set()
+        return set().union(*[self._labels[m.group(1)] for m in self._re.finditer(text)])
+
+
+class LexiconMatcher(object):
+
+    """
+    Detects text and term strategies in a single
+    pass over sentences and a single pass over terms
+    """
+
+    def __init__(self, text_strategies, term_strategies, multiword=False, check_elems=None):
+        """
+        :param text_strategies- functions of a lowercased sentence
+        :param term_strategies- functions of a lowercased term list
+        :param multiword- match multi-word lexicon entries
+            as token sequences
+        :param check_elems- fallback for strategies without
+            phrases/lexicon: check_elems(elems, fnc) --> bool
+        """
+        self.text_strategies = list(text_strategies)
+        self.term_strategies = list(term_strategies)
+        self.multiword = multiword
+        self.check_elems = check_elems or _check_elems
+        self._phrases = PhraseMatcher((p, i) for i, fnc in enumerate(self.text_strategies)
+                                      for p in getattr(fnc, 'phrases', ()))
+        self._text_fallback = [i for i, fnc in enumerate(self.text_strategies)
+                               if getattr(fnc, 'phrases', None) is None]
+        split = (lambda w: tuple(w.split())) if multiword else (lambda w: (w,))
+        self._automaton = TokenAutomaton((split(w), i) for i, fnc in enumerate(self.term_strategies)
+                                         for w in getattr(fnc, 'lexicon', ()))
+        self._term_fallback = [i for i, fnc in enumerate(self.term_strategies)
+                               if getattr(fnc, 'lexicon', None) is None]
+
+    def detect(self, sentences, terms):
+        """
+        :param sentences- list of lowercased sentences
+        :param terms- list of lowercased terms
+        returns (list of 0/1 per text strategy,
+                 list of 0/1 per term strategy)
+        """
+        # "\n" can't be part of a phrase match,
+        # so phrases never span sentences
+        text_found = self._phrases.labels("\n".join(sentences))
+        for i in self._text_fallback:
+            if self.check_elems(sentences, self.text_strategies[i]):
+                text_found.add(i)
+        term_found = self._automaton.labels(terms)
+        for i in self._term_fallback:
+            if self.check_elems([terms], self.term_strategies[i]):
+                term_found.add(i)
+        return ([int(i in text_found) for i in xrange(len(self.text_strategies))],
+                [int(i in term_found) for i in xrange(len(self.term_strategies))])
+
+
+def _check_elems(elems, fnc):
+    for elem in elems:
+        try:
+            if fnc(elem):
+                return True
+        except Exception:
+            pass
+    return False
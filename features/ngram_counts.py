@@ -0,0 +1,235 @@
+import os
+import json
+import heapq
+import shutil
+import cPickle
+import tempfile
+import multiprocessing
+from itertools import islice, groupby
+from collections import Counter, deque
+
+import numpy as np
+
+"""
+Out-of-core, parallel unigram/bigram counting, used by
+PolitenessFeatureVectorizer.generate_bow_features.
+
+Documents (a list, an iterator, or a JSONL filename) are
+counted in chunks by worker processes. The parent merges
+chunk counts in memory and, when they grow past max_items,
+spills them to disk as sorted runs. A final k-way merge of
+the runs keeps only ngrams above the count threshold, so
+memory stays bounded regardless of corpus size.
+
+approximate=True instead streams chunk counts through a
+count-min sketch and keeps heavy hitters: ngrams whose
+estimated count passes the threshold. Estimates never
+undercount, so no qualifying ngram is missed, but rare
+ngrams that collide with frequent ones may be included.
+"""
+
+
+def iter_documents(source):
+    """
+    source- list/iterator of document dicts,
+        or the filename of a JSONL file of them
+    """
+    if isinstance(source, basestring):
+        with open(source) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        for d in source:
+            yield d
+
+
+def _count_chunk(documents):
+    # Imported here so workers share the parent's module
+    from vectorizer import get_unigrams_and_bigrams
+    unigram_counts, bigram_counts = Counter(), Counter()
+    for d in documents:
+        unigrams, bigrams = get_unigrams_and_bigrams(d)
+        unigram_counts.update(unigrams)
+        bigram_counts.update(bigrams)
+    return unigram_counts, bigram_counts
+
+
+def imap_chunks(fnc, documents, processes=1, chunksize=1000):
+    """
+    Generator of fnc(chunk), for consecutive chunks of
+    `chunksize` documents, in input order. With processes > 1,
+    chunks go to a worker pool, with at most two chunks per
+    worker in flight, so documents can be a long iterator.
+    fnc must be a module-level function.
+    """
+    documents = iter_documents(documents)
+    chunks = iter(lambda: list(islice(documents, chunksize)), [])
+    if processes <= 1:
+        for chunk in chunks:
+            yield fnc(chunk)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(fnc, (chunk,)))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def iter_chunk_counts(documents, processes=1, chunksize=1000):
+    """
+    Generator of (unigram Counter, bigram Counter), one per
+    chunk of documents
+    """
+    return imap_chunks(_count_chunk, documents, processes, chunksize)
+
+
+####
+# Exact counting with disk spills
+
+class SpillingCounter(object):
+
+    """
+    Counter that spills sorted runs of (ngram, count)
+    to disk once it holds more than max_items ngrams
+    """
+
+    def __init__(self, spill_dir, max_items=1000000):
+        self.spill_dir = spill_dir
+        self.max_items = max_items
+        self.counts = Counter()
+        self.runs = []
+
+    def update(self, counts):
+        self.counts.update(counts)
+        if len(self.counts) > self.max_items:
+            self.spill()
+
+    def spill(self):
+        fd, filename = tempfile.mkstemp(suffix=".run", dir=self.spill_dir)
+        with os.fdopen(fd, 'wb') as f:
+            pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+            for item in sorted(self.counts.iteritems()):
+                pickler.dump(item)
+                # Don't memoize: records are streamed
+                pickler.clear_memo()
+        self.runs.append(filename)
+        self.counts = Counter()
+
+    def frequent(self, min_count, with_counts=False):
+        """
+        Generator of ngrams with count > min_count,
+        in sorted order, merged across all runs
+        (of (ngram, count) pairs, if with_counts)
+        """
+        streams = [_read_run(r) for r in self.runs]
+        streams.append(iter(sorted(self.counts.iteritems())))
+        merged = heapq.merge(*streams)
+        for ngram, items in groupby(merged, key=lambda item: item[0]):
+            count = sum(count for _, count in items)
+            if count > min_count:
+                yield (ngram, count) if with_counts else ngram
+
+
+def _read_run(filename):
+    with open(filename, 'rb') as f:
+        unpickler = cPickle.Unpickler(f)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+
+def count_frequent_ngrams(documents, min_unigram_count=20, min_bigram_count=20,
+                          processes=1, chunksize=1000, max_items=1000000, spill_dir=None,
+                          with_counts=False):
+    """
+    Exact counts. returns sorted lists
+    (unigrams with count > min_unigram_count, bigrams with count > min_bigram_count),
+    of (ngram, count) pairs if with_counts
+    """
+    tmpdir = tempfile.mkdtemp(prefix="ngram-counts-", dir=spill_dir)
+    try:
+        unigram_counts = SpillingCounter(tmpdir, max_items)
+        bigram_counts = SpillingCounter(tmpdir, max_items)
+        for unigrams, bigrams in iter_chunk_counts(documents, processes, chunksize):
+            unigram_counts.update(unigrams)
+            bigram_counts.update(bigrams)
+        return (list(unigram_counts.frequent(min_unigram_count, with_counts)),
+                list(bigram_counts.frequent(min_bigram_count, with_counts)))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+####
+# Approximate counting
+
+class CountMinSketch(object):
+
+    """
+    Count-min sketch over hashable keys, with a heavy-hitter
+    set of keys whose estimated count exceeds a threshold
+    """
+
+    # Mersenne prime for the (a * h + b) mod p row hashes
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold, width=1 << 20, depth=4, seed=0):
+        rng = np.random.RandomState(seed)
+        self.threshold = threshold
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.a = rng.randint(1, 1 << 30, size=depth).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 30, size=depth).astype(np.uint64)
+        self.heavy_hitters = {}
+
+    def _columns(self, keys):
+        # Fold python hashes into 31 bits so the row
+        # hashes can't overflow uint64
+        h = np.array([hash(k) & 0x7fffffff for k in keys], dtype=np.uint64)
+        return (np.outer(self.a, h) + self.b[:, None]) % np.uint64(self.PRIME) % np.uint64(self.width)
+
+    def update(self, counts):
+        """
+        counts- Counter of key --> count
+        """
+        if not counts:
+            return
+        keys = counts.keys()
+        columns = self._columns(keys).astype(np.intp)
+        values = np.array([counts[k] for k in keys], dtype=np.int64)
+        for row in xrange(self.table.shape[0]):
+            np.add.at(self.table[row], columns[row], values)
+        estimates = self.table[np.arange(self.table.shape[0])[:, None], columns].min(axis=0)
+        for k, estimate in zip(keys, estimates):
+            if estimate > self.threshold:
+                self.heavy_hitters[k] = estimate
+
+    def estimate(self, keys):
+        columns = self._columns(keys).astype(np.intp)
+        return self.table[np.arange(self.table.shape[0])[:, None], columns].min(axis=0)
+
+
+def approximate_frequent_ngrams(documents, min_unigram_count=20, min_bigram_count=20,
+                                processes=1, chunksize=1000, width=1 << 20, depth=4):
+    """
+    Count-min sketch counts. returns sorted lists of ngrams whose
+    estimated count passes the thresholds (a superset of the exact result)
+    """
+    unigram_sketch = CountMinSketch(min_unigram_count, width, depth, seed=0)
+    bigram_sketch = CountMinSketch(min_bigram_count, width, depth, seed=1)
+    for unigrams, bigrams in iter_chunk_counts(documents, processes, chunksize):
+        unigram_sketch.update(unigrams)
+        bigram_sketch.update(bigrams)
+    return sorted(unigram_sketch.heavy_hitters), sorted(bigram_sketch.heavy_hitters)
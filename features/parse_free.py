@@ -0,0 +1,111 @@
+import re
+
+import tokenizer
+from politeness_strategies import polar_set
+
+"""
+Parse-free documents: approximate dependency parses
+built from tokens and token positions only, so raw text
+can be scored without running a dependency parser.
+
+Most dependency strategies only look at which words occur
+at which token positions ("Please start", "2nd person start",
+"Gratitude", "Direct question", ...). Every word token becomes
+a "dep(word-i, word-i)" element, so those strategies see the
+same words at the same positions as in a real parse (positions
+count punctuation tokens, as in CoreNLP).
+
+Strategies that need a dependency relation get it from
+surface patterns--
+    nsubj(verb, pronoun)    pronoun followed by a word, optionally
+                            past one adverb ("I think", "I really
+                            appreciate", "I apologize")
+    dobj(excuse/forgive, me)    "excuse me", "forgive me"
+    det(noun, the)          "the point", "the truth", ...
+    prep_in(_, fact)        "in fact"
+    prep_by(_, way-3)       sentence-initial "by the way"
+    aux(verb, polar)        polar word followed by a pronoun
+                            ("can you", "would I", "do we")
+These are approximations; see scripts/evaluate_parse_free.py
+for their agreement with real parses.
+
+Usage--
+    from politeness.features.parse_free import text_to_document
+    model.score(text_to_document("Could you please take a look? Thanks!"))
+"""
+
+# Default tokenizer for pseudo parses: the regex port
+# needs no nltk punkt data and is much faster
+regex_tokenize = tokenizer.CachedTokenizer('regex')
+
+SUBJECT_PRONOUNS = frozenset(["i", "we", "you", "they", "he", "she", "it"])
+ADVERBS = frozenset(["really", "just", "also", "still", "actually", "honestly", "truly", "sincerely", "do"])
+DETERMINED_NOUNS = frozenset(["point", "reality", "truth"])
+
+_word_re = re.compile(r"\w")
+_sentence_end_re = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text):
+    """
+    Split after sentence-final punctuation followed by
+    whitespace. Rougher than punkt, but needs no model.
+    """
+    return [s for s in _sentence_end_re.split(text.strip()) if s]
+
+
+def _element(tag, left, leftpos, right, rightpos):
+    return "%s(%s-%d, %s-%d)" % (tag, left, leftpos, right, rightpos)
+
+
+def pseudo_parse(tokens):
+    """
+    :param tokens- one tokenized sentence
+    returns list of dependency strings approximating its parse
+    """
+    # (word, 1-based position) for word tokens; punctuation
+    # counts towards positions but isn't a parse node
+    words = [(t, i) for i, t in enumerate(tokens, 1) if _word_re.search(t)]
+    elements = [_element("dep", t, i, t, i) for t, i in words]
+    lower = [t.lower() for t, i in words]
+    for k in xrange(len(words) - 1):
+        (t, i), w, w1 = words[k], lower[k], lower[k + 1]
+        # Index of the word after next, if any
+        k2 = k + 2 if k + 2 < len(words) else None
+        if w in SUBJECT_PRONOUNS:
+            verb = k + 1
+            if (w1 in ADVERBS or w1.endswith("ly")) and k2 is not None:
+                verb = k2
+            if lower[verb] not in ADVERBS:
+                elements.append(_element("nsubj", words[verb][0], words[verb][1], t, i))
+        elif w in ("excuse", "forgive") and w1 == "me":
+            elements.append(_element("dobj", t, i, words[k + 1][0], words[k + 1][1]))
+        elif w == "the" and w1 in DETERMINED_NOUNS:
+            elements.append(_element("det", words[k + 1][0], words[k + 1][1], t, i))
+        elif w == "in" and w1 == "fact":
+            elements.append(_element("prep_in", "ROOT", 0, words[k + 1][0], words[k + 1][1]))
+        elif w == "by" and i == 1 and w1 == "the" and k2 is not None and lower[k2] == "way" and words[k2][1] == 3:
+            elements.append(_element("prep_by", "ROOT", 0, words[k2][0], 3))
+        if w in polar_set and w1 in SUBJECT_PRONOUNS and k2 is not None:
+            elements.append(_element("aux", words[k2][0], words[k2][1], t, i))
+    return elements
+
+
+def text_to_document(text, tokenize=None):
+    """
+    returns document dict ('text', 'sentences', 'parses')
+    for raw text, with pseudo parses
+    """
+    document = {'text': text, 'sentences': split_sentences(text)}
+    return add_pseudo_parses(document, tokenize)
+
+
+def add_pseudo_parses(document, tokenize=None):
+    """
+    Set document['parses'] from document['sentences']
+    with pseudo_parse, replacing any real parses.
+    Tokenizes with regex_tokenize unless tokenize is given.
+    """
+    tokenize = tokenize or regex_tokenize
+    document['parses'] = [pseudo_parse(tokenize(s)) for s in document['sentences']]
+    return document
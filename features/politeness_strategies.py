@@ -1,9 +1,16 @@
 
 import os
 import re
+import time
+import threading
 from itertools import chain
 from collections import defaultdict
 
+from strategy_engine import StrategyEngine, WordRule, ElementRule, LEFT, RIGHT
+from lexicon_matcher import LexiconMatcher
+from cache import LRUCache
+import instrumentation
+
 #####
 # Word lists
 
@@ -24,29 +31,195 @@ hedges = [
     "in my opinion", "to my knowledge", "fairly", "quite", "rather", "argue", "argues", "argued",
     "claims", "feels", "indicates", "supposed", "supposes", "suspects", "postulates"
 ]
+hedge_set = frozenset(hedges)
 
 # Positive and negative words from Liu
 local_dir = os.path.split(__file__)[0]
 pos_filename = os.path.join(local_dir, "liu-positive-words.txt")
 neg_filename = os.path.join(local_dir, "liu-negative-words.txt")
 
-positive_words = set(map(lambda x: x.strip(), open(pos_filename).read().splitlines()))
-negative_words = set(map(lambda x: x.strip(), open(neg_filename).read().splitlines()))
+class LazyWordSet(object):
+
+    """
+    Set of words read from a file (one per line)
+    on first use, not at import time
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._words = None
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = set(map(lambda x: x.strip(), open(self.filename).read().splitlines()))
+        return self._words
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def intersection(self, other):
+        return self.words.intersection(other)
+
+positive_words = LazyWordSet(pos_filename)
+negative_words = LazyWordSet(neg_filename)
 
 
 ####
-# Parse element accessors.
-# Given parse element string like "nsubj(dont-5, I-4)" 
-# transform or return specific constituents
+# Parse elements.
+# Each parse element string like "nsubj(dont-5, I-4)"
+# is parsed once, at ingestion, into a ParseElement
+# record. Strategies read the record fields.
 
 parse_element_split_re = re.compile(r"([-\w!?]+)-(\d+)")
-getleft = lambda p: parse_element_split_re.findall(p)[0][0].lower()
-getleftpos = lambda p: int(parse_element_split_re.findall(p)[0][1])
-getright = lambda p: parse_element_split_re.findall(p)[1][0].lower()
-getrightpos = lambda p: int(parse_element_split_re.findall(p)[1][1])
 remove_numbers = lambda p: re.sub(r"\-(\d+)" , "", p)
 getdeptag = lambda p: p.split("(")[0]
 
+
+# rightpos of an element with a single word-index
+# constituent, e.g. "punct(Thanks-1, ,-2)"
+NO_POSITION = -1
+
+
+class ParseElement(object):
+
+    """
+    One dependency, e.g. "nsubj(dont-5, I-4)" -->
+        tag="nsubj", left="dont", leftpos=5, right="i", rightpos=4,
+        nonum="nsubj(dont, I)", lnonum="nsubj(dont, i)"
+    Words are lowercased. nonum/lnonum are the element
+    with positions removed, in original and lower case.
+
+    An element with only one word-index constituent (the
+    dependent is punctuation or unnumbered) has right=""
+    and rightpos=NO_POSITION, and complete=False. The
+    original string accessors raised on its right side, so
+    strategies that read the right word or position, or
+    the whole element, never fire on it; those that read
+    the left word first still do.
+    """
+
+    __slots__ = ("tag", "left", "leftpos", "right", "rightpos", "nonum", "lnonum", "complete")
+
+    def __init__(self, tag, left, leftpos, right, rightpos, nonum):
+        self.tag = tag
+        self.left = left
+        self.leftpos = leftpos
+        self.right = right
+        self.rightpos = rightpos
+        self.nonum = nonum
+        self.lnonum = nonum.lower()
+        self.complete = rightpos != NO_POSITION
+
+    def __repr__(self):
+        if not self.complete:
+            return "ParseElement(%s(%s-%d))" % (self.tag, self.left, self.leftpos)
+        return "ParseElement(%s(%s-%d, %s-%d))" % (self.tag, self.left, self.leftpos, self.right, self.rightpos)
+
+
+def parse_element(p):
+    """
+    Parse a dependency string into a ParseElement.
+    Returns None if the string is malformed (no
+    word-index constituent at all). With a single
+    constituent, the element is incomplete (see
+    ParseElement).
+    """
+    constituents = parse_element_split_re.findall(p)
+    if not constituents:
+        return None
+    left, leftpos = constituents[0]
+    if len(constituents) < 2:
+        return ParseElement(getdeptag(p), left.lower(), int(leftpos), "", NO_POSITION, remove_numbers(p))
+    right, rightpos = constituents[1]
+    return ParseElement(getdeptag(p), left.lower(), int(leftpos), right.lower(), int(rightpos), remove_numbers(p))
+
+
+# Running totals of ingested and rejected (malformed) elements
+ingestion_counts = defaultdict(int)
+
+@instrumentation.timed("parse_ingestion")
+def ingest_parses(parses):
+    """
+    :param parses- list of per-sentence lists of dependency strings
+    returns list of per-sentence lists of ParseElements.
+    Malformed elements are dropped and counted.
+    """
+    ingested = []
+    for parse in parses:
+        elements = []
+        for p in parse:
+            elem = parse_element(p)
+            if elem is None:
+                ingestion_counts['malformed'] += 1
+                if VERBOSE_ERRORS:
+                    print "Malformed parse element:", p
+            else:
+                elements.append(elem)
+        ingestion_counts['elements'] += len(parse)
+        ingested.append(elements)
+    return ingested
+
+
+# Recently ingested parses, so the request check and the
+# strategy features of one document ingest its parses once.
+# Keyed by the identity of the 'parses' list and the length
+# of each of its parses, so a document whose parses grow
+# (or are replaced) is re-ingested. Entries keep a reference
+# to their list, so its id can't be reused while cached.
+parse_elements_cache = LRUCache(4096)
+_parse_elements_lock = threading.Lock()
+
+def get_parse_elements(document):
+    """
+    Ingested parses for a document, from
+    parse_elements_cache. Nothing is stored on the
+    document itself. A hit needs the same 'parses' list
+    object (kept alive by the caller) with the same
+    parse lengths; editing an element in place is not
+    detected.
+    """
+    parses = document['parses']
+    key = (id(parses), tuple(map(len, parses)))
+    with _parse_elements_lock:
+        cached = parse_elements_cache.get(key)
+    if cached is not None and cached[0] is parses:
+        return cached[1]
+    return remember_parse_elements(parses, ingest_parses(parses))
+
+def remember_parse_elements(parses, elements):
+    """
+    Cache elements as the ingested form of parses
+    (for documents built from pre-ingested parses)
+    """
+    with _parse_elements_lock:
+        parse_elements_cache.put((id(parses), tuple(map(len, parses))), (parses, elements))
+    return elements
+
+
+# Accessors, for strategies written against
+# the old parse-string interface. As there, reading
+# the missing right side of an element raises.
+getleft = lambda p: p.left
+getleftpos = lambda p: p.leftpos
+
+def getright(p):
+    if not p.complete:
+        raise IndexError("parse element has no right constituent")
+    return p.right
+
+def getrightpos(p):
+    if not p.complete:
+        raise IndexError("parse element has no right constituent")
+    return p.rightpos
+
+
 ####
 ## Strategy Functions
 ## Defined as named lambda functions that return booleans
@@ -58,54 +231,83 @@ getdeptag = lambda p: p.split("(")[0]
 
 ####
 # Dependency-based politeness strategies
-
-please = lambda p: len(set([getleft(p), getright(p)]).intersection(["please"])) > 0 and 1 not in [getleftpos(p), getrightpos(p)]
+# (input is a ParseElement)
+# Each strategy also declares its lookups as `rules`,
+# which StrategyEngine compiles into hash tables.
+
+deference_words = ("great","good","nice","good","interesting","cool","excellent","awesome")
+apology_words = ("sorry","woops","oops")
+group_words = ("we", "our", "us", "ourselves")
+first_person_words = ("i", "my", "mine", "myself")
+second_person_words = ("you","your","yours","yourself")
+greeting_words = ("hi","hello","hey")
+factuality_words = ("really", "actually", "honestly", "surely")
+question_words = ("what","why","who","how")
+conjunction_words = ("so","then","and","but","or")
+
+please = lambda p: p.complete and (p.left == "please" or p.right == "please") and 1 not in (p.leftpos, p.rightpos)
 please.__name__ = "Please"
+please.rules = [WordRule(["please"], not_initial=True)]
 
-pleasestart = lambda p: (getleftpos(p) == 1 and getleft(p) == "please") or (getrightpos(p) == 1 and getright(p) == "please")
+pleasestart = lambda p: (p.leftpos == 1 and p.left == "please") or (p.rightpos == 1 and p.right == "please")
 pleasestart.__name__ = "Please start"
+pleasestart.rules = [WordRule(["please"], positions=[1])]
 
-hashedges = lambda p:   getdeptag(p) == "nsubj" and  getleft(p) in hedges
+hashedges = lambda p: p.tag == "nsubj" and p.left in hedge_set
 hashedges.__name__ = "Hedges"
+hashedges.rules = [WordRule(hedges, side=LEFT, tag="nsubj")]
 
-deference = lambda p: (getleftpos(p) == 1 and getleft(p) in ["great","good","nice","good","interesting","cool","excellent","awesome"]) or (getrightpos(p) == 1 and getright(p) in ["great","good","nice","good","interesting","cool","excellent","awesome"]) 
+deference = lambda p: (p.leftpos == 1 and p.left in deference_words) or (p.rightpos == 1 and p.right in deference_words)
 deference.__name__ = "Deference"
+deference.rules = [WordRule(deference_words, positions=[1])]
 
-gratitude = lambda p: getleft(p).startswith("thank") or getright(p).startswith("thank") or "(appreciate, i)" in remove_numbers(p).lower()
+gratitude = lambda p: p.left.startswith("thank") or (p.complete and (p.right.startswith("thank") or "(appreciate, i)" in p.lnonum))
 gratitude.__name__ = "Gratitude"
+gratitude.rules = [WordRule(["thank"], prefix=True), ElementRule(["(appreciate, i)"], contains=True)]
 
-apologize = lambda p: getleft(p) in ("sorry","woops","oops") or getright(p) in ("sorry","woops","oops") or remove_numbers(p).lower() in ("dobj(excuse, me)", "nsubj(apologize, i)", "dobj(forgive, me)")
+apologize = lambda p: p.left in apology_words or (p.complete and (p.right in apology_words or p.lnonum in ("dobj(excuse, me)", "nsubj(apologize, i)", "dobj(forgive, me)")))
 apologize.__name__ = "Apologizing"
+apologize.rules = [WordRule(apology_words), ElementRule(["dobj(excuse, me)", "nsubj(apologize, i)", "dobj(forgive, me)"])]
 
-groupidentity = lambda p: len(set([getleft(p), getright(p)]).intersection(["we", "our", "us", "ourselves"])) > 0
+groupidentity = lambda p: p.complete and (p.left in group_words or p.right in group_words)
 groupidentity.__name__ = "1st person pl."
+groupidentity.rules = [WordRule(group_words, complete=True)]
 
-firstperson = lambda p: 1 not in [getleftpos(p), getrightpos(p)] and len(set([getleft(p), getright(p)]).intersection(["i", "my", "mine", "myself"])) > 0
+firstperson = lambda p: p.complete and 1 not in (p.leftpos, p.rightpos) and (p.left in first_person_words or p.right in first_person_words)
 firstperson.__name__ = "1st person"
+firstperson.rules = [WordRule(first_person_words, not_initial=True)]
 
-secondperson_start = lambda p: (getleftpos(p) == 1 and getleft(p) in ("you","your","yours","yourself")) or (getrightpos(p) == 1 and getright(p) in ("you","your","yours","yourself")) 
+secondperson_start = lambda p: (p.leftpos == 1 and p.left in second_person_words) or (p.rightpos == 1 and p.right in second_person_words)
 secondperson_start.__name__ = "2nd person start"
+secondperson_start.rules = [WordRule(second_person_words, positions=[1])]
 
-firstperson_start = lambda p: (getleftpos(p) == 1 and getleft(p) in ("i","my","mine","myself")) or (getrightpos(p) == 1 and getright(p) in ("i","my","mine","myself")) 
+firstperson_start = lambda p: (p.leftpos == 1 and p.left in first_person_words) or (p.rightpos == 1 and p.right in first_person_words)
 firstperson_start.__name__ = "1st person start"
+firstperson_start.rules = [WordRule(first_person_words, positions=[1])]
 
-hello = lambda p: (getleftpos(p) == 1 and getleft(p) in ("hi","hello","hey")) or (getrightpos(p) == 1 and getright(p) in ("hi","hello","hey")) 
+hello = lambda p: (p.leftpos == 1 and p.left in greeting_words) or (p.rightpos == 1 and p.right in greeting_words)
 hello.__name__ = "Indirect (greeting)"
+hello.rules = [WordRule(greeting_words, positions=[1])]
 
-really = lambda p: (getright(p) == "fact" and getdeptag(p) == "prep_in") or remove_numbers(p) in ("det(point, the)","det(reality, the)","det(truth, the)") or len(set([getleft(p), getright(p)]).intersection(["really", "actually", "honestly", "surely"])) > 0  
+really = lambda p: p.complete and ((p.right == "fact" and p.tag == "prep_in") or p.nonum in ("det(point, the)","det(reality, the)","det(truth, the)") or p.left in factuality_words or p.right in factuality_words)
 really.__name__ = "Factuality"
+really.rules = [WordRule(["fact"], side=RIGHT, tag="prep_in"), ElementRule(["det(point, the)","det(reality, the)","det(truth, the)"], lowercase=False), WordRule(factuality_words, complete=True)]
 
-why = lambda p: (getleftpos(p) in (1,2) and getleft(p) in ("what","why","who","how")) or (getrightpos(p) in (1,2) and getright(p) in ("what","why","who","how"))
+why = lambda p: (p.leftpos in (1,2) and p.left in question_words) or (p.rightpos in (1,2) and p.right in question_words)
 why.__name__ = "Direct question"
+why.rules = [WordRule(question_words, positions=[1, 2])]
 
-conj = lambda p: (getleftpos(p) == 1 and getleft(p) in ("so","then","and","but","or")) or (getrightpos(p) == 1 and getright(p) in ("so","then","and","but","or"))
+conj = lambda p: (p.leftpos == 1 and p.left in conjunction_words) or (p.rightpos == 1 and p.right in conjunction_words)
 conj.__name__ = "Direct start"
+conj.rules = [WordRule(conjunction_words, positions=[1])]
 
-btw = lambda p: getdeptag(p) == "prep_by" and getright(p) == "way" and getrightpos(p) == 3
+btw = lambda p: p.tag == "prep_by" and p.right == "way" and p.rightpos == 3
 btw.__name__ = "Indirect (btw)"
+btw.rules = [WordRule(["way"], side=RIGHT, tag="prep_by", positions=[3])]
 
-secondperson = lambda p: 1 not in (getleftpos(p), getrightpos(p)) and len(set([getleft(p), getright(p)]).intersection(["you","your","yours","yourself"])) > 0
+secondperson = lambda p: p.complete and 1 not in (p.leftpos, p.rightpos) and (p.left in second_person_words or p.right in second_person_words)
 secondperson.__name__ = "2nd person"
+secondperson.rules = [WordRule(second_person_words, not_initial=True)]
 
 ####
 # Dependency-based request identification heuristics
@@ -117,11 +319,13 @@ polar_set = set([
     "must", "do", "does", "did", "ought", "need", 
     "dare", "if", "when", "which", "who", "whom", "how"
 ])
-initial_polar = lambda p: (getleftpos(p)==1 and getleft(p) in polar_set) or (getrightpos(p)==1 and getright(p) in polar_set)
+initial_polar = lambda p: (p.leftpos == 1 and p.left in polar_set) or (p.rightpos == 1 and p.right in polar_set)
 initial_polar.__name__ = "Initial Polar"
+initial_polar.rules = [WordRule(polar_set, positions=[1])]
 
-aux_polar = lambda p: getdeptag(p) == "aux" and getright(p) in polar_set
+aux_polar = lambda p: p.tag == "aux" and p.right in polar_set
 aux_polar.__name__ = "Aux Polar"
+aux_polar.rules = [WordRule(polar_set, side=RIGHT, tag="aux")]
 
 ####
 # String-based politeness strategies
@@ -130,21 +334,26 @@ aux_polar.__name__ = "Aux Polar"
 # Verb moods
 subjunctive = lambda s: "could you" in s or "would you" in s
 subjunctive.__name__ = "SUBJUNCTIVE"
+subjunctive.phrases = ["could you", "would you"]
 
 indicative = lambda s: "can you" in s or "will you" in s
 indicative.__name__ = "INDICATIVE"
+indicative.phrases = ["can you", "will you"]
 
 ####
 # Token list politeness strategies
 
 has_hedge = lambda l: len(set(l).intersection(hedges)) > 0
 has_hedge.__name__ = "HASHEDGE"
+has_hedge.lexicon = hedges
 
 has_positive = lambda l: len(positive_words.intersection(l)) > 0
 has_positive.__name__ = "HASPOSITIVE"
+has_positive.lexicon = positive_words
 
 has_negative = lambda l: len(negative_words.intersection(l)) > 0
 has_negative.__name__ = "HASNEGATIVE"
+has_negative.lexicon = negative_words
 
 
 ####
@@ -156,6 +365,8 @@ VERBOSE_ERRORS = False
 def check_elems_for_strategy(elems, strategy_fnc):
     # given a strategy lambda function, 
     # see if strategy present in at least one elem
+    if instrumentation.ENABLED:
+        return _check_elems_instrumented(elems, strategy_fnc)
     for elem in elems:
         try:
             testres = strategy_fnc(elem)
@@ -167,6 +378,26 @@ def check_elems_for_strategy(elems, strategy_fnc):
                 print e, elem
     return False
 
+def _check_elems_instrumented(elems, strategy_fnc):
+    # Same as check_elems_for_strategy, recording
+    # evaluations, hits, time and swallowed exceptions
+    name = strategy_fnc.__name__
+    start = time.time()
+    evaluations, testres = 0, False
+    for elem in elems:
+        evaluations += 1
+        try:
+            testres = strategy_fnc(elem)
+            if testres:
+                break
+        except Exception, e:
+            instrumentation.record_exception(name)
+            if VERBOSE_ERRORS:
+                print name
+                print e, elem
+    instrumentation.record_strategy(name, evaluations, bool(testres), time.time() - start)
+    return bool(testres)
+
 
 ####
 ## Feature extraction
@@ -196,6 +427,77 @@ POLITENESS_FEATURES = map(fnc2feature_name, chain(DEPENDENCY_STRATEGIES, TEXT_ST
 #print POLITENESS_FEATURES
 
 
+def register_strategy(fnc, name=None, rules=None):
+    """
+    Add a custom dependency-based strategy.
+
+    :param fnc- function of a ParseElement, returns bool
+    :param name- strategy name (used in the feature name)
+    :param rules- optional list of WordRule/ElementRule
+        describing fnc, so it can be compiled into the
+        strategy engine. Without rules, fnc is called
+        on every parse element.
+    """
+    if name is not None:
+        fnc.__name__ = name
+    if rules is not None:
+        fnc.rules = rules
+    DEPENDENCY_STRATEGIES.append(fnc)
+    POLITENESS_FEATURES.append(fnc2feature_name(fnc))
+
+
+# Compiled DEPENDENCY_STRATEGIES, rebuilt
+# if the strategy list changes
+_strategy_engine = None
+
+def get_strategy_engine():
+    global _strategy_engine
+    if _strategy_engine is None or _strategy_engine.strategies != DEPENDENCY_STRATEGIES:
+        _strategy_engine = StrategyEngine(DEPENDENCY_STRATEGIES, check_elems=check_elems_for_strategy)
+    return _strategy_engine
+
+
+# Fixed-behavior mode for the term strategies. By default
+# they are given no terms at all (see the vectorizer's
+# _get_ngram_sets), and the pre-trained model was fit that
+# way. With this on, the vectorizer gives them the document's
+# tokens (see strategy_terms), so HASHEDGE, HASPOSITIVE and
+# HASNEGATIVE fire, and multi-word hedges ("in my opinion",
+# "tend to") match as token sequences within a sentence.
+MATCH_MULTIWORD_HEDGES = False
+
+# Separates sentences in strategy_terms; no lexicon
+# entry contains it, so no match spans two sentences
+SENTENCE_BOUNDARY = "\n"
+
+def strategy_terms(token_lists):
+    """
+    :param token_lists- per-sentence token lists
+    returns the terms list given to the term strategies
+    with MATCH_MULTIWORD_HEDGES
+    """
+    terms = []
+    for tokens in token_lists:
+        if terms:
+            terms.append(SENTENCE_BOUNDARY)
+        terms.extend(tokens)
+    return terms
+
+# Compiled TEXT_STRATEGIES and TERM_STRATEGIES,
+# rebuilt if the strategy lists or options change
+_lexicon_matcher = None
+
+def get_lexicon_matcher():
+    global _lexicon_matcher
+    m = _lexicon_matcher
+    if (m is None or m.text_strategies != TEXT_STRATEGIES or m.term_strategies != TERM_STRATEGIES
+            or m.multiword != MATCH_MULTIWORD_HEDGES):
+        _lexicon_matcher = LexiconMatcher(TEXT_STRATEGIES, TERM_STRATEGIES, multiword=MATCH_MULTIWORD_HEDGES,
+                                          check_elems=check_elems_for_strategy)
+    return _lexicon_matcher
+
+
+@instrumentation.timed("strategies")
 def get_politeness_strategy_features(document):
     """
     :param document- pre-processed request document
@@ -211,6 +513,13 @@ def get_politeness_strategy_features(document):
           "unigrams": ['a', 'b', 'c']
         }
 
+    Parses are ingested into ParseElements once, into
+    the module-level parse_elements_cache (see
+    get_parse_elements), keyed by id(document['parses'])
+    and the length of each parse. The key is only valid
+    while the caller keeps that 'parses' list alive and
+    unchanged.
+
 
     Returns- binary feature dict
         {
@@ -225,27 +534,43 @@ def get_politeness_strategy_features(document):
         # Nothing here. Return all 0s
         return {f: 0 for f in POLITENESS_FEATURES}
     
-    features = {}
+    parses = get_parse_elements(document)
+    return dict((fnc2feature_name(fnc), present)
+                for fnc, present in detect_strategies(document['sentences'], parses, document['unigrams']))
 
+
+def detect_strategies(sentences, parses, terms):
+    """
+    :param sentences- list of sentence strings
+    :param parses- per-sentence lists of ParseElements
+        (see get_parse_elements)
+    :param terms- iterable of tokens
+
+    returns list of (strategy fnc, 1 or 0) for all
+    dependency, text and term strategies
+    """
     # Parse-based features:
-    parses = document['parses']
-    for fnc in DEPENDENCY_STRATEGIES:
-        f = fnc2feature_name(fnc)
-        features[f] = int(check_elems_for_strategy(parses, lambda p: check_elems_for_strategy(p, fnc)))
-
-    # Text-based
-    sentences = map(lambda s: s.lower(), document['sentences'])
-    for fnc in TEXT_STRATEGIES:
-        f = fnc2feature_name(fnc)
-        features[f] = int(check_elems_for_strategy(sentences, fnc))
-
-    # Term-based features:
-    terms = map(lambda x: x.lower(), document['unigrams'])
-    for fnc in TERM_STRATEGIES:
-        f = fnc2feature_name(fnc)
+    engine = get_strategy_engine()
+    detected = zip(engine.strategies, engine.detect(parses))
+    if instrumentation.ENABLED:
+        for fnc, present in detected:
+            if getattr(fnc, 'rules', None) is not None:
+                # Compiled strategies are evaluated together
+                # (see the strategy_engine stage time)
+                instrumentation.record_strategy(fnc.__name__, 1, present)
+
+    # Text-based and term-based features, in one
+    # pass over sentences and one over terms:
+    sentences = map(lambda s: s.lower(), sentences)
+    terms = map(lambda x: x.lower(), terms)
+    matcher = get_lexicon_matcher()
+    text_found, term_found = matcher.detect(sentences, terms)
+    for fnc, present in chain(zip(matcher.text_strategies, text_found), zip(matcher.term_strategies, term_found)):
         ## HACK: weird feature names right now
         #f = f.replace("==", "=")
-        features[f] = int(check_elems_for_strategy([terms], fnc))
+        detected.append((fnc, present))
+        if instrumentation.ENABLED:
+            instrumentation.record_strategy(fnc.__name__, 1, present)
 
-    return features
+    return detected
 
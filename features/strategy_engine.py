@@ -0,0 +1,214 @@
+from itertools import chain
+
+import instrumentation
+
+"""
+Compiled evaluation of dependency-based politeness strategies.
+
+Instead of calling every strategy lambda on every parse element,
+strategies declare the words (and positions / dependency tags)
+they look for as rules. The StrategyEngine compiles all rules into
+per-side hash tables keyed by word, whose entries hold the tag and
+position conditions and a bitmask of strategies. It then makes a
+single pass over a document's parse elements, OR-ing matched
+strategies together.
+
+Elements with a single constituent (see ParseElement.complete)
+only match left-side word rules not marked complete; element
+rules and right-side rules never match them.
+
+Strategies without rules are still supported: the engine falls
+back to calling the strategy function on each element.
+"""
+
+LEFT, RIGHT, EITHER = "left", "right", "either"
+
+
+class WordRule(object):
+
+    """
+    Strategy fires if a word on the given side of the
+    element is one of `words`, optionally requiring
+        positions- that side's word position is one of these
+        tag- the element's dependency tag
+        not_initial- neither word of the element is at position 1
+        prefix- words are prefixes rather than whole words
+        complete- the strategy reads both words before deciding,
+            so the rule never matches an element with a single
+            constituent (implied by not_initial)
+    """
+
+    def __init__(self, words, side=EITHER, positions=None, tag=None, not_initial=False, prefix=False,
+                 complete=False):
+        self.words = list(words)
+        self.sides = (LEFT, RIGHT) if side == EITHER else (side,)
+        self.positions = tuple(positions) if positions else (None,)
+        self.tag = tag
+        self.not_initial = not_initial
+        self.prefix = prefix
+        self.complete = complete or not_initial
+
+
+class ElementRule(object):
+
+    """
+    Strategy fires if the element, with word positions
+    removed (e.g. "dobj(excuse, me)"), is one of `elements`.
+        lowercase- compare against the lowercased element
+        contains- elements are substrings rather than whole elements
+    """
+
+    def __init__(self, elements, lowercase=True, contains=False):
+        self.elements = list(elements)
+        self.lowercase = lowercase
+        self.contains = contains
+
+
+class StrategyEngine(object):
+
+    """
+    Evaluates a list of dependency strategies over ParseElements
+    in one pass. Strategy functions with a `rules` attribute
+    (a list of WordRule/ElementRule) are compiled into lookup
+    tables; others are evaluated by calling the function.
+    """
+
+    def __init__(self, strategies, check_elems=None):
+        """
+        :param strategies- list of strategy functions
+        :param check_elems- check_elems_for_strategy-style helper
+            used to evaluate strategies that have no rules
+        """
+        self.strategies = list(strategies)
+        self._check_elems = check_elems or _check_elems
+        # side -> {word: [(tag, positions, not_initial, bitmask)]}
+        # Most words hit no rule, which costs one lookup per side.
+        self._words = {LEFT: {}, RIGHT: {}}
+        self._prefixes = []
+        # Left-side rules that also match single-constituent elements
+        self._incomplete_words, self._incomplete_prefixes = {}, []
+        self._elements, self._lelements, self._contains = {}, {}, []
+        self._fallback = []
+        self._all = 0
+        for i, fnc in enumerate(self.strategies):
+            bit = 1 << i
+            self._all |= bit
+            rules = getattr(fnc, 'rules', None)
+            if rules is None:
+                self._fallback.append((fnc, bit))
+            else:
+                for rule in rules:
+                    self._compile(rule, bit)
+        self._compiled = self._all & ~sum(bit for _, bit in self._fallback)
+
+    def _compile(self, rule, bit):
+        if isinstance(rule, ElementRule):
+            for e in rule.elements:
+                if rule.contains:
+                    self._contains.append((e, rule.lowercase, bit))
+                else:
+                    table = self._lelements if rule.lowercase else self._elements
+                    table[e] = table.get(e, 0) | bit
+            return
+        positions = None if rule.positions == (None,) else frozenset(rule.positions)
+        for side in rule.sides:
+            incomplete = side == LEFT and not rule.complete
+            if rule.prefix:
+                for w in rule.words:
+                    prefix = (side == LEFT, w, rule.tag, positions, rule.not_initial, bit)
+                    self._prefixes.append(prefix)
+                    if incomplete:
+                        self._incomplete_prefixes.append(prefix)
+                continue
+            for w in rule.words:
+                self._add_entry(self._words[side], w, rule, positions, bit)
+                if incomplete:
+                    self._add_entry(self._incomplete_words, w, rule, positions, bit)
+
+    @staticmethod
+    def _add_entry(table, w, rule, positions, bit):
+        entries = table.setdefault(w, [])
+        for i, (tag, pos, not_initial, mask) in enumerate(entries):
+            # Merge rules with identical conditions
+            if (tag, pos, not_initial) == (rule.tag, positions, rule.not_initial):
+                entries[i] = (tag, pos, not_initial, mask | bit)
+                break
+        else:
+            entries.append((rule.tag, positions, rule.not_initial, bit))
+
+    @staticmethod
+    def _match_entries(entries, p, pos):
+        found = 0
+        for tag, positions, not_initial, mask in entries:
+            if tag is not None and p.tag != tag:
+                continue
+            if positions is not None and pos not in positions:
+                continue
+            if not_initial and (p.leftpos == 1 or p.rightpos == 1):
+                continue
+            found |= mask
+        return found
+
+    @instrumentation.timed("strategy_engine")
+    def match(self, parses):
+        """
+        :param parses- list of per-sentence lists of ParseElements
+        returns bitmask of the strategies found
+        (bit i set <=> self.strategies[i] detected)
+        """
+        found = 0
+        compiled = self._compiled
+        if compiled:
+            left, right = self._words[LEFT], self._words[RIGHT]
+            match_entries = self._match_entries
+            prefixes, contains = self._prefixes, self._contains
+            elements, lelements = self._elements, self._lelements
+            incomplete_words, incomplete_prefixes = self._incomplete_words, self._incomplete_prefixes
+            for p in chain.from_iterable(parses):
+                if not p.complete:
+                    entries = incomplete_words.get(p.left)
+                    if entries is not None:
+                        found |= match_entries(entries, p, p.leftpos)
+                    for _, prefix, tag, positions, not_initial, bit in incomplete_prefixes:
+                        if p.left.startswith(prefix) and match_entries([(tag, positions, not_initial, bit)], p, p.leftpos):
+                            found |= bit
+                    continue
+                entries = left.get(p.left)
+                if entries is not None:
+                    found |= match_entries(entries, p, p.leftpos)
+                entries = right.get(p.right)
+                if entries is not None:
+                    found |= match_entries(entries, p, p.rightpos)
+                found |= elements.get(p.nonum, 0) | lelements.get(p.lnonum, 0)
+                for e, lowercase, bit in contains:
+                    if e in (p.lnonum if lowercase else p.nonum):
+                        found |= bit
+                for is_left, prefix, tag, positions, not_initial, bit in prefixes:
+                    w, pos = (p.left, p.leftpos) if is_left else (p.right, p.rightpos)
+                    if w.startswith(prefix) and self._match_entries([(tag, positions, not_initial, bit)], p, pos):
+                        found |= bit
+                if found & compiled == compiled:
+                    break
+        # Strategies without rules: call the function per element
+        check_elems = self._check_elems
+        for fnc, bit in self._fallback:
+            if any(check_elems(parse, fnc) for parse in parses):
+                found |= bit
+        return found
+
+    def detect(self, parses):
+        """
+        returns list of 0/1 ints, one per strategy in self.strategies
+        """
+        found = self.match(parses)
+        return [1 if found & (1 << i) else 0 for i in xrange(len(self.strategies))]
+
+
+def _check_elems(elems, strategy_fnc):
+    for elem in elems:
+        try:
+            if strategy_fnc(elem):
+                return True
+        except Exception:
+            pass
+    return False
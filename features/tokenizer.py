@@ -0,0 +1,175 @@
+import re
+import sys
+
+from cache import LRUCache, SqliteCache
+
+"""
+Sentence tokenizers for unigram/bigram features.
+
+    nltk_tokenize- nltk.word_tokenize, as used to build
+        featunigrams.p and featbigrams.p
+    regex_tokenize- precompiled port of nltk 3.0's Treebank
+        word tokenizer, without the punkt sentence split.
+        Much faster; see scripts/check_tokenizer.py for its
+        agreement with nltk.
+    CachedTokenizer- wraps a tokenizer with a bounded LRU
+        cache (and optionally a persistent sqlite cache),
+        since the same sentences recur constantly.
+"""
+
+
+_nltk = None
+
+def nltk_tokenize(sentence):
+    global _nltk
+    if _nltk is None:
+        # nltk is slow to import; only pay for it when used
+        import nltk
+        if nltk.__version__ < "3.0.0":
+            sys.stderr.write("Warning: package 'nltk', expected version >= 3.0.0, detected %s. Code functionality not guaranteed.\n" % nltk.__version__)
+        _nltk = nltk
+    return _nltk.word_tokenize(sentence)
+
+
+####
+# Treebank regexes (nltk 3.0 TreebankWordTokenizer)
+
+_STARTING_QUOTES = [
+    (re.compile(r'^\"'), r'``'),
+    (re.compile(r'(``)'), r' \1 '),
+    (re.compile(r'([ (\[{<])"'), r'\1 `` '),
+]
+
+_PUNCTUATION = [
+    (re.compile(r'([:,])([^\d])'), r' \1 \2'),
+    (re.compile(r'\.\.\.'), r' ... '),
+    (re.compile(r'[;@#$%&]'), r' \g<0> '),
+    (re.compile(r'([^\.])(\.)([\]\)}>"\']*)\s*$'), r'\1 \2\3 '),
+    (re.compile(r'[?!]'), r' \g<0> '),
+    (re.compile(r"([^'])' "), r"\1 ' "),
+]
+
+_PARENS_BRACKETS = [
+    (re.compile(r'[\]\[\(\)\{\}\<\>]'), r' \g<0> '),
+    (re.compile(r'--'), r' -- '),
+]
+
+_ENDING_QUOTES = [
+    (re.compile(r'"'), " '' "),
+    (re.compile(r'(\S)(\'\')'), r'\1 \2 '),
+    (re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r"\1 \2 "),
+    (re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1 \2 "),
+]
+
+_CONTRACTIONS = [
+    re.compile(r"(?i)\b(can)(not)\b"),
+    re.compile(r"(?i)\b(d)('ye)\b"),
+    re.compile(r"(?i)\b(gim)(me)\b"),
+    re.compile(r"(?i)\b(gon)(na)\b"),
+    re.compile(r"(?i)\b(got)(ta)\b"),
+    re.compile(r"(?i)\b(lem)(me)\b"),
+    re.compile(r"(?i)\b(mor)('n)\b"),
+    re.compile(r"(?i)\b(wan)(na) "),
+    re.compile(r"(?i) ('t)(is)\b"),
+    re.compile(r"(?i) ('t)(was)\b"),
+]
+
+
+def regex_tokenize(sentence):
+    text = sentence
+    for regexp, substitution in _STARTING_QUOTES:
+        text = regexp.sub(substitution, text)
+    for regexp, substitution in _PUNCTUATION:
+        text = regexp.sub(substitution, text)
+    for regexp, substitution in _PARENS_BRACKETS:
+        text = regexp.sub(substitution, text)
+    text = " " + text + " "
+    for regexp, substitution in _ENDING_QUOTES:
+        text = regexp.sub(substitution, text)
+    for regexp in _CONTRACTIONS:
+        text = regexp.sub(r' \1 \2 ', text)
+    return text.split()
+
+
+TOKENIZERS = {
+    'nltk': nltk_tokenize,
+    'regex': regex_tokenize,
+}
+
+
+class CachedTokenizer(object):
+
+    """
+    sentence --> tuple of tokens, memoized.
+
+    Usage--
+        tokenize = CachedTokenizer('regex', maxsize=50000)
+        tokens = tokenize("Could you please help?")
+        tokenize.stats()
+    """
+
+    def __init__(self, tokenizer='nltk', maxsize=100000, persistent=None):
+        """
+        :param tokenizer- 'nltk', 'regex', or a function
+        :param maxsize- max sentences held in the LRU cache
+        :param persistent- optional sqlite filename for
+            an on-disk cache shared across runs and
+            processes (see cache.SqliteCache)
+        """
+        if isinstance(tokenizer, basestring):
+            self.name = tokenizer
+            tokenizer = TOKENIZERS[tokenizer]
+        else:
+            self.name = getattr(tokenizer, '__name__', 'custom')
+        self.tokenizer = tokenizer
+        self.cache = LRUCache(maxsize)
+        self.persistent = SqliteCache(persistent, table="tokens_" + re.sub(r"\W", "_", self.name)) if persistent else None
+
+    def __call__(self, sentence):
+        tokens = self.cache.get(sentence)
+        if tokens is None:
+            if self.persistent is not None:
+                tokens = self.persistent.get(_key(sentence))
+            if tokens is None:
+                tokens = tuple(self.tokenizer(sentence))
+                if self.persistent is not None:
+                    self.persistent.put(_key(sentence), tokens)
+            self.cache.put(sentence, tokens)
+        return tokens
+
+    def commit(self):
+        """
+        Write new tokenizations to the persistent cache
+        (the vectorizer calls this after each batch)
+        """
+        if self.persistent is not None:
+            self.persistent.commit()
+
+    def stats(self):
+        stats = self.cache.stats()
+        if self.persistent is not None:
+            stats['persistent'] = self.persistent.stats()
+        return stats
+
+    def close(self):
+        if self.persistent is not None:
+            self.persistent.close()
+
+
+def _key(sentence):
+    if isinstance(sentence, unicode):
+        return sentence.encode('utf-8')
+    return sentence
+
+
+# Default tokenizer for feature extraction
+word_tokenize = CachedTokenizer('nltk')
+
+
+def tokenizer_name(tokenize):
+    """
+    Name of a vectorizer's tokenize function
+    (None: the default word_tokenize)
+    """
+    tokenize = tokenize or word_tokenize
+    return getattr(tokenize, 'name', None) or getattr(tokenize, '__name__', 'custom')
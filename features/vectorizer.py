@@ -1,33 +1,52 @@
 
 import os
 import cPickle
-import string
-import nltk
+import numpy as np
 from itertools import chain
-from collections import defaultdict
+from scipy.sparse import csr_matrix
 
 # local import
-from politeness_strategies import get_politeness_strategy_features
+import politeness_strategies
+from politeness_strategies import get_politeness_strategy_features, strategy_terms, POLITENESS_FEATURES
+import tokenizer
+import instrumentation
+from vocabulary import load_vocabulary, lookup_columns, _encode
+from ngram_counts import count_frequent_ngrams, approximate_frequent_ngrams
 
 # Will need access to local dir
 # for support files
 LOCAL_DIR = os.path.split(__file__)[0]
 
 
-def get_unigrams_and_bigrams(document):
+@instrumentation.timed("tokenize")
+def get_unigrams_and_bigrams(document, tokenize=None):
     """
     Grabs unigrams and bigrams from document 
-    sentences. NLTK does the work.
+    sentences. NLTK does the work, unless another
+    tokenize function is given (see tokenizer.py).
+    By default, tokenizations are cached per sentence.
     """
+    tokenize = tokenize or tokenizer.word_tokenize
     # Get unigram list per sentence:
-    unigram_lists = map(lambda x: nltk.word_tokenize(x), document['sentences'])
+    unigram_lists = map(tokenize, document['sentences'])
     # Generate bigrams from all sentences:
-    bigrams = chain(*map(lambda x: nltk.bigrams(x), unigram_lists))
+    bigrams = chain(*map(lambda x: zip(x, x[1:]), unigram_lists))
     # Chain unigram lists
     unigrams = chain(*unigram_lists)
     return unigrams, bigrams
 
 
+def _feature_name(prefix, ngram):
+    """
+    Feature name of a unigram or bigram tuple. Names are
+    utf-8 strs: str() of a non-ascii unicode token would
+    raise, and an ascii unicode ngram (e.g. reloaded from
+    JSON) gets the same name as its str equivalent.
+    """
+    if isinstance(ngram, tuple):
+        return prefix + str(tuple(map(_encode, ngram)))
+    return prefix + _encode(ngram)
+
 
 class PolitenessFeatureVectorizer:
 
@@ -41,16 +60,54 @@ class PolitenessFeatureVectorizer:
     UNIGRAMS_FILENAME = os.path.join(LOCAL_DIR, "featunigrams.p")
     BIGRAMS_FILENAME = os.path.join(LOCAL_DIR, "featbigrams.p")
 
-    def __init__(self):
+    def __init__(self, tokenize=None, artifact=None, ngrams=None):
         """
         Load pickled lists of unigram and bigram features
         These lists can be generated using the training set
         and PolitenessFeatureVectorizer.generate_bow_features
+
+        tokenize- optional sentence tokenizer, e.g.
+            tokenizer.CachedTokenizer('regex').
+            Defaults to cached nltk.word_tokenize.
+
+        artifact- optional artifact directory (see artifacts.py).
+            The column mapping is then memory-mapped from its
+            vocabulary files instead of built from the pickles,
+            and self.unigrams/self.bigrams are not loaded.
+
+        ngrams- optional (unigrams, bigrams) lists to use
+            instead of the pickled ones
+        """
+        self.tokenize = tokenize
+        if ngrams is not None:
+            self.unigrams, self.bigrams = list(ngrams[0]), list(ngrams[1])
+            self._build_index()
+        elif artifact is None:
+            self.unigrams = cPickle.load(open(self.UNIGRAMS_FILENAME))
+            self.bigrams = cPickle.load(open(self.BIGRAMS_FILENAME))
+            self._build_index()
+        else:
+            self.feature_names, self.unigram_columns, self.bigram_columns, self.strategy_columns = load_vocabulary(artifact)
+            self._term_feature_names = None
+
+    def _build_index(self):
+        """
+        Fix the feature-name --> column mapping once.
+        Columns are in sorted feature-name order, the
+        order model.score has always used.
         """
-        self.unigrams = cPickle.load(open(self.UNIGRAMS_FILENAME))
-        self.bigrams = cPickle.load(open(self.BIGRAMS_FILENAME))
+        unigram_names = dict((_feature_name("UNIGRAM_", x), x) for x in self.unigrams)
+        bigram_names = dict((_feature_name("BIGRAM_", x), x) for x in self.bigrams)
+        self.feature_names = sorted(chain(unigram_names, bigram_names, POLITENESS_FEATURES))
+        self.feature_index = dict((f, i) for i, f in enumerate(self.feature_names))
+        # ngram --> column
+        self.unigram_columns = dict((x, self.feature_index[f]) for f, x in unigram_names.iteritems())
+        self.bigram_columns = dict((x, self.feature_index[f]) for f, x in bigram_names.iteritems())
+        self.strategy_columns = dict((f, self.feature_index[f]) for f in POLITENESS_FEATURES)
+        self._term_feature_names = unigram_names.keys() + bigram_names.keys()
 
 
+    @instrumentation.timed("vectorizer.features")
     def features(self, document):
         """
         document must be a dict of the following format-- 
@@ -66,51 +123,117 @@ class PolitenessFeatureVectorizer:
         feature_dict.update(get_politeness_strategy_features(document))
         return feature_dict
 
+    @instrumentation.timed("vectorizer.sparse_features")
+    def sparse_features(self, document):
+        """
+        Same features as self.features, as a sparse row:
+            (column indices, values)
+        with columns as in self.feature_names. Only
+        ngrams present in the document are looked up.
+        """
+        unigrams, bigrams = self._get_ngram_sets(document)
+        row = {}
+        for i in lookup_columns(self.unigram_columns, unigrams):
+            row[i] = 1
+        for i in lookup_columns(self.bigram_columns, bigrams):
+            row[i] = 1
+        for f, v in get_politeness_strategy_features(document).iteritems():
+            if v:
+                row[self.strategy_columns[f]] = v
+        indices = sorted(row)
+        return indices, [row[i] for i in indices]
+
+    def transform(self, documents):
+        """
+        Vectorize documents into a CSR matrix,
+        one row per document, columns as in self.feature_names
+        """
+        data, indices, indptr = [], [], [0]
+        for d in documents:
+            idx, values = self.sparse_features(d)
+            indices.extend(idx)
+            data.extend(values)
+            indptr.append(len(indices))
+        # Share this batch's new tokenizations with other
+        # processes using the same persistent token cache
+        commit = getattr(self.tokenize or tokenizer.word_tokenize, 'commit', None)
+        if commit is not None:
+            commit()
+        return csr_matrix((np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+                          shape=(len(indptr) - 1, len(self.feature_names)))
+
+    def _get_ngram_sets(self, document):
+        unigrams, bigrams = get_unigrams_and_bigrams(document, self.tokenize)
+        if politeness_strategies.MATCH_MULTIWORD_HEDGES:
+            # Fixed-behavior mode: term strategies see every
+            # token (tokenizations are cached per sentence)
+            tokenize = self.tokenize or tokenizer.word_tokenize
+            document['unigrams'] = strategy_terms(map(tokenize, document['sentences']))
+            return set(unigrams), set(bigrams)
+        # Add unigrams to document for later use
+        # NOTE: this stores the chain iterator, which the set()
+        # call below exhausts. Term strategies (HASHEDGE etc.)
+        # therefore see no terms. The pre-trained model was fit
+        # on features computed this way, so it is kept as is.
+        document['unigrams'] = unigrams
+        return set(unigrams), set(bigrams)
+
+    @instrumentation.timed("term_features")
     def _get_term_features(self, document):
         # One binary feature per ngram in
         # in self.unigrams and self.bigrams
-        unigrams, bigrams = get_unigrams_and_bigrams(document)
-        # Add unigrams to document for later use
-        document['unigrams'] = unigrams
-        unigrams, bigrams = set(unigrams), set(bigrams)
-        f = {}
-        f.update(dict(map(lambda x: ("UNIGRAM_" + str(x), 1 if x in unigrams else 0), self.unigrams)))
-        f.update(dict(map(lambda x: ("BIGRAM_" + str(x), 1 if x in bigrams else 0), self.bigrams)))
+        unigrams, bigrams = self._get_ngram_sets(document)
+        if self._term_feature_names is None:
+            self._term_feature_names = [str(f) for f in self.feature_names if f.startswith("UNIGRAM_") or f.startswith("BIGRAM_")]
+        f = dict.fromkeys(self._term_feature_names, 0)
+        names = self.feature_names
+        f.update((str(names[i]), 1) for i in lookup_columns(self.unigram_columns, unigrams))
+        f.update((str(names[i]), 1) for i in lookup_columns(self.bigram_columns, bigrams))
         return f
 
 
     @staticmethod
-    def generate_bow_features(documents, min_unigram_count=20, min_bigram_count=20):
+    def generate_bow_features(documents, min_unigram_count=20, min_bigram_count=20,
+                              processes=1, chunksize=1000, max_items=1000000,
+                              spill_dir=None, approximate=False):
         """
-        Given a list of documents, compute and store list of unigrams and bigrams
+        Given documents, compute and store list of unigrams and bigrams
         with a frequency > min_unigram_count and min_bigram_count, respectively.
         This method must be called prior to the first vectorizer instantiation.
         
         documents - 
 
+            list, iterator, or JSONL filename of documents.
             each document must be a dict
             {
                 'sentences': ["sentence one string", "sentence two string"],
                 'parses': [ ["dep(a,b)"], ["dep(b,c)"] ]
             }
+
+        processes- number of worker processes counting
+            chunks of `chunksize` documents
+
+        max_items- distinct ngrams held in memory before
+            partial counts are spilled to disk (under spill_dir,
+            default the system temp dir) and later merged
+
+        approximate- if True, use a count-min sketch instead of
+            exact counts: faster and fixed-memory, but may keep
+            some ngrams below the thresholds (see ngram_counts.py)
+
+        returns (unigram_features, bigram_features), sorted
         """
-        punctuation = string.punctuation
-        punctuation = punctuation.replace("?","").replace("!","")
-        unigram_counts, bigram_counts = defaultdict(int), defaultdict(int)
-        # Count unigrams and bigrams:
-        for d in documents:
-            unigrams, bigrams = get_unigrams_and_bigrams(d)
-            # Count
-            for w in unigrams:
-                unigram_counts[w] += 1
-            for w in bigrams:
-                bigram_counts[w] += 1
-        # Keep only ngrams that pass frequency threshold:
-        unigram_features = filter(lambda x: unigram_counts[x] > min_unigram_count, unigram_counts.iterkeys())
-        bigram_features = filter(lambda x: bigram_counts[x] > min_bigram_count, bigram_counts.iterkeys())
+        if approximate:
+            unigram_features, bigram_features = approximate_frequent_ngrams(
+                documents, min_unigram_count, min_bigram_count, processes, chunksize)
+        else:
+            unigram_features, bigram_features = count_frequent_ngrams(
+                documents, min_unigram_count, min_bigram_count, processes, chunksize,
+                max_items, spill_dir)
         # Save results:
         cPickle.dump(unigram_features, open(PolitenessFeatureVectorizer.UNIGRAMS_FILENAME, 'w'))
         cPickle.dump(bigram_features, open(PolitenessFeatureVectorizer.BIGRAMS_FILENAME, 'w'))
+        return unigram_features, bigram_features
 
 
 
@@ -137,3 +260,13 @@ if __name__ == "__main__":
         print "\n"
 
 
+
+    # Fixed-behavior mode (MATCH_MULTIWORD_HEDGES),
+    # through the vectorizer: multi-word hedges match
+    hedge_doc = {'sentences': ["In my opinion you should tend to fix it."],
+                 'parses': [["nsubj(fix-9, you-5)", "aux(fix-9, should-6)"]]}
+    for mode in (False, True):
+        politeness_strategies.MATCH_MULTIWORD_HEDGES = mode
+        f = vectorizer.features(dict(hedge_doc))
+        print "MATCH_MULTIWORD_HEDGES=%s: Hedges=%d" % (mode, f['feature_politeness_==HASHEDGE=='])
+    politeness_strategies.MATCH_MULTIWORD_HEDGES = False
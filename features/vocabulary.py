@@ -0,0 +1,129 @@
+import os
+import json
+import numpy as np
+
+"""
+Memory-mappable vocabulary files.
+
+A vectorizer's column mapping is stored as flat numpy
+arrays (.npy, so they can be opened with mmap_mode='r'
+and shared read-only by every process on a host):
+
+    feature_names.npy- all feature names, in column order
+    unigrams.npy, unigram_columns.npy- sorted string table
+        of unigrams (utf-8) and the column of each
+    bigrams.npy, bigram_columns.npy- same for bigrams,
+        stored as "first second"
+    vocabulary.json- strategy feature --> column
+"""
+
+BIGRAM_SEPARATOR = " "
+
+
+def _encode(token):
+    if isinstance(token, unicode):
+        return token.encode('utf-8')
+    return token
+
+
+def _encode_bigram(bigram):
+    return BIGRAM_SEPARATOR.join(map(_encode, bigram))
+
+
+class MappedVocabulary(object):
+
+    """
+    Read-only ngram --> column mapping backed by a sorted
+    string table. Supports the dict operations the vectorizer
+    uses (get, in, []), plus lookup() for many keys at once.
+    """
+
+    def __init__(self, keys, columns, encode=_encode):
+        """
+        :param keys- sorted numpy bytes array
+        :param columns- int array, column of each key
+        """
+        self.keys = keys
+        self.columns = columns
+        self.encode = encode
+
+    def _find(self, key):
+        key = self.encode(key)
+        i = np.searchsorted(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return None
+
+    def get(self, key, default=None):
+        i = self._find(key)
+        return default if i is None else int(self.columns[i])
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i is None:
+            raise KeyError(key)
+        return int(self.columns[i])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """
+        returns list of columns of the keys present
+        """
+        if not keys or not len(self.keys):
+            return []
+        encoded = np.array([self.encode(k) for k in keys])
+        idx = np.searchsorted(self.keys, encoded)
+        idx[idx >= len(self.keys)] = 0
+        found = self.keys[idx] == encoded
+        return self.columns[idx[found]].tolist()
+
+
+def lookup_columns(columns, keys):
+    """
+    Columns of the keys present in a dict or MappedVocabulary
+    """
+    if isinstance(columns, dict):
+        return [columns[k] for k in keys if k in columns]
+    return columns.lookup(keys)
+
+
+def _string_table(keys2columns, encode):
+    encoded = np.array([encode(k) for k in keys2columns]) if keys2columns else np.array([], dtype='S1')
+    columns = np.array(keys2columns.values(), dtype=np.int32)
+    order = np.argsort(encoded, kind='mergesort')
+    return encoded[order], columns[order]
+
+
+def save_vocabulary(vectorizer, dirname):
+    """
+    Write a vectorizer's column mapping to dirname
+    """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    np.save(os.path.join(dirname, "feature_names.npy"), np.array(map(_encode, vectorizer.feature_names)))
+    keys, columns = _string_table(vectorizer.unigram_columns, _encode)
+    np.save(os.path.join(dirname, "unigrams.npy"), keys)
+    np.save(os.path.join(dirname, "unigram_columns.npy"), columns)
+    keys, columns = _string_table(vectorizer.bigram_columns, _encode_bigram)
+    np.save(os.path.join(dirname, "bigrams.npy"), keys)
+    np.save(os.path.join(dirname, "bigram_columns.npy"), columns)
+    json.dump({'strategy_columns': vectorizer.strategy_columns}, open(os.path.join(dirname, "vocabulary.json"), 'w'), indent=2)
+
+
+def load_vocabulary(dirname, mmap_mode='r'):
+    """
+    returns (feature_names, unigram_columns, bigram_columns, strategy_columns)
+    with the arrays memory-mapped
+    """
+    load = lambda name: np.load(os.path.join(dirname, name), mmap_mode=mmap_mode)
+    feature_names = load("feature_names.npy")
+    unigram_columns = MappedVocabulary(load("unigrams.npy"), load("unigram_columns.npy"))
+    bigram_columns = MappedVocabulary(load("bigrams.npy"), load("bigram_columns.npy"), _encode_bigram)
+    strategy_columns = json.load(open(os.path.join(dirname, "vocabulary.json")))['strategy_columns']
+    strategy_columns = dict((str(f), i) for f, i in strategy_columns.iteritems())
+    return feature_names, unigram_columns, bigram_columns, strategy_columns
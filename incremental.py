@@ -0,0 +1,131 @@
+import model
+from compiled_model import as_linear_model
+from features import tokenizer
+from features import politeness_strategies
+from features.vocabulary import lookup_columns
+from features.politeness_strategies import (ingest_parses, detect_strategies,
+                                            fnc2feature_name, POLITENESS_FEATURES)
+from request_utils import is_request
+
+"""
+Incremental scoring of growing documents (e.g. a
+conversation that gains a sentence per message).
+
+Every feature is a binary OR over sentences: an ngram
+is present if some sentence contains it, a strategy if
+some sentence or its parse shows it. So the feature
+vector of a document is the union of its sentences'
+columns, and appending a sentence only needs that
+sentence tokenized, its parse ingested and its
+strategies detected. With a linear model, the decision
+value is updated by the weights of newly set columns only.
+
+Bigrams never span sentences, and term strategies are
+fed no terms (or, with MATCH_MULTIWORD_HEDGES, each
+sentence's tokens), exactly as in PolitenessFeatureVectorizer
+(see its _get_ngram_sets), so scores match model.score
+on the whole document.
+
+Usage--
+    conversation = IncrementalScorer()
+    conversation.append("Hi there.", ["root(ROOT-0, Hi-1)", "advmod(Hi-1, there-2)"])
+    probs = conversation.append("Could you please help?", parse)
+"""
+
+
+class IncrementalScorer(object):
+
+    """
+    Feature state and decision value of one growing document
+    """
+
+    def __init__(self, clf=None, vectorizer=None):
+        """
+        :param clf- linear model (svm.SVC with a linear kernel,
+            or compiled_model.LinearPolitenessModel); defaults
+            to model.clf
+        :param vectorizer- defaults to model.vectorizer
+        """
+        if clf is None or vectorizer is None:
+            model.ensure_loaded()
+        self.clf = as_linear_model(clf if clf is not None else model.clf)
+        self.vectorizer = vectorizer if vectorizer is not None else model.vectorizer
+        self.sentences = []
+        self.parses = []
+        # Set feature columns, and the strategies among them
+        self.columns = set()
+        self.strategies = set()
+        self.is_request = False
+        self.decision = self.clf.intercept_
+
+    def append(self, sentence, parse):
+        """
+        :param sentence- sentence string
+        :param parse- its dependency parse (list of strings)
+        returns class probabilities as a dict, as model.score
+        """
+        self.sentences.append(sentence)
+        self.parses.append(parse)
+        vectorizer = self.vectorizer
+        unigrams = (vectorizer.tokenize or tokenizer.word_tokenize)(sentence)
+        new = set(lookup_columns(vectorizer.unigram_columns, set(unigrams)))
+        new.update(lookup_columns(vectorizer.bigram_columns, set(zip(unigrams, unigrams[1:]))))
+        elements = ingest_parses([parse])
+        terms = unigrams if politeness_strategies.MATCH_MULTIWORD_HEDGES else []
+        for fnc, present in detect_strategies([sentence], elements, terms):
+            if present:
+                name = fnc2feature_name(fnc)
+                self.strategies.add(name)
+                new.add(vectorizer.strategy_columns[name])
+        new -= self.columns
+        self.columns |= new
+        for column in new:
+            self.decision += self.clf.coef_[column]
+        if not self.is_request:
+            self.is_request = is_request([sentence], elements)
+        return self.probabilities()
+
+    def extend(self, sentences, parses):
+        for sentence, parse in zip(sentences, parses):
+            self.append(sentence, parse)
+        return self.probabilities()
+
+    def probabilities(self):
+        """
+        class probabilities of the document so far, as model.score
+        """
+        probs = self.clf.proba_from_decision([self.decision])[0]
+        return {"polite": probs[1], "impolite": probs[0]}
+
+    def features(self):
+        """
+        strategy features of the document so far, as
+        get_politeness_strategy_features
+        """
+        if not self.sentences:
+            return dict.fromkeys(POLITENESS_FEATURES, 0)
+        return dict((f, int(f in self.strategies)) for f in POLITENESS_FEATURES)
+
+    def document(self):
+        return {'sentences': list(self.sentences), 'parses': list(self.parses)}
+
+
+
+if __name__ == "__main__":
+
+    """
+    Grow each test document a sentence at a time, and
+    compare with scoring the whole document every time
+    """
+
+    from test_documents import TEST_DOCUMENTS
+
+    model.ensure_loaded()
+    for doc in TEST_DOCUMENTS:
+        conversation = IncrementalScorer()
+        for n, (sentence, parse) in enumerate(zip(doc['sentences'], doc['parses']), 1):
+            probs = conversation.append(sentence, parse)
+            full = model.score({'sentences': doc['sentences'][:n], 'parses': doc['parses'][:n]})
+            print "%d sentences: P(polite) %.6f incremental, %.6f full" % (n, probs['polite'], full['polite'])
+        print "Is request: %s" % conversation.is_request
+        print "===="
@@ -1,7 +1,12 @@
 
 import sys
 import os
+import imp
 import cPickle
+from itertools import islice
+from collections import defaultdict, OrderedDict
+
+from features import instrumentation
 
 """
 This file provides an interface to 
@@ -17,52 +22,142 @@ except:
     sys.stderr.write("Package not found: Politeness model requires python package numpy\n")
     sys.exit(2)
 
-try:
-    import scipy
-    from scipy.sparse import csr_matrix
-except:
-    sys.stderr.write("Package not found: Politeness model requires python package scipy\n")
-    sys.exit(2)
+# The other dependencies, the model and the vectorizer
+# are only needed to score, so checking and loading them
+# is deferred to load(). Importing this module is cheap.
 
-try:
-    import sklearn
-except:
-    sys.stderr.write("Package not found: Politeness model requires python package scikit-learn\n")
-    sys.exit(2)
+def check_dependencies(sklearn=True):
+    """
+    Exits if scipy, nltk or (unless sklearn=False)
+    scikit-learn are missing. Warns about old versions.
+
+    nltk takes about a second to import, so it is only
+    located here; its version is checked when the nltk
+    tokenizer first imports it (see features/tokenizer.py).
+    """
+    try:
+        imp.find_module("nltk")
+    except ImportError:
+        sys.stderr.write("Package not found: Politeness model requires python package nltk\n")
+        sys.exit(2)
+    packages2versions = [("numpy", "numpy", "1.9.0"), ("scipy", "scipy", "0.12.0")]
+    if sklearn:
+        packages2versions.insert(0, ("scikit-learn", "sklearn", "0.15.1"))
+    for name, module_name, expected_v in packages2versions:
+        try:
+            package = __import__(module_name)
+        except:
+            sys.stderr.write("Package not found: Politeness model requires python package %s\n" % name)
+            sys.exit(2)
+        # Check versions for sklearn, scipy, numpy
+        # Don't error out, just notify
+        if package.__version__ < expected_v:
+            sys.stderr.write("Warning: package '%s', expected version >= %s, detected %s. Code functionality not guaranteed.\n" % (name, expected_v, package.__version__))
 
-try:
-    import nltk
-except:
-    sys.stderr.write("Package not found: Politeness model requires python package nltk\n")
-    sys.exit(2)
 
 ####
-# Check versions for sklearn, scipy, numpy, nltk
-# Don't error out, just notify
+# Serialized model filename
 
-packages2versions = [("scikit-learn", sklearn, "0.15.1"), ("numpy", np, "1.9.0"), ("nltk", nltk, "3.0.0"), ("scipy", scipy, "0.12.0")]
+MODEL_FILENAME = os.path.join(os.path.split(__file__)[0], 'politeness-svm.p')
+# Compiled (numpy-only) version of the same model,
+# written by compiled_model.py
+COMPILED_MODEL_FILENAME = os.path.join(os.path.split(__file__)[0], 'politeness-linear.npz')
 
-for name, package, expected_v in packages2versions:
-    if package.__version__ < expected_v:
-        sys.stderr.write("Warning: package '%s', expected version >= %s, detected %s. Code functionality not guaranteed.\n" % (name, expected_v, package.__version__))
+####
+# Model and vectorizer, set by load()
 
+clf = None
+vectorizer = None
 
-####
+# Optional result cache (see use_result_cache)
+result_cache = None
+_model_version = None
 
-from features.vectorizer import PolitenessFeatureVectorizer
+# Documents routed by the request pre-filter
+# (score_batch(requests_only=True)), by path
+request_filter_counts = defaultdict(int)
 
+def load(model_filename=MODEL_FILENAME):
+    """
+    Load the pickled model and initialize the vectorizer.
+    score and score_batch call this on first use. Long-running
+    servers can call it at startup, so the first request does
+    not pay for it; worker pools should call it before forking.
+    """
+    global clf, _model_version
+    check_dependencies()
+    clf = cPickle.load(open(model_filename))
+    _model_version = None
+    _load_vectorizer()
+    return clf
 
-####
-# Serialized model filename
+def use_compiled_model(filename=COMPILED_MODEL_FILENAME):
+    """
+    Load the compiled linear form of the SVM (see compiled_model.py)
+    instead of the pickle. score and score_batch then reduce to a
+    sparse dot product plus a sigmoid, and sklearn is never imported.
+    """
+    global clf, _model_version
+    from compiled_model import load_linear_model
+    check_dependencies(sklearn=False)
+    clf = load_linear_model(filename)
+    _model_version = None
+    _load_vectorizer()
+    return clf
 
-MODEL_FILENAME = os.path.join(os.path.split(__file__)[0], 'politeness-svm.p')
+def use_artifact(dirname=None):
+    """
+    Load the model and vectorizer from a memory-mapped
+    artifact directory (see artifacts.py) instead of the
+    pickles. Processes on one host share its pages.
+    """
+    global clf, vectorizer, _model_version
+    from artifacts import load_artifact, ARTIFACT_DIRNAME
+    check_dependencies(sklearn=False)
+    clf, vectorizer = load_artifact(dirname or ARTIFACT_DIRNAME)
+    _model_version = None
+    return clf
 
-####
-# Load model, initialize vectorizer
+def use_result_cache(maxsize=100000, filename=None):
+    """
+    Cache score and score_batch results by document content
+    (see result_cache.py): identical documents are scored once,
+    including duplicates within a batch. filename is an optional
+    sqlite file shared between processes. Set model.result_cache
+    to None to stop caching.
+    """
+    global result_cache
+    from result_cache import ResultCache
+    if result_cache is not None:
+        result_cache.close()
+    result_cache = ResultCache(maxsize, filename)
+    return result_cache
+
+def model_version():
+    """
+    Hash of the loaded model, feature columns and feature
+    options, part of result cache keys
+    """
+    global _model_version
+    from result_cache import model_version as compute_version, feature_options
+    ensure_loaded()
+    # Recomputed if the tokenizer or matcher options change
+    options = feature_options(vectorizer)
+    if _model_version is None or _model_version[0] != options:
+        _model_version = (options, compute_version(clf, vectorizer))
+    return _model_version[1]
+
+def ensure_loaded():
+    if clf is None or vectorizer is None:
+        load()
 
-clf = cPickle.load(open(MODEL_FILENAME))
-vectorizer = PolitenessFeatureVectorizer()
+def _load_vectorizer():
+    global vectorizer
+    if vectorizer is None:
+        from features.vectorizer import PolitenessFeatureVectorizer
+        vectorizer = PolitenessFeatureVectorizer()
 
+@instrumentation.timed("model.score")
 def score(request):
     """
     :param request - The request document to score
@@ -85,17 +180,175 @@ def score(request):
             'impolite': float
         }
     """
-    # vectorizer returns {feature-name: value} dict
-    features = vectorizer.features(request)
-    fv = [features[f] for f in sorted(features.iterkeys())]
-    # Single-row sparse matrix
-    X = csr_matrix(np.asarray([fv]))
-    probs = clf.predict_proba(X)
+    ensure_loaded()
+    # Single-row sparse matrix, columns
+    # in sorted feature-name order
+    probs = _score_documents([request])
     # Massage return format
     probs = {"polite": probs[0][1], "impolite": probs[0][0]}
     return probs
 
 
+def score_text(text):
+    """
+    Parse-free scoring of raw text: sentences are split
+    and approximate parses built from tokens only (see
+    features/parse_free.py). Much cheaper than running a
+    dependency parser first, at some cost in accuracy (see
+    scripts/evaluate_parse_free.py).
+
+    Parses are built from the vectorizer's tokenizer if it
+    has one, else the regex tokenizer (no nltk punkt data
+    needed).
+
+    returns class probabilities as a dict, as score
+    """
+    from features.parse_free import text_to_document
+    ensure_loaded()
+    return score(text_to_document(text, vectorizer.tokenize))
+
+
+@instrumentation.timed("model.score_batch")
+def score_batch(documents, chunksize=1000, as_dicts=True, requests_only=False):
+    """
+    Scores many request documents at once. Documents are
+    vectorized into a single sparse matrix per chunk, and
+    clf.predict_proba is called once per chunk.
+
+    :param documents - The request documents to score
+    :type documents - list or iterator of dicts with 'sentences'
+        and 'parses' fields, as in score
+
+    :param chunksize - max number of documents vectorized
+        and predicted together
+    :type chunksize - int
+
+    :param as_dicts - if True, return a list of
+        {'polite': float, 'impolite': float} dicts, as
+        returned by score. Otherwise return an
+        (n_documents, 2) array of class probabilities
+        ordered (impolite, polite).
+    :type as_dicts - bool
+
+    :param requests_only - if True, run request_utils.check_is_request
+        first, and only score documents that look like requests.
+        Tokenization, term features and prediction are skipped for
+        the others, which get {'polite': None, 'impolite': None}
+        (a row of NaN if not as_dicts). Dicts then also carry an
+        'is_request' field. Counts per path are kept in
+        request_filter_counts.
+    :type requests_only - bool
+    """
+    ensure_loaded()
+    documents = iter(documents)
+    results, is_request = [], []
+    while True:
+        chunk = list(islice(documents, chunksize))
+        if not chunk:
+            break
+        if not requests_only:
+            results.append(_score_documents(chunk))
+            continue
+        mask = _filter_requests(chunk)
+        probs = np.full((len(chunk), 2), np.nan)
+        if mask.any():
+            probs[mask] = _score_documents([d for d, r in zip(chunk, mask) if r])
+        results.append(probs)
+        is_request.append(mask)
+    if not results:
+        probs = np.zeros((0, 2))
+    else:
+        probs = np.vstack(results)
+    if not as_dicts:
+        return probs
+    if not requests_only:
+        return [{"polite": p[1], "impolite": p[0]} for p in probs]
+    not_request = {"polite": None, "impolite": None, "is_request": False}
+    return [{"polite": p[1], "impolite": p[0], "is_request": True} if r else dict(not_request)
+            for p, r in zip(probs, np.concatenate(is_request))]
+
+
+@instrumentation.timed("model.score_packed")
+def score_packed(corpus, chunksize=1000, as_dicts=True):
+    """
+    Scores all documents of a packed corpus (see
+    packed_corpus.py), vectorized straight from its arrays.
+
+    :param corpus - a packed_corpus.PackedCorpus
+    :param chunksize, as_dicts - as in score_batch
+    """
+    ensure_loaded()
+    results = [_predict_proba(corpus.transform(vectorizer, start, start + chunksize))
+               for start in xrange(0, len(corpus), chunksize)]
+    probs = np.vstack(results) if results else np.zeros((0, 2))
+    if not as_dicts:
+        return probs
+    return [{"polite": p[1], "impolite": p[0]} for p in probs]
+
+
+@instrumentation.timed("request_filter")
+def _filter_requests(documents):
+    """
+    returns boolean array: check_is_request per document.
+    The parse elements it ingests go into
+    politeness_strategies.parse_elements_cache, keyed by
+    id(document['parses']) and the parse lengths, and are
+    reused by the strategy features as long as the caller
+    keeps each 'parses' list alive (score_batch holds the
+    documents until they are vectorized).
+    """
+    from request_utils import check_is_request
+    mask = np.array([check_is_request(d) for d in documents], dtype=bool)
+    n_requests = int(mask.sum())
+    request_filter_counts['requests'] += n_requests
+    request_filter_counts['non_requests'] += len(mask) - n_requests
+    return mask
+
+
+def _score_documents(documents):
+    """
+    returns (n_documents, 2) class probabilities. With a
+    result cache, only documents not in the cache are
+    vectorized and predicted, each distinct one once.
+    """
+    if result_cache is None:
+        return _predict_proba(_feature_matrix(documents))
+    version = model_version()
+    # key --> rows with that key
+    rows = OrderedDict()
+    for i, d in enumerate(documents):
+        rows.setdefault(result_cache.key(d, version), []).append(i)
+    probs = np.empty((len(documents), 2))
+    missing = []
+    for key, idx in rows.iteritems():
+        cached = result_cache.get(key)
+        if cached is None:
+            missing.append(key)
+        else:
+            probs[idx] = cached
+    if missing:
+        computed = _predict_proba(_feature_matrix([documents[rows[key][0]] for key in missing]))
+        for key, p in zip(missing, computed):
+            probs[rows[key]] = p
+            result_cache.put(key, (float(p[0]), float(p[1])))
+            result_cache.deduplicated += len(rows[key]) - 1
+        # Short write transaction per batch: never holds
+        # the shared file locked between batches
+        result_cache.commit()
+    return probs
+
+
+@instrumentation.timed("predict_proba")
+def _predict_proba(X):
+    return clf.predict_proba(X)
+
+
+def _feature_matrix(documents):
+    # One row per document, columns in sorted
+    # feature-name order (same as score)
+    return vectorizer.transform(documents)
+
+
 
 if __name__ == "__main__":
 
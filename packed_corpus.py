@@ -0,0 +1,375 @@
+import os
+import json
+import weakref
+from array import array
+
+import numpy as np
+from scipy.sparse import coo_matrix
+
+from features import tokenizer
+from features import politeness_strategies
+from features.politeness_strategies import (ParseElement, parse_element, detect_strategies, fnc2feature_name,
+                                            ingestion_counts, remember_parse_elements, strategy_terms)
+from request_utils import is_request
+
+"""
+Packed binary corpus format.
+
+Documents are tokenized and their dependency parses
+ingested once, at conversion. All strings (tokens, parse
+words, tags, parse elements without positions) are interned
+in one string table, and the corpus is stored as flat
+typed .npy arrays, memory-mapped when read--
+
+    strings.npy, string_offsets.npy- utf-8 string table
+    text.npy, sentence_text_offsets.npy- utf-8 sentence text
+    tokens.npy, sentence_token_offsets.npy- token string ids
+    parse_records.npy- (n_elements, 6) int32: tag, head word,
+        head position, dependent word, dependent position,
+        element without positions (string ids; words lowercased)
+    parse_offsets.npy- per-parse (sentence) record offsets
+    document_sentence_offsets.npy, document_parse_offsets.npy-
+        per-document offsets into sentences and parses
+    document_ids.npy- string id of each document's JSON 'id' (-1: none)
+    scores.npy- each document's 'score' (NaN: none)
+    manifest.json- format version, counts and the name of
+        the tokenizer the tokens came from
+
+The reader vectorizes ranges of documents straight from the
+arrays (ngram columns by vectorized lookup of token ids) and
+runs the strategy extractor and request check on rebuilt
+ParseElements, without per-document dicts or regexes.
+
+Usage--
+    write_packed_corpus(documents, "corpus.packed")
+    corpus = PackedCorpus("corpus.packed")
+    X = corpus.transform(model.vectorizer, 0, 1000)
+"""
+
+# 2: parse elements with a single constituent are kept
+FORMAT_VERSION = 2
+
+
+class _StringTable(object):
+
+    def __init__(self):
+        self.ids = {}
+        self.blob = array('B')
+        self.offsets = array('l', [0])
+
+    def intern(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.ids)
+            self.blob.extend(array('B', _utf8(s)))
+            self.offsets.append(len(self.blob))
+        return i
+
+
+def _utf8(s):
+    return s.encode('utf-8') if isinstance(s, unicode) else s
+
+
+def _decode(b):
+    # unicode, as in JSON documents
+    return b.decode('utf-8')
+
+
+def _element_string(e):
+    if not e.complete:
+        return "%s(%s-%d)" % (e.tag, e.left, e.leftpos)
+    return "%s(%s-%d, %s-%d)" % (e.tag, e.left, e.leftpos, e.right, e.rightpos)
+
+
+def write_packed_corpus(documents, dirname, tokenize=None):
+    """
+    :param documents- iterable of document dicts with
+        'sentences' and 'parses' (optionally 'id', 'score')
+    :param tokenize- sentence tokenizer, as for the
+        vectorizer (default tokenizer.word_tokenize)
+    returns number of documents written
+    """
+    tokenize = tokenize or tokenizer.word_tokenize
+    strings = _StringTable()
+    text, sentence_text_offsets = array('B'), array('l', [0])
+    tokens, sentence_token_offsets = array('i'), array('l', [0])
+    records, parse_offsets = array('i'), array('l', [0])
+    document_sentence_offsets, document_parse_offsets = array('l', [0]), array('l', [0])
+    document_ids, scores = array('i'), array('d')
+    for d in documents:
+        for s in d['sentences']:
+            text.extend(array('B', _utf8(s)))
+            sentence_text_offsets.append(len(text))
+            tokens.extend(strings.intern(t) for t in tokenize(s))
+            sentence_token_offsets.append(len(tokens))
+        for parse in d['parses']:
+            for p in parse:
+                elem = parse_element(p)
+                if elem is None:
+                    ingestion_counts['malformed'] += 1
+                    continue
+                records.extend((strings.intern(elem.tag), strings.intern(elem.left), elem.leftpos,
+                                strings.intern(elem.right), elem.rightpos, strings.intern(elem.nonum)))
+            ingestion_counts['elements'] += len(parse)
+            parse_offsets.append(len(records) // 6)
+        document_sentence_offsets.append(len(sentence_token_offsets) - 1)
+        document_parse_offsets.append(len(parse_offsets) - 1)
+        document_ids.append(strings.intern(json.dumps(d['id'])) if 'id' in d else -1)
+        scores.append(float(d['score']) if d.get('score') is not None else np.nan)
+
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    save = lambda name, values, dtype: np.save(os.path.join(dirname, name), np.frombuffer(values, dtype=dtype)
+                                               if len(values) else np.zeros(0, dtype=dtype))
+    save("strings.npy", strings.blob, np.uint8)
+    save("string_offsets.npy", strings.offsets, np.int64)
+    save("text.npy", text, np.uint8)
+    save("sentence_text_offsets.npy", sentence_text_offsets, np.int64)
+    save("tokens.npy", tokens, np.int32)
+    save("sentence_token_offsets.npy", sentence_token_offsets, np.int64)
+    np.save(os.path.join(dirname, "parse_records.npy"),
+            (np.frombuffer(records, dtype=np.int32) if len(records) else np.zeros(0, dtype=np.int32)).reshape(-1, 6))
+    save("parse_offsets.npy", parse_offsets, np.int64)
+    save("document_sentence_offsets.npy", document_sentence_offsets, np.int64)
+    save("document_parse_offsets.npy", document_parse_offsets, np.int64)
+    save("document_ids.npy", document_ids, np.int32)
+    save("scores.npy", scores, np.float64)
+    n_documents = len(document_ids)
+    json.dump({
+        'format_version': FORMAT_VERSION,
+        'n_documents': n_documents,
+        'n_sentences': len(sentence_token_offsets) - 1,
+        'n_tokens': len(tokens),
+        'n_parse_elements': len(records) // 6,
+        'n_strings': len(strings.ids),
+        'tokenizer': tokenizer.tokenizer_name(tokenize),
+    }, open(os.path.join(dirname, "manifest.json"), 'w'), indent=2, sort_keys=True)
+    return n_documents
+
+
+class PackedCorpus(object):
+
+    """
+    Read-only, memory-mapped packed corpus
+    """
+
+    def __init__(self, dirname, mmap_mode='r'):
+        self.dirname = dirname
+        self.manifest = json.load(open(os.path.join(dirname, "manifest.json")))
+        if self.manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError("Unsupported packed corpus format version %s" % self.manifest['format_version'])
+        load = lambda name: np.load(os.path.join(dirname, name + ".npy"), mmap_mode=mmap_mode)
+        self.text = load("text")
+        self.sentence_text_offsets = load("sentence_text_offsets")
+        self.tokens = load("tokens")
+        self.sentence_token_offsets = load("sentence_token_offsets")
+        self.parse_records = load("parse_records")
+        self.parse_offsets = load("parse_offsets")
+        self.document_sentence_offsets = load("document_sentence_offsets")
+        self.document_parse_offsets = load("document_parse_offsets")
+        self.document_ids = load("document_ids")
+        self.scores = load("scores")
+        # The string table is decoded once, not per document
+        blob, offsets = load("strings").tostring(), load("string_offsets").tolist()
+        self.strings = [_decode(blob[offsets[i]:offsets[i + 1]]) for i in xrange(len(offsets) - 1)]
+        self._string_ids = None
+        # vectorizer --> (unigram column per string id,
+        #                 sorted bigram keys, their columns).
+        # Weak keys: an id() could be reused by a later
+        # vectorizer once this one is collected
+        self._columns = weakref.WeakKeyDictionary()
+
+    def __len__(self):
+        return len(self.document_ids)
+
+    def sentences(self, i):
+        s0, s1 = self.document_sentence_offsets[i], self.document_sentence_offsets[i + 1]
+        offsets = self.sentence_text_offsets[s0:s1 + 1].tolist()
+        text = self.text[offsets[0]:offsets[-1]].tostring()
+        base = offsets[0]
+        return [_decode(text[a - base:b - base]) for a, b in zip(offsets, offsets[1:])]
+
+    def tokens_of(self, i):
+        """
+        returns per-sentence token lists
+        """
+        s0, s1 = self.document_sentence_offsets[i], self.document_sentence_offsets[i + 1]
+        offsets = self.sentence_token_offsets[s0:s1 + 1].tolist()
+        ids = self.tokens[offsets[0]:offsets[-1]].tolist()
+        strings, base = self.strings, offsets[0]
+        return [[strings[t] for t in ids[a - base:b - base]] for a, b in zip(offsets, offsets[1:])]
+
+    def parse_elements(self, i):
+        """
+        returns per-sentence lists of ParseElements,
+        as get_parse_elements
+        """
+        p0, p1 = self.document_parse_offsets[i], self.document_parse_offsets[i + 1]
+        offsets = self.parse_offsets[p0:p1 + 1].tolist()
+        records = self.parse_records[offsets[0]:offsets[-1]].tolist()
+        strings, base = self.strings, offsets[0]
+        return [[ParseElement(strings[tag], strings[left], leftpos, strings[right], rightpos, strings[nonum])
+                 for tag, left, leftpos, right, rightpos, nonum in records[a - base:b - base]]
+                for a, b in zip(offsets, offsets[1:])]
+
+    def document_id(self, i):
+        sid = self.document_ids[i]
+        return None if sid < 0 else json.loads(self.strings[sid])
+
+    def document(self, i):
+        """
+        Document dict, for code that needs one. Its parse
+        elements are cached (see get_parse_elements), so
+        'parses' (rebuilt with lowercased words) is not re-ingested.
+        """
+        elements = self.parse_elements(i)
+        parses = [[_element_string(e) for e in parse] for parse in elements]
+        remember_parse_elements(parses, elements)
+        document = {'sentences': self.sentences(i), 'parses': parses}
+        if self.document_ids[i] >= 0:
+            document['id'] = self.document_id(i)
+        if not np.isnan(self.scores[i]):
+            document['score'] = float(self.scores[i])
+        return document
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.document(i)
+
+    def is_request(self, i):
+        return is_request(self.sentences(i), self.parse_elements(i))
+
+    def strategy_features(self, i):
+        """
+        returns list of (strategy fnc, 1 or 0), as
+        get_politeness_strategy_features
+        """
+        sentences = self.sentences(i)
+        parses = self.parse_elements(i)
+        if not sentences or not parses:
+            return []
+        # Term strategies see no terms in the vectorizer, unless
+        # in fixed-behavior mode (see MATCH_MULTIWORD_HEDGES)
+        terms = strategy_terms(self.tokens_of(i)) if politeness_strategies.MATCH_MULTIWORD_HEDGES else []
+        return detect_strategies(sentences, parses, terms)
+
+    def check_tokenizer(self, vectorizer):
+        """
+        Raises ValueError unless vectorizer tokenizes as the
+        stored tokens were (corpora written before the
+        tokenizer was recorded are not checked)
+        """
+        name = tokenizer.tokenizer_name(vectorizer.tokenize)
+        stored = self.manifest.get('tokenizer')
+        if stored is not None and stored != name:
+            raise ValueError("Corpus was tokenized with %s, the vectorizer uses %s" % (stored, name))
+
+    def _vectorizer_columns(self, vectorizer):
+        if vectorizer not in self._columns:
+            if self._string_ids is None:
+                self._string_ids = dict((s, i) for i, s in enumerate(self.strings))
+            n = len(self.strings)
+            unigram_columns = np.full(n, -1, dtype=np.int64)
+            for i, s in enumerate(self.strings):
+                column = vectorizer.unigram_columns.get(s)
+                if column is not None:
+                    unigram_columns[i] = column
+            keys, columns = [], []
+            for bigram, column in _iter_bigram_columns(vectorizer.bigram_columns):
+                a, b = self._string_ids.get(bigram[0]), self._string_ids.get(bigram[1])
+                if a is not None and b is not None:
+                    keys.append(a * n + b)
+                    columns.append(column)
+            keys, columns = np.asarray(keys, dtype=np.int64), np.asarray(columns, dtype=np.int64)
+            order = np.argsort(keys)
+            self._columns[vectorizer] = (unigram_columns, keys[order], columns[order])
+        return self._columns[vectorizer]
+
+    def transform(self, vectorizer, start=0, stop=None):
+        """
+        CSR matrix of documents [start, stop), with
+        the same rows as vectorizer.transform. The
+        vectorizer must use the corpus's tokenizer.
+        """
+        self.check_tokenizer(vectorizer)
+        stop = len(self) if stop is None else min(stop, len(self))
+        unigram_columns, bigram_keys, bigram_columns = self._vectorizer_columns(vectorizer)
+        n = len(self.strings)
+
+        # Ngrams: vectorized over all tokens in the range
+        s0, s1 = self.document_sentence_offsets[start], self.document_sentence_offsets[stop]
+        sentence_offsets = np.asarray(self.sentence_token_offsets[s0:s1 + 1])
+        t0, t1 = sentence_offsets[0], sentence_offsets[-1]
+        ids = np.asarray(self.tokens[t0:t1], dtype=np.int64)
+        document_offsets = sentence_offsets[np.asarray(self.document_sentence_offsets[start:stop + 1]) - s0] - t0
+        row_of_token = np.repeat(np.arange(stop - start), np.diff(document_offsets))
+        cols = unigram_columns[ids]
+        rows, columns = [row_of_token[cols >= 0]], [cols[cols >= 0]]
+        if len(ids) > 1 and len(bigram_keys):
+            pair_keys = ids[:-1] * n + ids[1:]
+            # A pair is a bigram unless the second token starts a sentence
+            within = np.ones(len(ids) - 1, dtype=bool)
+            starts = sentence_offsets[1:-1] - t0
+            within[starts[(starts > 0) & (starts < len(ids))] - 1] = False
+            idx = np.minimum(np.searchsorted(bigram_keys, pair_keys), len(bigram_keys) - 1)
+            found = within & (bigram_keys[idx] == pair_keys)
+            rows.append(row_of_token[:-1][found])
+            columns.append(bigram_columns[idx[found]])
+
+        # Strategies: one detection pass per document
+        strategy_rows, strategy_columns = [], []
+        for r, i in enumerate(xrange(start, stop)):
+            for fnc, present in self.strategy_features(i):
+                if present:
+                    strategy_rows.append(r)
+                    strategy_columns.append(vectorizer.strategy_columns[fnc2feature_name(fnc)])
+        rows.append(np.asarray(strategy_rows, dtype=np.int64))
+        columns.append(np.asarray(strategy_columns, dtype=np.int64))
+
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+        X = coo_matrix((np.ones(len(rows)), (rows, columns)),
+                       shape=(stop - start, len(vectorizer.feature_names))).tocsr()
+        # Repeated ngrams were summed; features are binary
+        X.data[:] = 1.0
+        X.sort_indices()
+        return X
+
+
+def _iter_bigram_columns(bigram_columns):
+    """
+    (bigram tuple, column) pairs of a dict or MappedVocabulary
+    """
+    if isinstance(bigram_columns, dict):
+        return bigram_columns.iteritems()
+    from features.vocabulary import BIGRAM_SEPARATOR
+    return ((tuple(_decode(k).split(BIGRAM_SEPARATOR, 1)), int(c))
+            for k, c in zip(bigram_columns.keys, bigram_columns.columns))
+
+
+
+if __name__ == "__main__":
+
+    """
+    Pack the test documents and check the reader's
+    rows, request checks and scores against the dicts
+    """
+
+    import copy
+    import shutil
+    import tempfile
+    import model
+    from request_utils import check_is_request
+    from test_documents import TEST_DOCUMENTS
+
+    dirname = tempfile.mkdtemp()
+    try:
+        write_packed_corpus(TEST_DOCUMENTS, dirname)
+        corpus = PackedCorpus(dirname)
+        model.ensure_loaded()
+        X = model.vectorizer.transform(copy.deepcopy(TEST_DOCUMENTS))
+        print "Rows identical: %s" % ((corpus.transform(model.vectorizer) != X).nnz == 0)
+        print "Requests identical: %s" % ([corpus.is_request(i) for i in xrange(len(corpus))] ==
+                                          [check_is_request(copy.deepcopy(d)) for d in TEST_DOCUMENTS])
+        print "Scores:", model.score_packed(corpus, as_dicts=False)[:, 1]
+    finally:
+        shutil.rmtree(dirname)
@@ -0,0 +1,101 @@
+import multiprocessing
+import numpy as np
+from itertools import islice
+from collections import deque
+
+import model
+
+"""
+Multi-process scoring.
+
+Tokenization and strategy detection are CPU-bound
+python, so a single scoring loop uses one core.
+ScoringPool forks worker processes after the model
+and vectorizer are loaded in the parent, so workers
+inherit them (copy-on-write) instead of unpickling
+their own. Documents are sent to workers in chunks,
+and results come back in input order.
+"""
+
+
+def _score_chunk(chunk):
+    # Runs in a worker: model.clf and model.vectorizer
+    # were inherited from the parent at fork time
+    return model.score_batch(chunk, chunksize=len(chunk), as_dicts=False)
+
+
+class ScoringPool(object):
+
+    """
+    Usage--
+        pool = ScoringPool(processes=8)
+        probs = pool.score(documents)
+        pool.close()
+    """
+
+    def __init__(self, processes=None, chunksize=500):
+        """
+        :param processes- number of worker processes
+            (default: multiprocessing.cpu_count())
+        :param chunksize- documents per task sent to a worker
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        # Fork only after model state is in the parent
+        model.ensure_loaded()
+        self._pool = multiprocessing.Pool(self.processes)
+
+    def imap_score(self, documents):
+        """
+        Generator over (n_chunk_documents, 2) probability
+        arrays, one per chunk, in input order. At most two
+        chunks per worker are in flight, so documents can
+        be a long iterator.
+        """
+        documents = iter(documents)
+        pending = deque()
+        max_pending = 2 * self.processes
+        while True:
+            chunk = list(islice(documents, self.chunksize))
+            if chunk:
+                pending.append(self._pool.apply_async(_score_chunk, (chunk,)))
+            if pending and (not chunk or len(pending) >= max_pending):
+                yield pending.popleft().get()
+            elif not chunk:
+                break
+
+    def score(self, documents, as_dicts=True):
+        """
+        Scores documents across the worker processes.
+        Same return format as model.score_batch.
+        """
+        probs = []
+        for chunk_probs in self.imap_score(documents):
+            if as_dicts:
+                probs.extend({"polite": p[1], "impolite": p[0]} for p in chunk_probs)
+            else:
+                probs.append(chunk_probs)
+        if as_dicts:
+            return probs
+        return np.vstack(probs) if probs else np.zeros((0, 2))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self._pool.terminate()
+
+
+def score_parallel(documents, processes=None, chunksize=500, as_dicts=True):
+    """
+    One-off parallel scoring with a temporary ScoringPool
+    """
+    with ScoringPool(processes, chunksize) as pool:
+        return pool.score(documents, as_dicts=as_dicts)
@@ -1,6 +1,6 @@
 
 
-from features.politeness_strategies import check_elems_for_strategy, initial_polar, aux_polar
+from features.politeness_strategies import check_elems_for_strategy, get_parse_elements, initial_polar, aux_polar
 
 
 def check_is_request(document):
@@ -14,7 +14,15 @@ def check_is_request(document):
         'sentences' and 'parses', as
         in other parts of the system
     """
-    for sentence, parse in zip(document['sentences'], document['parses']):
+    return is_request(document['sentences'], get_parse_elements(document))
+
+
+def is_request(sentences, parses):
+    """
+    check_is_request on sentences and their
+    ingested parses (see get_parse_elements)
+    """
+    for sentence, parse in zip(sentences, parses):
         if "?" in sentence:
             return True
         if check_elems_for_strategy(parse, initial_polar) or check_elems_for_strategy(parse, aux_polar):
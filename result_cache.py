@@ -0,0 +1,132 @@
+import json
+import hashlib
+
+import numpy as np
+
+from features import tokenizer, politeness_strategies
+from features.cache import LRUCache, SqliteCache
+
+"""
+Content-addressed cache of model.score results.
+
+Results are keyed by a sha1 of the document's
+'sentences' and 'parses' plus the model version
+(a hash of the model parameters, feature names and
+the options that change feature values),
+so byte-identical documents are scored once, and
+switching models never returns stale results.
+
+An in-memory LRU sits in front of an optional sqlite
+file, which several processes can share.
+
+Usage--
+    from politeness import model
+    model.use_result_cache(maxsize=100000, filename="scores.sqlite")
+    model.score_batch(documents)
+    model.result_cache.stats()
+"""
+
+
+def feature_options(vectorizer):
+    """
+    Settings besides the columns that change a document's
+    features: the vectorizer's tokenizer and the strategy
+    matcher options
+    """
+    return tokenizer.tokenizer_name(vectorizer.tokenize), politeness_strategies.MATCH_MULTIWORD_HEDGES
+
+
+def model_version(clf, vectorizer):
+    """
+    sha1 of the linear model parameters, the feature
+    names (column order) and feature_options
+    """
+    version = hashlib.sha1(type(clf).__name__)
+    for attr in ('coef_', 'intercept_', 'probA_', 'probB_'):
+        value = getattr(clf, attr, None)
+        if value is None:
+            continue
+        if hasattr(value, 'toarray'):
+            value = value.toarray()
+        version.update(np.ascontiguousarray(value, dtype=np.float64).tostring())
+    for f in vectorizer.feature_names:
+        version.update(str(f))
+        version.update("\n")
+    version.update(json.dumps(feature_options(vectorizer)))
+    return version.hexdigest()
+
+
+def document_key(document, version):
+    """
+    Stable across processes and runs: sha1 of
+    canonical JSON of sentences and parses
+    """
+    content = json.dumps([document['sentences'], document['parses']], separators=(',', ':'))
+    return hashlib.sha1(version + content).hexdigest()
+
+
+class ResultCache(object):
+
+    """
+    LRU in memory, optionally backed by a shared
+    sqlite file. Values are (P(impolite), P(polite)).
+    """
+
+    def __init__(self, maxsize=100000, filename=None):
+        """
+        :param maxsize- max results kept in memory
+        :param filename- optional sqlite file shared
+            between processes (see features/cache.py)
+        """
+        self.memory = LRUCache(maxsize)
+        self.shared = SqliteCache(filename, table="results") if filename else None
+        self.hits = 0
+        self.misses = 0
+        # Documents not scored because an identical
+        # one was already in the same batch
+        self.deduplicated = 0
+
+    key = staticmethod(document_key)
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.shared is not None:
+            self.shared.put(key, value)
+
+    def commit(self):
+        """
+        Write buffered puts to the shared file, so other
+        processes see them (model.score_batch calls this
+        after each batch)
+        """
+        if self.shared is not None:
+            self.shared.commit()
+
+    def close(self):
+        if self.shared is not None:
+            self.shared.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'deduplicated': self.deduplicated,
+            'memory': self.memory.stats(),
+        }
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
@@ -0,0 +1,153 @@
+import sys
+import copy
+import json
+import time
+import resource
+import platform
+import argparse
+
+import numpy as np
+
+from politeness import model
+from politeness.request_utils import check_is_request
+from politeness.features import tokenizer
+from politeness.features.vectorizer import PolitenessFeatureVectorizer, get_unigrams_and_bigrams
+from politeness.features.politeness_strategies import get_politeness_strategy_features
+from politeness.scripts.synthetic_corpus import generate_corpus
+
+"""
+Per-stage benchmark suite.
+
+Times each stage of scoring separately over a synthetic
+corpus (see synthetic_corpus.py)--
+    tokenize- get_unigrams_and_bigrams
+    term_features- PolitenessFeatureVectorizer._get_term_features
+        (includes its tokenization)
+    strategies- get_politeness_strategy_features
+        (includes parse ingestion)
+    is_request- check_is_request
+    predict_proba- clf.predict_proba on a single-row matrix
+    score- model.score, end to end
+    score_batch- model.score_batch, whole corpus (throughput only)
+and writes a JSON report with docs/sec, p50/p99 latency
+per stage and peak RSS, to diff between releases.
+
+Tokenization is uncached by default, since the synthetic
+corpus repeats sentences far more than real traffic.
+
+Usage:
+    python -m politeness.scripts.benchmark --documents 5000 -o report.json
+"""
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q)) * 1000.0
+
+
+def summarize(latencies):
+    total = sum(latencies)
+    return {
+        'docs_per_sec': len(latencies) / total if total else None,
+        'p50_ms': percentile_ms(latencies, 50),
+        'p99_ms': percentile_ms(latencies, 99),
+        'total_s': total,
+    }
+
+
+def time_stage(fnc, documents):
+    """
+    fnc is called on a fresh copy of each document,
+    so per-document caches (parse ingestion) don't carry over
+    """
+    documents = [copy.deepcopy(d) for d in documents]
+    latencies = []
+    for d in documents:
+        start = time.time()
+        fnc(d)
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def run(documents, tokenize):
+    vectorizer = PolitenessFeatureVectorizer(tokenize=tokenize)
+    model.ensure_loaded()
+    model.vectorizer = vectorizer
+
+    def tokenize_stage(d):
+        unigrams, bigrams = get_unigrams_and_bigrams(d, tokenize)
+        list(unigrams), list(bigrams)
+
+    def strategies_stage(d):
+        get_politeness_strategy_features(d)
+
+    # Strategy/predict stages get their inputs prepared
+    # outside the timed region
+    prepared = []
+    for d in documents:
+        d = copy.deepcopy(d)
+        d['unigrams'] = list(get_unigrams_and_bigrams(d, tokenize)[0])
+        prepared.append(d)
+    rows = [vectorizer.transform([copy.deepcopy(d)]) for d in documents]
+
+    stages = {}
+    stages['tokenize'] = summarize(time_stage(tokenize_stage, documents))
+    stages['term_features'] = summarize(time_stage(vectorizer._get_term_features, documents))
+    stages['strategies'] = summarize(time_stage(strategies_stage, prepared))
+    stages['is_request'] = summarize(time_stage(check_is_request, documents))
+    latencies = []
+    for X in rows:
+        start = time.time()
+        model.clf.predict_proba(X)
+        latencies.append(time.time() - start)
+    stages['predict_proba'] = summarize(latencies)
+    stages['score'] = summarize(time_stage(model.score, documents))
+
+    batch = [copy.deepcopy(d) for d in documents]
+    start = time.time()
+    model.score_batch(batch)
+    elapsed = time.time() - start
+    stages['score_batch'] = {'docs_per_sec': len(documents) / elapsed, 'total_s': elapsed}
+    return stages
+
+
+def report(documents, args, stages):
+    import sklearn
+    return {
+        'meta': {
+            'n_documents': len(documents),
+            'max_sentences': args.max_sentences,
+            'seed': args.seed,
+            'tokenizer': args.tokenizer,
+            'cached_tokenizer': args.cached,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        'stages': stages,
+        # ru_maxrss is in KB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    }
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Per-stage politeness scoring benchmark")
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--max-sentences", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tokenizer", choices=sorted(tokenizer.TOKENIZERS), default="nltk")
+    parser.add_argument("--cached", action="store_true", help="use an LRU-cached tokenizer")
+    parser.add_argument("-o", "--output", default="-", help="JSON report file ('-' for stdout)")
+    args = parser.parse_args()
+
+    documents = list(generate_corpus(args.documents, args.max_sentences, seed=args.seed))
+    tokenize = tokenizer.TOKENIZERS[args.tokenizer]
+    if args.cached:
+        tokenize = tokenizer.CachedTokenizer(tokenize)
+
+    result = report(documents, args, run(documents, tokenize))
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    json.dump(result, out, indent=2, sort_keys=True)
+    out.write("\n")
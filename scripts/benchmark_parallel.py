@@ -0,0 +1,51 @@
+import sys
+import time
+import multiprocessing
+
+from politeness import model
+from politeness.parallel import ScoringPool
+
+"""
+Benchmark: scoring throughput per worker count.
+
+Usage:
+    python -m politeness.scripts.benchmark_parallel [n_documents] [worker counts...]
+"""
+
+
+def benchmark(documents, worker_counts, chunksize=500):
+    """
+    returns list of (workers, seconds, docs/sec)
+    """
+    results = []
+    for n in worker_counts:
+        with ScoringPool(processes=n, chunksize=chunksize) as pool:
+            start = time.time()
+            pool.score(documents, as_dicts=False)
+            elapsed = time.time() - start
+        results.append((n, elapsed, len(documents) / elapsed))
+    return results
+
+
+
+if __name__ == "__main__":
+
+    from politeness.scripts.synthetic_corpus import generate_corpus
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    worker_counts = map(int, sys.argv[2:])
+    if not worker_counts:
+        cpus = multiprocessing.cpu_count()
+        worker_counts = sorted(set([1, 2, 4, 8, 16, 32, cpus]))
+        worker_counts = filter(lambda w: w <= cpus, worker_counts)
+
+    documents = list(generate_corpus(n))
+
+    start = time.time()
+    model.score_batch(documents, as_dicts=False)
+    serial = len(documents) / (time.time() - start)
+    print "Documents: %d" % n
+    print "%8s %10s %12s %8s" % ("workers", "seconds", "docs/sec", "speedup")
+    print "%8s %10s %12.0f %8s" % ("serial", "", serial, "1.0x")
+    for workers, elapsed, rate in benchmark(documents, worker_counts):
+        print "%8d %10.2f %12.0f %7.1fx" % (workers, elapsed, rate, rate / serial)
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import subprocess
+
+"""
+Benchmark: cold start. Each scenario runs in a fresh
+python process and reports time to import and time
+to the first result.
+
+    request_utils- import request_utils, one check_is_request
+    model- import model, one score (loads the pickled SVM)
+    compiled_model- import model, use_compiled_model, one score
+        (requires politeness-linear.npz, see compiled_model.py)
+
+Usage:
+    python -m politeness.scripts.benchmark_startup [repeats]
+"""
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = [
+    ("request_utils", "import request_utils", "request_utils.check_is_request(doc)"),
+    ("model", "import model", "model.score(doc)"),
+    ("compiled_model", "import model", "model.use_compiled_model(); model.score(doc)"),
+]
+
+TEMPLATE = """
+import time, json
+start = time.time()
+%s
+imported = time.time()
+from test_documents import TEST_DOCUMENTS
+doc = dict(TEST_DOCUMENTS[0])
+%s
+done = time.time()
+print json.dumps({"import": imported - start, "first_result": done - start})
+"""
+
+
+def run_scenario(import_stmt, first_call):
+    # Run from the package dir, as with `python model.py`
+    code = TEMPLATE % (import_stmt, first_call)
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=PACKAGE_DIR)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+
+if __name__ == "__main__":
+
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print "%-16s %12s %16s" % ("scenario", "import (s)", "first result (s)")
+    for name, import_stmt, first_call in SCENARIOS:
+        try:
+            runs = [run_scenario(import_stmt, first_call) for _ in xrange(repeats)]
+        except subprocess.CalledProcessError:
+            print "%-16s %12s %16s" % (name, "failed", "")
+            continue
+        best_import = min(r["import"] for r in runs)
+        best_first = min(r["first_result"] for r in runs)
+        print "%-16s %12.3f %16.3f" % (name, best_import, best_first)
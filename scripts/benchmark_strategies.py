@@ -0,0 +1,51 @@
+import sys
+import time
+
+from politeness.features.politeness_strategies import DEPENDENCY_STRATEGIES, check_elems_for_strategy, get_strategy_engine, ingest_parses
+
+"""
+Benchmark: dependency strategy detection with
+the compiled StrategyEngine vs. calling every
+strategy lambda on every parse element.
+"""
+
+
+def lambda_loop(parses):
+    return [int(check_elems_for_strategy(parses, lambda p: check_elems_for_strategy(p, fnc))) for fnc in DEPENDENCY_STRATEGIES]
+
+
+def benchmark(documents, repeats=3):
+    """
+    :param documents- list of documents with 'parses'
+    returns (lambda loop seconds, engine seconds), best of `repeats`
+    """
+    parses = [ingest_parses(d['parses']) for d in documents]
+    engine = get_strategy_engine()
+    for ps in parses:
+        assert lambda_loop(ps) == engine.detect(ps)
+    timings = []
+    for fnc in (lambda_loop, engine.detect):
+        best = None
+        for _ in xrange(repeats):
+            start = time.time()
+            for ps in parses:
+                fnc(ps)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+    return tuple(timings)
+
+
+
+if __name__ == "__main__":
+
+    from politeness.scripts.synthetic_corpus import generate_corpus
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    documents = list(generate_corpus(n))
+
+    lambda_time, engine_time = benchmark(documents)
+    print "Documents: %d" % n
+    print "Lambda loop: %.3fs (%.0f docs/sec)" % (lambda_time, n / lambda_time)
+    print "Engine:      %.3fs (%.0f docs/sec)" % (engine_time, n / engine_time)
+    print "Speedup:     %.1fx" % (lambda_time / engine_time)
@@ -0,0 +1,77 @@
+import sys
+import json
+import time
+
+import nltk
+
+from politeness.features.tokenizer import nltk_tokenize, regex_tokenize
+from politeness.features.vectorizer import PolitenessFeatureVectorizer
+
+"""
+Conformance check: tokenizer.regex_tokenize vs nltk.word_tokenize.
+
+Reports, over a set of sentences--
+    - exact agreement: identical token lists
+    - feature agreement: identical sets of vocabulary
+      unigrams/bigrams (featunigrams.p / featbigrams.p),
+      i.e. identical term features
+and the speed of both tokenizers.
+
+Usage:
+    python -m politeness.scripts.check_tokenizer [documents.jsonl]
+"""
+
+
+def compare(sentences, vectorizer):
+    exact, same_features = 0, 0
+    mismatches = []
+    for s in sentences:
+        a, b = nltk_tokenize(s), regex_tokenize(s)
+        if a == b:
+            exact += 1
+            same_features += 1
+            continue
+        fa = vocabulary_ngrams(a, vectorizer)
+        fb = vocabulary_ngrams(b, vectorizer)
+        if fa == fb:
+            same_features += 1
+        else:
+            mismatches.append((s, a, b))
+    return exact, same_features, mismatches
+
+
+def vocabulary_ngrams(tokens, vectorizer):
+    unigrams = set(t for t in tokens if t in vectorizer.unigram_columns)
+    bigrams = set(b for b in nltk.bigrams(tokens) if b in vectorizer.bigram_columns)
+    return unigrams, bigrams
+
+
+def timeit(tokenize, sentences):
+    start = time.time()
+    for s in sentences:
+        tokenize(s)
+    return time.time() - start
+
+
+
+if __name__ == "__main__":
+
+    from politeness.test_documents import TEST_DOCUMENTS
+
+    if len(sys.argv) > 1:
+        documents = (json.loads(line) for line in open(sys.argv[1]) if line.strip())
+    else:
+        documents = TEST_DOCUMENTS
+    sentences = [s for d in documents for s in d['sentences']]
+
+    vectorizer = PolitenessFeatureVectorizer()
+    exact, same_features, mismatches = compare(sentences, vectorizer)
+    n = len(sentences)
+
+    print "Sentences: %d" % n
+    print "Exact token agreement:   %.4f" % (float(exact) / n)
+    print "Term feature agreement:  %.4f" % (float(same_features) / n)
+    print "nltk:  %.0f sentences/sec" % (n / max(timeit(nltk_tokenize, sentences), 1e-9))
+    print "regex: %.0f sentences/sec" % (n / max(timeit(regex_tokenize, sentences), 1e-9))
+    for s, a, b in mismatches[:10]:
+        print "\n%s\n\tnltk:  %s\n\tregex: %s" % (s, a, b)
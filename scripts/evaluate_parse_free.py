@@ -0,0 +1,126 @@
+import sys
+import copy
+import json
+import time
+import argparse
+
+import numpy as np
+
+from politeness import model
+from politeness.request_utils import check_is_request
+from politeness.features.parse_free import add_pseudo_parses, text_to_document
+from politeness.features.politeness_strategies import DEPENDENCY_STRATEGIES, fnc2feature_name
+
+"""
+Evaluation harness for parse-free scoring (features/parse_free.py).
+
+Scores each document twice: with its real dependency parses,
+and with pseudo parses built from its tokens. Reports--
+    per dependency strategy: agreement, and precision/recall
+        of the parse-free signal against the parse-based one
+    check_is_request agreement
+    P(polite) drift: mean, p50, p99 and max absolute difference,
+        and the rate of polite/impolite decision flips
+    if documents have a 'score' label: accuracy of both
+    time to build pseudo parses per document
+
+By default sentences are kept as split in the input; with
+--from-text, each document's 'text' is re-split as well.
+
+Usage:
+    python -m politeness.scripts.evaluate_parse_free labeled.jsonl -o report.json
+    python -m politeness.scripts.evaluate_parse_free --documents 2000
+"""
+
+
+def parse_free_copy(document, from_text=False):
+    if from_text:
+        return text_to_document(document['text'])
+    return add_pseudo_parses({'sentences': list(document['sentences'])})
+
+
+def strategy_report(parsed, fast):
+    """
+    :param parsed, fast- (n_documents, n_strategies) 0/1 arrays
+    """
+    report = {}
+    for j, fnc in enumerate(DEPENDENCY_STRATEGIES):
+        p, f = parsed[:, j], fast[:, j]
+        both = float((p & f).sum())
+        report[fnc.__name__] = {
+            'agreement': float((p == f).mean()),
+            'parse_positive': int(p.sum()),
+            'parse_free_positive': int(f.sum()),
+            'precision': both / f.sum() if f.sum() else None,
+            'recall': both / p.sum() if p.sum() else None,
+        }
+    return report
+
+
+def evaluate(documents, from_text=False):
+    model.ensure_loaded()
+    vectorizer = model.vectorizer
+    names = [fnc2feature_name(fnc) for fnc in DEPENDENCY_STRATEGIES]
+
+    start = time.time()
+    fast_documents = [parse_free_copy(d, from_text) for d in documents]
+    parse_seconds = time.time() - start
+
+    parsed, fast, parsed_requests, fast_requests = [], [], [], []
+    for d, fd in zip(documents, fast_documents):
+        features = vectorizer.features(copy.deepcopy(d))
+        parsed.append([features[n] for n in names])
+        features = vectorizer.features(copy.deepcopy(fd))
+        fast.append([features[n] for n in names])
+        parsed_requests.append(check_is_request(copy.deepcopy(d)))
+        fast_requests.append(check_is_request(copy.deepcopy(fd)))
+    parsed, fast = np.asarray(parsed, dtype=int), np.asarray(fast, dtype=int)
+
+    p_parsed = model.score_batch(copy.deepcopy(documents), as_dicts=False)[:, 1]
+    p_fast = model.score_batch(fast_documents, as_dicts=False)[:, 1]
+    drift = np.abs(p_parsed - p_fast)
+
+    report = {
+        'n_documents': len(documents),
+        'from_text': from_text,
+        'strategies': strategy_report(parsed, fast),
+        'is_request_agreement': float(np.mean(np.asarray(parsed_requests) == np.asarray(fast_requests))),
+        'probability_drift': {
+            'mean': float(drift.mean()),
+            'p50': float(np.percentile(drift, 50)),
+            'p99': float(np.percentile(drift, 99)),
+            'max': float(drift.max()),
+            'decision_flip_rate': float(np.mean((p_parsed > 0.5) != (p_fast > 0.5))),
+        },
+        'pseudo_parse_ms_per_document': parse_seconds / len(documents) * 1000.0,
+    }
+    if all('score' in d for d in documents):
+        labels = np.asarray([d['score'] > 0.0 for d in documents])
+        report['accuracy'] = {
+            'parsed': float(np.mean((p_parsed > 0.5) == labels)),
+            'parse_free': float(np.mean((p_fast > 0.5) == labels)),
+        }
+    return report
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Evaluate parse-free scoring against parse-based scoring")
+    parser.add_argument("input", nargs="?", help="JSONL file of documents (default: synthetic corpus)")
+    parser.add_argument("--documents", type=int, default=1000, help="synthetic corpus size")
+    parser.add_argument("--from-text", action="store_true", help="re-split each document's 'text' into sentences")
+    parser.add_argument("-o", "--output", default="-", help="JSON report file ('-' for stdout)")
+    args = parser.parse_args()
+
+    if args.input:
+        from politeness.scripts.score_jsonl import read_documents
+        documents = list(read_documents(open(args.input)))
+    else:
+        from politeness.scripts.synthetic_corpus import generate_corpus
+        documents = list(generate_corpus(args.documents))
+
+    result = evaluate(documents, args.from_text)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    json.dump(result, out, indent=2, sort_keys=True)
+    out.write("\n")
@@ -0,0 +1,49 @@
+import sys
+import json
+import time
+import argparse
+from itertools import islice
+
+from politeness import model
+from politeness.feature_bits import FeatureBitsWriter, FeatureBits
+from politeness.scripts.score_jsonl import read_documents
+
+"""
+Vectorize JSON-lines documents into a bit-packed feature
+directory (see politeness/feature_bits.py), one chunk at
+a time, and optionally score the stored rows.
+
+Usage:
+    python -m politeness.scripts.extract_features requests.jsonl features.bits
+    python -m politeness.scripts.extract_features requests.jsonl features.bits --score scores.jsonl
+"""
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Store document feature vectors as packed bits")
+    parser.add_argument("input", help="JSONL file of documents ('-' for stdin)")
+    parser.add_argument("output", help="feature directory")
+    parser.add_argument("--score", help="also score the stored rows into this JSONL file ('-' for stdout)")
+    parser.add_argument("--chunksize", type=int, default=1000)
+    args = parser.parse_args()
+
+    model.ensure_loaded()
+    start = time.time()
+    documents = read_documents(sys.stdin if args.input == "-" else open(args.input))
+    writer = FeatureBitsWriter(args.output, model.vectorizer.feature_names)
+    while True:
+        chunk = list(islice(documents, args.chunksize))
+        if not chunk:
+            break
+        writer.write(model.vectorizer.transform(chunk))
+    manifest = writer.close()
+    print >> sys.stderr, "Stored %d rows (%d bytes each) in %.1fs" % (manifest['n_rows'], manifest['row_bytes'], time.time() - start)
+
+    if args.score:
+        stored = FeatureBits(args.output)
+        stored.check_feature_names(model.vectorizer.feature_names)
+        out = sys.stdout if args.score == "-" else open(args.score, "w")
+        for p in stored.predict_proba(model.clf):
+            out.write(json.dumps({"polite": p[1], "impolite": p[0]}) + "\n")
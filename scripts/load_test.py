@@ -0,0 +1,134 @@
+import sys
+import json
+import time
+import httplib
+import argparse
+import threading
+import urlparse
+
+import numpy as np
+
+from politeness.scripts.synthetic_corpus import generate_corpus
+
+"""
+Load test for the scoring server (see politeness/server.py).
+
+Sends synthetic documents (see synthetic_corpus.py) to
+POST /score from `concurrency` client threads, one
+document per request over keep-alive connections, and
+reports throughput, client-side latency percentiles and
+the server's mean micro-batch size.
+
+With --start-server, a server is started in this process
+on a free localhost port; --compare then also runs with
+max batch size 1, i.e. without coalescing.
+
+Usage:
+    python -m politeness.server --port 8000 &
+    python -m politeness.scripts.load_test --url http://127.0.0.1:8000 --concurrency 32
+    python -m politeness.scripts.load_test --start-server --compare
+"""
+
+
+def _client(host, port, documents, latencies, errors):
+    connection = httplib.HTTPConnection(host, port)
+    for d in documents:
+        body = json.dumps(d)
+        start = time.time()
+        try:
+            connection.request("POST", "/score", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (httplib.HTTPException, IOError) as e:
+            errors.append(str(e))
+            connection.close()
+            connection = httplib.HTTPConnection(host, port)
+            continue
+        latencies.append(time.time() - start)
+    connection.close()
+
+
+def get_metrics(host, port):
+    connection = httplib.HTTPConnection(host, port)
+    connection.request("GET", "/metrics")
+    metrics = json.loads(connection.getresponse().read())
+    connection.close()
+    return metrics
+
+
+def run(host, port, documents, concurrency=16):
+    """
+    returns report dict
+    """
+    # Request bodies only carry what the server needs
+    documents = [{'sentences': d['sentences'], 'parses': d['parses']} for d in documents]
+    latencies, errors = [], []
+    threads = [threading.Thread(target=_client, args=(host, port, documents[i::concurrency], latencies, errors))
+               for i in xrange(concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    metrics = get_metrics(host, port)
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000.0 if latencies else None,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000.0 if latencies else None,
+        'server_mean_batch_size': metrics.get('mean_batch_size'),
+    }
+
+
+def run_local(documents, concurrency, max_batch_size, max_wait):
+    """
+    Start a server on a free port, run the load test against it
+    """
+    from politeness.server import make_server
+    server = make_server(port=0, max_batch_size=max_batch_size, max_wait=max_wait)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        host, port = server.server_address
+        report = run(host, port, documents, concurrency)
+    finally:
+        server.shutdown()
+        server.server_close()
+    report['max_batch_size'] = max_batch_size
+    report['max_wait_s'] = max_wait
+    return report
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Load test the politeness scoring server")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--start-server", action="store_true", help="start a server in this process")
+    parser.add_argument("--compare", action="store_true",
+                        help="with --start-server, also run without coalescing")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents = list(generate_corpus(args.requests, seed=args.seed))
+    if args.start_server:
+        reports = [run_local(documents, args.concurrency, args.max_batch_size, args.max_wait)]
+        if args.compare:
+            reports.append(run_local(documents, args.concurrency, 1, 0.0))
+    else:
+        url = urlparse.urlparse(args.url)
+        reports = [run(url.hostname, url.port or 80, documents, args.concurrency)]
+
+    json.dump(reports if len(reports) > 1 else reports[0], sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
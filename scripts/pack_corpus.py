@@ -0,0 +1,45 @@
+import sys
+import json
+import time
+import argparse
+
+from politeness import model
+from politeness.packed_corpus import write_packed_corpus, PackedCorpus
+from politeness.scripts.score_jsonl import read_documents
+
+"""
+Convert JSON-lines documents to a packed corpus
+directory (see politeness/packed_corpus.py), and
+optionally score it.
+
+Usage:
+    python -m politeness.scripts.pack_corpus requests.jsonl corpus.packed
+    python -m politeness.scripts.pack_corpus requests.jsonl corpus.packed --score scores.jsonl
+"""
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Pack JSON-lines documents into a memory-mapped corpus")
+    parser.add_argument("input", help="JSONL file of documents ('-' for stdin)")
+    parser.add_argument("output", help="packed corpus directory")
+    parser.add_argument("--score", help="also score the packed corpus into this JSONL file ('-' for stdout)")
+    parser.add_argument("--chunksize", type=int, default=1000)
+    args = parser.parse_args()
+
+    start = time.time()
+    lines = sys.stdin if args.input == "-" else open(args.input)
+    n = write_packed_corpus(read_documents(lines), args.output)
+    corpus = PackedCorpus(args.output)
+    print >> sys.stderr, "Packed %d documents in %.1fs: %s" % (n, time.time() - start, json.dumps(corpus.manifest, sort_keys=True))
+
+    if args.score:
+        start = time.time()
+        out = sys.stdout if args.score == "-" else open(args.score, "w")
+        for i, result in enumerate(model.score_packed(corpus, args.chunksize)):
+            document_id = corpus.document_id(i)
+            if document_id is not None:
+                result['id'] = document_id
+            out.write(json.dumps(result) + "\n")
+        print >> sys.stderr, "Scored %d documents in %.1fs" % (n, time.time() - start)
@@ -0,0 +1,172 @@
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+
+import numpy as np
+
+from politeness import model
+from politeness.artifacts import write_artifact
+from politeness.compiled_model import LinearPolitenessModel
+from politeness.features.vectorizer import PolitenessFeatureVectorizer
+from politeness.features.politeness_strategies import POLITENESS_FEATURES
+
+"""
+Weight pruning of the linear politeness model.
+
+Drops unigram/bigram features whose absolute weight in
+the SVM is below a threshold, or outside the top-k by
+absolute weight. Strategy features are always kept (the
+strategy extractor computes all of them anyway). A dropped
+feature is one whose weight is treated as zero, so the
+pruned model keeps the intercept and Platt sigmoid of
+the full model.
+
+Each pruned model is written as an artifact (see
+politeness/artifacts.py): a vocabulary of the surviving
+ngrams plus matching weights, for model.use_artifact.
+The vectorizer then only looks up and indexes those ngrams.
+
+The report compares every pruning level with the full model
+on evaluation documents: agreement, P(polite) drift,
+accuracy (if documents have a 'score') and documents per
+second vectorized and scored (tokenizations are cached by
+a warm-up pass, so this measures lookup and scoring).
+
+Usage:
+    python -m politeness.scripts.prune_model --thresholds 0.01 0.05 --top-k 500 200 -o report.json
+    python -m politeness.scripts.prune_model labeled.jsonl --top-k 300 --artifact-dir pruned-models
+"""
+
+
+def prune(compiled, vectorizer, threshold=0.0, top_k=None):
+    """
+    :param compiled- LinearPolitenessModel, with weights
+        in vectorizer's column order
+    :param vectorizer- PolitenessFeatureVectorizer built from
+        ngram lists (not an artifact)
+    :param threshold- drop ngrams with |weight| < threshold
+    :param top_k- keep at most top_k ngrams, by |weight|
+
+    returns (pruned LinearPolitenessModel, pruned vectorizer)
+    """
+    weights = np.abs(compiled.coef_)
+    ngrams = [(u, True, c) for u, c in vectorizer.unigram_columns.iteritems()]
+    ngrams.extend((b, False, c) for b, c in vectorizer.bigram_columns.iteritems())
+    kept = [(ngram, is_unigram, c) for ngram, is_unigram, c in ngrams if weights[c] >= threshold]
+    if top_k is not None:
+        # Ties broken by column, so pruning is deterministic
+        kept = sorted(kept, key=lambda (ngram, is_unigram, c): (-weights[c], c))[:top_k]
+    unigrams = sorted(ngram for ngram, is_unigram, c in kept if is_unigram)
+    bigrams = sorted(ngram for ngram, is_unigram, c in kept if not is_unigram)
+    pruned_vectorizer = PolitenessFeatureVectorizer(tokenize=vectorizer.tokenize, ngrams=(unigrams, bigrams))
+
+    columns = sorted([c for _, _, c in kept] + [vectorizer.strategy_columns[f] for f in POLITENESS_FEATURES])
+    if [vectorizer.feature_names[c] for c in columns] != pruned_vectorizer.feature_names:
+        raise ValueError("Pruned columns do not match the pruned vectorizer's column order")
+    pruned = LinearPolitenessModel(compiled.coef_[columns], compiled.intercept_, compiled.probA_,
+                                   compiled.probB_, compiled.classes_)
+    return pruned, pruned_vectorizer
+
+
+def _score(compiled, vectorizer, documents):
+    """
+    returns (P(polite) per document, seconds)
+    """
+    documents = copy.deepcopy(documents)
+    start = time.time()
+    probs = compiled.predict_proba(vectorizer.transform(documents))[:, 1]
+    return probs, time.time() - start
+
+
+def pruning_report(compiled, vectorizer, documents, levels):
+    """
+    :param levels- list of (name, threshold, top_k)
+    returns report dict
+    """
+    # Warm-up: fill the tokenization cache
+    _score(compiled, vectorizer, documents)
+    full, full_seconds = _score(compiled, vectorizer, documents)
+    labels = None
+    if documents and all('score' in d for d in documents):
+        labels = np.asarray([d['score'] > 0.0 for d in documents])
+
+    def summary(probs, seconds, n_features):
+        row = {'n_features': n_features, 'docs_per_second': len(documents) / seconds if seconds else None}
+        if labels is not None:
+            row['accuracy'] = float(np.mean((probs > 0.5) == labels))
+        return row
+
+    report = {
+        'n_documents': len(documents),
+        'full': summary(full, full_seconds, len(vectorizer.feature_names)),
+        'levels': [],
+    }
+    for name, threshold, top_k in levels:
+        pruned, pruned_vectorizer = prune(compiled, vectorizer, threshold, top_k)
+        probs, seconds = _score(pruned, pruned_vectorizer, documents)
+        drift = np.abs(probs - full)
+        row = summary(probs, seconds, len(pruned_vectorizer.feature_names))
+        row.update({
+            'name': name,
+            'threshold': threshold,
+            'top_k': top_k,
+            'n_unigrams': len(pruned_vectorizer.unigrams),
+            'n_bigrams': len(pruned_vectorizer.bigrams),
+            'agreement': float(np.mean((probs > 0.5) == (full > 0.5))),
+            'probability_drift': {
+                'mean': float(drift.mean()),
+                'p99': float(np.percentile(drift, 99)),
+                'max': float(drift.max()),
+            },
+            'speedup': full_seconds / seconds if seconds else None,
+        })
+        report['levels'].append(row)
+    return report
+
+
+def pruning_levels(thresholds=(), top_ks=()):
+    return ([("threshold-%g" % t, t, None) for t in thresholds] +
+            [("top-%d" % k, 0.0, k) for k in top_ks])
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Prune low-weight ngram features from the politeness model")
+    parser.add_argument("input", nargs="?", help="JSONL evaluation documents (default: synthetic corpus)")
+    parser.add_argument("--documents", type=int, default=2000, help="synthetic corpus size")
+    parser.add_argument("--model", default=model.MODEL_FILENAME, help="pickled SVM to prune")
+    parser.add_argument("--thresholds", type=float, nargs="*", default=[], help="min |weight| levels")
+    parser.add_argument("--top-k", type=int, nargs="*", default=[], help="ngram budget levels")
+    parser.add_argument("--artifact-dir", help="write each pruned model as an artifact in this directory")
+    parser.add_argument("-o", "--output", default="-", help="JSON report file ('-' for stdout)")
+    args = parser.parse_args()
+
+    levels = pruning_levels(args.thresholds, args.top_k)
+    if not levels:
+        parser.error("give at least one --thresholds or --top-k level")
+
+    compiled = LinearPolitenessModel.from_svc(model.load(args.model))
+    vectorizer = model.vectorizer
+    if args.input:
+        from politeness.scripts.score_jsonl import read_documents
+        documents = list(read_documents(open(args.input)))
+    else:
+        from politeness.scripts.synthetic_corpus import generate_corpus
+        documents = list(generate_corpus(args.documents))
+        # Synthetic scores are random: evaluate by agreement only
+        for d in documents:
+            d.pop('score', None)
+
+    report = pruning_report(compiled, vectorizer, documents, levels)
+    if args.artifact_dir:
+        for name, threshold, top_k in levels:
+            dirname = os.path.join(args.artifact_dir, name)
+            write_artifact(*prune(compiled, vectorizer, threshold, top_k), dirname=dirname)
+            print >> sys.stderr, "Wrote %s" % dirname
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    json.dump(report, out, indent=2, sort_keys=True)
+    out.write("\n")
@@ -0,0 +1,106 @@
+import sys
+import json
+import argparse
+from itertools import islice
+
+from politeness import model
+from politeness.request_utils import check_is_request
+
+"""
+Stream-score request documents stored as JSON lines.
+
+Each input line is one document in the format of
+politeness.test_documents (a JSON object with
+'sentences' and 'parses'). Each output line is a
+JSON object with the document's 'polite' and
+'impolite' probabilities (plus its 'id', if it
+has one, and optionally 'is_request').
+
+With --requests-only, documents that don't look like
+requests (request_utils.check_is_request) are not
+scored: their 'polite' and 'impolite' are null.
+
+Documents are read, scored and written one chunk
+at a time, so memory does not grow with input size.
+
+Usage:
+    python -m politeness.scripts.score_jsonl requests.jsonl -o scores.jsonl
+    cat requests.jsonl | python -m politeness.scripts.score_jsonl --requests
+    python -m politeness.scripts.score_jsonl chats.jsonl --requests-only -o scores.jsonl
+"""
+
+
+def read_documents(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def score_stream(documents, out, chunksize=1000, requests=False, requests_only=False):
+    """
+    :param documents- iterator of document dicts
+    :param out- file-like object JSON lines are written to
+    :param chunksize- documents scored per batch
+    :param requests- include check_is_request result
+    :param requests_only- skip scoring non-requests
+        (see model.score_batch)
+
+    returns number of documents scored
+    """
+    n = 0
+    documents = iter(documents)
+    while True:
+        chunk = list(islice(documents, chunksize))
+        if not chunk:
+            break
+        if requests_only:
+            results = model.score_batch(chunk, chunksize=chunksize, requests_only=True)
+            for d, result in zip(chunk, results):
+                if result['polite'] is not None:
+                    result = {"polite": float(result['polite']), "impolite": float(result['impolite']),
+                              "is_request": True}
+                if 'id' in d:
+                    result['id'] = d['id']
+                out.write(json.dumps(result) + "\n")
+            n += len(chunk)
+            continue
+        is_request = [check_is_request(d) for d in chunk] if requests else None
+        probs = model.score_batch(chunk, chunksize=chunksize, as_dicts=False)
+        for i, d in enumerate(chunk):
+            result = {"polite": float(probs[i][1]), "impolite": float(probs[i][0])}
+            if 'id' in d:
+                result['id'] = d['id']
+            if requests:
+                result['is_request'] = is_request[i]
+            out.write(json.dumps(result) + "\n")
+        n += len(chunk)
+    return n
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Score JSONL request documents")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file of documents ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for results ('-' for stdout)")
+    parser.add_argument("--chunksize", type=int, default=1000, help="documents scored per batch")
+    parser.add_argument("--requests", action="store_true", help="also output check_is_request")
+    parser.add_argument("--requests-only", action="store_true",
+                        help="only score documents that look like requests")
+    parser.add_argument("--compiled-model", help="score with a compiled model (see compiled_model.py)")
+    args = parser.parse_args()
+
+    if args.compiled_model:
+        model.use_compiled_model(args.compiled_model)
+
+    infile = sys.stdin if args.input == "-" else open(args.input)
+    outfile = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    n = score_stream(read_documents(infile), outfile, chunksize=args.chunksize, requests=args.requests,
+                     requests_only=args.requests_only)
+    outfile.flush()
+    sys.stderr.write("Scored %d documents\n" % n)
+    if args.requests_only:
+        sys.stderr.write("Requests: %d, skipped non-requests: %d\n" % (
+            model.request_filter_counts['requests'], model.request_filter_counts['non_requests']))
@@ -0,0 +1,445 @@
+import os
+import sys
+import glob
+import json
+import time
+import socket
+import hashlib
+import argparse
+import traceback
+import multiprocessing
+
+from politeness import model
+from politeness.scripts.score_jsonl import read_documents, score_stream
+
+"""
+Sharded, resumable batch scoring through a spool
+directory on a shared filesystem (no broker needed).
+
+    split- cut a JSONL corpus into shards of --shard-size lines
+    work- score shards until every shard has a result; run
+        any number of workers, on any machines mounting the spool
+    merge- concatenate shard results, in input order
+    run- split, start --workers local worker processes, merge
+
+Spool layout--
+    manifest.json- shard count and sizes, the input's sha1 and
+        the model version, written after the shards, so a complete
+        split is never redone. Splitting another input into the
+        same spool, or working it with another model, raises.
+    shards/NNNNNN.jsonl- input documents
+    leases/NNNNNN.lease- held by the worker scoring the shard,
+        created with O_EXCL, holding its worker id. Workers touch
+        it every chunk; a lease untouched for --lease-timeout
+        seconds is stale (its worker died or stalled) and is
+        taken over, removing the temporary files its worker left.
+    results/NNNNNN.jsonl- one output line per input line,
+        written to a temporary file and renamed into place
+        only while the worker still holds the shard's lease
+    errors/NNNNNN.json- error marker of a shard that raised (bad
+        JSON, bad document). Workers skip failed shards and merge
+        reports them; --retry-failed clears the markers.
+
+A shard is done once its result exists, so a restarted job
+only scores the shards that have none. A slow worker whose
+lease was taken over stops at its next chunk, and neither
+writes its result nor releases the new owner's lease.
+
+Usage:
+    python -m politeness.scripts.spool_score split corpus.jsonl /mnt/spool --shard-size 10000
+    python -m politeness.scripts.spool_score work /mnt/spool        (on each machine)
+    python -m politeness.scripts.spool_score merge /mnt/spool -o scores.jsonl
+    python -m politeness.scripts.spool_score run corpus.jsonl /tmp/spool --workers 4 -o scores.jsonl
+"""
+
+LEASE_TIMEOUT = 300.0
+POLL_INTERVAL = 1.0
+
+
+def shard_name(i):
+    return "%06d" % i
+
+
+def _path(spool, kind, i):
+    extension = {"leases": ".lease", "errors": ".json"}.get(kind, ".jsonl")
+    return os.path.join(spool, kind, shard_name(i) + extension)
+
+
+class LeaseLost(Exception):
+
+    """
+    Raised when a worker's shard lease was taken over
+    """
+
+
+def _write_atomic(filename, write, before_rename=None):
+    """
+    write(f) to a temporary file, then rename it to filename
+
+    :param before_rename- optional callable; raising from it
+        discards the temporary file instead of renaming it
+    """
+    tmp = "%s.tmp-%s-%d" % (filename, socket.gethostname(), os.getpid())
+    try:
+        with open(tmp, "w") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if before_rename is not None:
+            before_rename()
+    except:
+        # Re-raised below, not masked by a failed unlink
+        exc_info = sys.exc_info()
+        if os.path.exists(tmp):
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        raise exc_info[0], exc_info[1], exc_info[2]
+    os.rename(tmp, filename)
+
+
+def read_manifest(spool):
+    filename = os.path.join(spool, "manifest.json")
+    if not os.path.exists(filename):
+        return None
+    return json.load(open(filename))
+
+
+def file_sha1(filename):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def check_manifest(manifest, input_filename=None):
+    """
+    Raise unless the spool was split from input_filename
+    (if given) and is scored with the loaded model
+    """
+    if input_filename is not None and (os.path.getsize(input_filename) != manifest.get('input_size') or
+                                       file_sha1(input_filename) != manifest.get('input_sha1')):
+        raise ValueError("Spool was split from %s, not %s (use another spool directory)" % (
+            manifest['input'], input_filename))
+    if model.model_version() != manifest.get('model_version'):
+        raise ValueError("Spool results are for model version %s, the loaded model is %s" % (
+            manifest['model_version'], model.model_version()))
+
+
+def split(input_filename, spool, shard_size=10000):
+    """
+    Cut input into shards, unless spool already holds a
+    complete split of the same input. returns the spool manifest
+    """
+    manifest = read_manifest(spool)
+    if manifest is not None:
+        check_manifest(manifest, input_filename)
+        return manifest
+    for kind in ("shards", "leases", "results", "errors"):
+        if not os.path.isdir(os.path.join(spool, kind)):
+            os.makedirs(os.path.join(spool, kind))
+    sizes = []
+    shard = []
+
+    def flush():
+        _write_atomic(_path(spool, "shards", len(sizes)), lambda f: f.writelines(shard))
+        sizes.append(len(shard))
+        del shard[:]
+
+    with open(input_filename) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            shard.append(line if line.endswith("\n") else line + "\n")
+            if len(shard) >= shard_size:
+                flush()
+    if shard:
+        flush()
+    manifest = {'input': os.path.abspath(input_filename), 'input_size': os.path.getsize(input_filename),
+                'input_mtime': os.path.getmtime(input_filename), 'input_sha1': file_sha1(input_filename),
+                'model_version': model.model_version(), 'shard_size': shard_size,
+                'n_shards': len(sizes), 'shard_sizes': sizes, 'n_documents': sum(sizes)}
+    _write_atomic(os.path.join(spool, "manifest.json"), lambda f: json.dump(manifest, f, indent=2))
+    return manifest
+
+
+def acquire_lease(spool, i, worker_id, lease_timeout=LEASE_TIMEOUT):
+    """
+    returns True if this worker now holds shard i's lease
+    """
+    lease = _path(spool, "leases", i)
+    try:
+        fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError:
+        try:
+            stale = time.time() - os.path.getmtime(lease) > lease_timeout
+        except OSError:
+            # Released meanwhile; retry on the next pass
+            return False
+        if not stale:
+            return False
+        # Only one worker's rename of the stale lease succeeds
+        stale_lease = "%s.stale-%s" % (lease, worker_id)
+        try:
+            os.rename(lease, stale_lease)
+        except OSError:
+            return False
+        os.unlink(stale_lease)
+        remove_temporary_files(spool, i)
+        return acquire_lease(spool, i, worker_id, lease_timeout)
+    os.write(fd, json.dumps({'worker': worker_id, 'acquired': time.time()}))
+    os.close(fd)
+    return True
+
+
+def lease_owner(spool, i):
+    """
+    returns the worker id in shard i's lease,
+    None if it is unleased (or being written)
+    """
+    try:
+        with open(_path(spool, "leases", i)) as f:
+            return json.load(f).get('worker')
+    except (IOError, ValueError):
+        return None
+
+
+def check_lease(spool, i, worker_id):
+    """
+    Raise LeaseLost unless worker_id holds shard i's lease
+    """
+    owner = lease_owner(spool, i)
+    if owner != worker_id:
+        raise LeaseLost("Lease of shard %s was taken over by %s" % (shard_name(i), owner))
+
+
+def release_lease(spool, i, worker_id):
+    """
+    Remove shard i's lease, if worker_id still holds it
+    """
+    if lease_owner(spool, i) != worker_id:
+        return
+    try:
+        os.unlink(_path(spool, "leases", i))
+    except OSError:
+        pass
+
+
+def remove_temporary_files(spool, i):
+    """
+    Remove shard i's temporary result and error files,
+    left by a worker killed while writing them
+    """
+    for kind in ("results", "errors"):
+        for tmp in glob.glob(_path(spool, kind, i) + ".tmp-*"):
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+def _heartbeat(documents, spool, i, worker_id, every):
+    lease = _path(spool, "leases", i)
+    for n, d in enumerate(documents, 1):
+        yield d
+        if n % every == 0:
+            check_lease(spool, i, worker_id)
+            try:
+                os.utime(lease, None)
+            except OSError:
+                pass
+
+
+def score_shard(spool, i, worker_id, chunksize=1000):
+    """
+    Score shard i into its result file, while worker_id
+    holds its lease. returns number of documents.
+    Raises LeaseLost if the lease was taken over; the
+    result is then left to the new owner.
+    """
+    documents = _heartbeat(read_documents(open(_path(spool, "shards", i))), spool, i, worker_id, chunksize)
+    n = []
+    _write_atomic(_path(spool, "results", i), lambda f: n.append(score_stream(documents, f, chunksize)),
+                  lambda: check_lease(spool, i, worker_id))
+    return n[0]
+
+
+def _is_pending(spool, i):
+    return not os.path.exists(_path(spool, "results", i)) and not os.path.exists(_path(spool, "errors", i))
+
+
+def pending_shards(spool, manifest=None):
+    """
+    Shards with neither a result nor an error marker
+    """
+    manifest = manifest or read_manifest(spool)
+    return [i for i in xrange(manifest['n_shards']) if _is_pending(spool, i)]
+
+
+def failed_shards(spool, manifest=None):
+    """
+    returns list of (shard, error marker dict)
+    """
+    manifest = manifest or read_manifest(spool)
+    return [(i, json.load(open(_path(spool, "errors", i)))) for i in xrange(manifest['n_shards'])
+            if os.path.exists(_path(spool, "errors", i))]
+
+
+def clear_failures(spool):
+    """
+    Remove error markers, so failed shards are retried
+    """
+    for i, _ in failed_shards(spool):
+        os.unlink(_path(spool, "errors", i))
+
+
+def _record_failure(spool, i, worker_id):
+    marker = {'worker': worker_id, 'time': time.time(), 'error': traceback.format_exc()}
+    _write_atomic(_path(spool, "errors", i), lambda f: json.dump(marker, f, indent=2),
+                  lambda: check_lease(spool, i, worker_id))
+
+
+def work(spool, chunksize=1000, lease_timeout=LEASE_TIMEOUT, poll_interval=POLL_INTERVAL, worker_id=None, log=None):
+    """
+    Score unleased pending shards until every shard has a
+    result or an error marker. returns number of shards scored
+    """
+    worker_id = worker_id or "%s-%d" % (socket.gethostname(), os.getpid())
+    manifest = read_manifest(spool)
+    if manifest is None:
+        raise ValueError("%s holds no split corpus (run split first)" % spool)
+    model.ensure_loaded()
+    check_manifest(manifest)
+    n_scored = 0
+    while True:
+        pending = pending_shards(spool, manifest)
+        if not pending:
+            return n_scored
+        scored_any = False
+        for i in pending:
+            if not _is_pending(spool, i) or not acquire_lease(spool, i, worker_id, lease_timeout):
+                continue
+            try:
+                # Finished by a worker whose lease we took over
+                if _is_pending(spool, i):
+                    start = time.time()
+                    try:
+                        n = score_shard(spool, i, worker_id, chunksize)
+                    except LeaseLost as e:
+                        if log is not None:
+                            log.write("%s: %s\n" % (worker_id, e))
+                    except Exception as e:
+                        try:
+                            _record_failure(spool, i, worker_id)
+                        except LeaseLost:
+                            pass
+                        if log is not None:
+                            log.write("%s: shard %s failed: %s\n" % (worker_id, shard_name(i), e))
+                    else:
+                        n_scored += 1
+                        if log is not None:
+                            log.write("%s: shard %s, %d documents in %.1fs\n" % (worker_id, shard_name(i), n, time.time() - start))
+                scored_any = True
+            finally:
+                release_lease(spool, i, worker_id)
+        if not scored_any:
+            # Everything left is leased: wait, in case a lease goes stale
+            time.sleep(poll_interval)
+
+
+def merge(spool, out):
+    """
+    Write all shard results to out, in input order.
+    returns number of lines written
+    """
+    manifest = read_manifest(spool)
+    failed = failed_shards(spool, manifest)
+    if failed:
+        raise ValueError("%d of %d shards failed (first: %s):\n%s" % (
+            len(failed), manifest['n_shards'], shard_name(failed[0][0]), failed[0][1]['error']))
+    missing = pending_shards(spool, manifest)
+    if missing:
+        raise ValueError("%d of %d shards have no results yet (first: %s)" % (len(missing), manifest['n_shards'], shard_name(missing[0])))
+    n = 0
+    for i in xrange(manifest['n_shards']):
+        with open(_path(spool, "results", i)) as f:
+            lines = f.readlines()
+        if len(lines) != manifest['shard_sizes'][i]:
+            raise ValueError("Shard %s has %d results for %d documents" % (shard_name(i), len(lines), manifest['shard_sizes'][i]))
+        out.writelines(lines)
+        n += len(lines)
+    return n
+
+
+def _work_process(spool, chunksize, lease_timeout):
+    work(spool, chunksize, lease_timeout, log=sys.stderr)
+
+
+def run_local(input_filename, spool, out, workers=2, shard_size=10000, chunksize=1000, lease_timeout=LEASE_TIMEOUT,
+              retry_failed=False):
+    """
+    split, score with local worker processes, merge
+    """
+    manifest = split(input_filename, spool, shard_size)
+    if retry_failed:
+        clear_failures(spool)
+    print >> sys.stderr, "%d documents in %d shards, %d pending" % (
+        manifest['n_documents'], manifest['n_shards'], len(pending_shards(spool, manifest)))
+    # Load once, before forking
+    model.ensure_loaded()
+    processes = [multiprocessing.Process(target=_work_process, args=(spool, chunksize, lease_timeout))
+                 for _ in xrange(workers)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    return merge(spool, out)
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Sharded, resumable batch scoring through a spool directory")
+    commands = parser.add_subparsers(dest="command")
+    p = commands.add_parser("split", help="split a JSONL corpus into shards")
+    p.add_argument("input")
+    p.add_argument("spool")
+    p.add_argument("--shard-size", type=int, default=10000)
+    p = commands.add_parser("work", help="score shards until all are done")
+    p.add_argument("spool")
+    p.add_argument("--retry-failed", action="store_true", help="retry shards that failed before")
+    p = commands.add_parser("merge", help="concatenate shard results in input order")
+    p.add_argument("spool")
+    p.add_argument("-o", "--output", default="-")
+    p = commands.add_parser("run", help="split, score with local workers, merge")
+    p.add_argument("input")
+    p.add_argument("spool")
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--retry-failed", action="store_true", help="retry shards that failed before")
+    p.add_argument("--shard-size", type=int, default=10000)
+    p.add_argument("-o", "--output", default="-")
+    for p in commands.choices.itervalues():
+        p.add_argument("--chunksize", type=int, default=1000)
+        p.add_argument("--lease-timeout", type=float, default=LEASE_TIMEOUT,
+                       help="seconds after which an untouched lease is taken over")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        manifest = split(args.input, args.spool, args.shard_size)
+        print >> sys.stderr, "%d documents in %d shards" % (manifest['n_documents'], manifest['n_shards'])
+    elif args.command == "work":
+        if args.retry_failed:
+            clear_failures(args.spool)
+        n = work(args.spool, args.chunksize, args.lease_timeout, log=sys.stderr)
+        print >> sys.stderr, "Scored %d shards" % n
+    else:
+        out = sys.stdout if args.output == "-" else open(args.output, "w")
+        if args.command == "merge":
+            n = merge(args.spool, out)
+        else:
+            n = run_local(args.input, args.spool, out, args.workers, args.shard_size, args.chunksize, args.lease_timeout,
+                          args.retry_failed)
+        out.flush()
+        print >> sys.stderr, "Merged %d results" % n
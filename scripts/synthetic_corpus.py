@@ -0,0 +1,90 @@
+import re
+import sys
+import json
+import random
+
+from politeness.test_documents import TEST_DOCUMENTS
+
+"""
+Synthetic request corpus generator.
+
+Builds documents in the expected 'sentences'/'parses'
+format by recombining the sentence + dependency parse
+pairs of politeness.test_documents. To avoid scoring
+the same few sentences over and over, words can be
+swapped for other words (consistently in the sentence
+text and in its parse).
+
+Usage:
+    python -m politeness.scripts.synthetic_corpus n_documents [max_sentences] > corpus.jsonl
+"""
+
+# Words swapped in, by rough syntactic role
+SUBSTITUTIONS = [
+    ["answer", "question", "system", "way", "code", "page", "issue", "link", "file", "example"],
+    ["found", "fixed", "checked", "seen", "read", "tried", "changed", "updated"],
+    ["share", "post", "explain", "send", "add", "show", "clarify"],
+    ["you", "we", "I", "they"],
+    ["please", "kindly", "maybe", "really", "actually"],
+    ["hack", "break", "edit", "delete", "move"],
+]
+
+_word2group = dict((w, g) for g in SUBSTITUTIONS for w in g)
+_token_re = re.compile(r"([-\w!?]+)-(\d+)")
+# Words of the sentence text, without attached punctuation
+_word_re = re.compile(r"[\w']+")
+
+
+def sentence_pool(documents=TEST_DOCUMENTS):
+    return [(s, p) for d in documents for s, p in zip(d['sentences'], d['parses'])]
+
+
+def mutate(sentence, parse, rng, rate=0.3):
+    """
+    Swap words of the sentence for others of the same
+    group, in both the text and the parse elements.
+    Words are matched apart from attached punctuation
+    ("question?" can be swapped), and every occurrence
+    of a swapped word is replaced.
+    """
+    swaps = {}
+    for w in _word_re.findall(sentence):
+        if w in _word2group and rng.random() < rate:
+            swaps[w] = rng.choice(_word2group[w])
+    if not swaps:
+        return sentence, list(parse)
+    sentence = _word_re.sub(lambda m: swaps.get(m.group(0), m.group(0)), sentence)
+    sub = lambda m: "%s-%s" % (swaps.get(m.group(1), m.group(1)), m.group(2))
+    return sentence, [_token_re.sub(sub, p) for p in parse]
+
+
+def generate_corpus(n_documents, max_sentences=4, min_sentences=1, seed=0, mutation_rate=0.3):
+    """
+    Generator of n_documents synthetic documents, each with
+    between min_sentences and max_sentences sentences, plus
+    'text' and a random 'score' (for training experiments)
+    """
+    rng = random.Random(seed)
+    pool = sentence_pool()
+    for i in xrange(n_documents):
+        sentences, parses = [], []
+        for _ in xrange(rng.randint(min_sentences, max_sentences)):
+            s, p = mutate(*rng.choice(pool), rng=rng, rate=mutation_rate)
+            sentences.append(s)
+            parses.append(p)
+        yield {
+            'id': i,
+            'text': " ".join(sentences),
+            'sentences': sentences,
+            'parses': parses,
+            'score': rng.uniform(-1.0, 1.0),
+        }
+
+
+
+if __name__ == "__main__":
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    max_sentences = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    for d in generate_corpus(n, max_sentences):
+        sys.stdout.write(json.dumps(d) + "\n")
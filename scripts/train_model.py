@@ -1,13 +1,20 @@
-
+import sys
+import time
+import json
 import random
 import cPickle
+import argparse
 import numpy as np
+from itertools import islice
 
 from sklearn import svm
-from scipy.sparse import csr_matrix
-from sklearn.metrics import classification_report
+from sklearn.linear_model import SGDClassifier
+from scipy.sparse import vstack
+from sklearn.metrics import classification_report, accuracy_score
 
+from politeness.compiled_model import LinearPolitenessModel
 from politeness.features.vectorizer import PolitenessFeatureVectorizer
+from politeness.features.ngram_counts import iter_documents, imap_chunks
 
 """
 Sample script to train a politeness SVM
@@ -17,10 +24,96 @@ Buckets documents by politeness score
    'impolite' otherwise
 Could also elect to not bucket
 and treat this as a regression problem
+
+Two learners--
+    train_svm- svm.SVC(kernel='linear', probability=True),
+        as the pre-trained model. Fitting is quadratic in
+        the number of documents.
+    train_sgd- linear SVM fit by SGDClassifier.partial_fit
+        over streamed chunks of documents, then calibrated
+        with a Platt sigmoid on held-out rows. Emits a
+        compiled LinearPolitenessModel, for
+        model.use_compiled_model.
+
+Features are extracted in chunks, optionally across
+worker processes, straight into CSR matrices.
+
+Usage:
+    python -m politeness.scripts.train_model corpus.jsonl --learner sgd -o politeness-linear.npz
+    python -m politeness.scripts.train_model corpus.jsonl --compare
+    python -m politeness.scripts.train_model    # dummy SVC off the 4 sample request docs
 """
 
 
-def train_svm(documents, ntesting=500):
+# Set in the parent before worker processes fork,
+# so workers inherit it
+_vectorizer = None
+
+
+def _get_vectorizer():
+    global _vectorizer
+    if _vectorizer is None:
+        _vectorizer = PolitenessFeatureVectorizer()
+    return _vectorizer
+
+
+def use_vectorizer(vectorizer):
+    """
+    Extract features with vectorizer (e.g. one built
+    from in-memory ngram lists) instead of the pickled lists
+    """
+    global _vectorizer
+    _vectorizer = vectorizer
+
+
+def generate_vocabulary(documents, processes=1, chunksize=1000):
+    """
+    Generate and persist list of unigrams, bigrams,
+    and drop any vectorizer built from the old lists
+    """
+    global _vectorizer
+    PolitenessFeatureVectorizer.generate_bow_features(documents, processes=processes, chunksize=chunksize)
+    _vectorizer = None
+
+
+def document_labels(documents):
+    # If politeness score > 0.0,
+    # the doc is polite, class=1
+    return np.asarray([1 if d['score'] > 0.0 else 0 for d in documents], dtype=np.int64)
+
+
+def _vectorize_chunk(documents):
+    return _get_vectorizer().transform(documents), document_labels(documents)
+
+
+def iter_feature_chunks(documents, processes=1, chunksize=1000):
+    """
+    Generator of (CSR matrix, labels), one per chunk
+    of documents (list, iterator or JSONL filename)
+    """
+    _get_vectorizer()
+    return imap_chunks(_vectorize_chunk, documents, processes, chunksize)
+
+
+def iter_matrix_chunks(X, y, chunksize=1000):
+    for start in xrange(0, X.shape[0], chunksize):
+        yield X[start:start + chunksize], y[start:start + chunksize]
+
+
+def documents2feature_vectors(documents, processes=1, chunksize=1000):
+    """
+    returns (CSR matrix, labels) for documents
+    """
+    Xs, ys = [], []
+    for X, y in iter_feature_chunks(documents, processes, chunksize):
+        Xs.append(X)
+        ys.append(y)
+    if not Xs:
+        return _get_vectorizer().transform([]), np.zeros(0, dtype=np.int64)
+    return vstack(Xs, format='csr'), np.concatenate(ys)
+
+
+def train_svm(documents, ntesting=500, processes=1):
     """
     :param documents- politeness-annotated training data
     :type documents- list of dicts
@@ -30,10 +123,12 @@ def train_svm(documents, ntesting=500):
     :param ntesting- number of docs to reserve for testing
     :type ntesting- int
 
+    :param processes- worker processes for feature extraction
+    :type processes- int
+
     returns fitted SVC, which can be serialized using cPickle
     """
-    # Generate and persist list of unigrams, bigrams  
-    PolitenessFeatureVectorizer.generate_bow_features(documents)
+    generate_vocabulary(documents, processes)
 
     # For good luck
     random.shuffle(documents)
@@ -43,12 +138,11 @@ def train_svm(documents, ntesting=500):
     # SAVE FOR NOW
     cPickle.dump(testing, open("testing-data.p", 'w'))
 
-    X, y = documents2feature_vectors(documents)
-    Xtest, ytest = documents2feature_vectors(testing)
+    X, y = documents2feature_vectors(documents, processes)
+    Xtest, ytest = documents2feature_vectors(testing, processes)
 
     print "Fitting"
-    clf = svm.SVC(C=0.02, kernel='linear', probability=True)
-    clf.fit(X, y)
+    clf = fit_svm(X, y)
 
     # Test
     y_pred = clf.predict(Xtest)
@@ -57,34 +151,165 @@ def train_svm(documents, ntesting=500):
     return clf
 
 
-def documents2feature_vectors(documents):
-    vectorizer = PolitenessFeatureVectorizer()
-    fks = False
-    X, y = [], []
-    for d in documents:
-        fs = vectorizer.features(d)
-        if not fks:
-            fks = sorted(fs.keys())
-        fv = [fs[f] for f in fks]
-        # If politeness score > 0.0, 
-        # the doc is polite, class=1
-        l = 1 if d['score'] > 0.0 else 0
-        X.append(fv)
-        y.append(l)
-    X = csr_matrix(np.asarray(X))
-    y = np.asarray(y)
-    return X, y
+def fit_svm(X, y, C=0.02, probability=True):
+    clf = svm.SVC(C=C, kernel='linear', probability=probability)
+    clf.fit(X, y)
+    return clf
 
 
+def fit_sgd(make_chunks, n_epochs=5, alpha=1e-4, calibration_fraction=0.1,
+            max_calibration=100000, seed=0):
+    """
+    :param make_chunks- callable returning an iterator
+        of (X, y) chunks; called once per epoch
+    :param n_epochs- passes of partial_fit over the chunks
+    :param alpha- L2 regularization strength
+    :param calibration_fraction- fraction of rows held out
+        (the same rows every epoch) to fit the Platt sigmoid
+    :param max_calibration- cap on held-out rows kept in memory
 
-if __name__ == "__main__":
+    returns LinearPolitenessModel
+    """
+    clf = SGDClassifier(loss='hinge', alpha=alpha, random_state=seed)
+    classes = np.array([0, 1])
+    calibration_X, calibration_y, n_calibration = [], [], 0
+    # Weights averaged over partial_fit calls (SGDClassifier's
+    # own average= option needs scikit-learn >= 0.16)
+    coef_sum, intercept_sum, n_updates = 0.0, 0.0, 0
+    for epoch in xrange(n_epochs):
+        # Reseeded each epoch, so the held-out rows don't change
+        split_rng = np.random.RandomState(seed)
+        shuffle_rng = np.random.RandomState(seed + epoch + 1)
+        for X, y in make_chunks():
+            held_out = split_rng.rand(X.shape[0]) < calibration_fraction
+            if epoch == 0 and n_calibration < max_calibration:
+                rows = np.flatnonzero(held_out)[:max_calibration - n_calibration]
+                calibration_X.append(X[rows])
+                calibration_y.append(y[rows])
+                n_calibration += len(rows)
+            rows = np.flatnonzero(~held_out)
+            if not len(rows):
+                continue
+            shuffle_rng.shuffle(rows)
+            clf.partial_fit(X[rows], y[rows], classes=classes)
+            coef_sum = coef_sum + clf.coef_
+            intercept_sum = intercept_sum + clf.intercept_
+            n_updates += 1
+    if not n_calibration:
+        raise ValueError("No rows held out for calibration")
+    if n_updates:
+        clf.coef_, clf.intercept_ = coef_sum / n_updates, intercept_sum / n_updates
+    return LinearPolitenessModel.from_linear_classifier(
+        clf, vstack(calibration_X, format='csr'), np.concatenate(calibration_y))
+
+
+def train_sgd(documents, ntesting=500, processes=1, chunksize=1000, **kwargs):
+    """
+    :param documents- politeness-annotated training data, as
+        a list or JSONL filename (re-read every epoch)
+    :param ntesting- the first ntesting docs are held out for testing
+    :param processes- worker processes for feature extraction
+    :param kwargs- passed to fit_sgd
+
+    returns LinearPolitenessModel, which can be saved
+    and loaded with model.use_compiled_model
+    """
+    generate_vocabulary(documents, processes, chunksize)
+
+    testing = list(islice(iter_documents(documents), ntesting))
+    training = lambda: islice(iter_documents(documents), ntesting, None)
+
+    print "Fitting"
+    compiled = fit_sgd(lambda: iter_feature_chunks(training(), processes, chunksize), **kwargs)
+
+    # Test
+    Xtest, ytest = documents2feature_vectors(testing, processes, chunksize)
+    if len(ytest):
+        print(classification_report(ytest, compiled.predict(Xtest)))
+
+    return compiled
+
+
+def binary_log_loss(y, probs, eps=1e-15):
+    """
+    :param y- 0/1 labels
+    :param probs- predict_proba output, columns (0, 1)
+    """
+    p = np.clip(np.asarray(probs)[np.arange(len(y)), np.asarray(y, dtype=int)], eps, 1 - eps)
+    return float(-np.log(p).mean())
 
 
+def compare_learners(documents, ntesting=500, processes=1, chunksize=1000, **kwargs):
     """
-    Train a dummy model off our 4 sample request docs
+    Fit the SVC and the SGD learner on the same features
+    and report accuracy, log loss and fit time of each on
+    ntesting held-out documents.
+
+    :param documents- list of politeness-annotated documents
+    returns report dict
     """
+    generate_vocabulary(documents, processes, chunksize)
+    documents = list(documents)
+    random.Random(0).shuffle(documents)
+    testing, training = documents[-ntesting:], documents[:-ntesting]
+    X, y = documents2feature_vectors(training, processes, chunksize)
+    Xtest, ytest = documents2feature_vectors(testing, processes, chunksize)
+
+    learners = [
+        ('svc', lambda: fit_svm(X, y)),
+        ('sgd', lambda: fit_sgd(lambda: iter_matrix_chunks(X, y, chunksize), **kwargs)),
+    ]
+    report = {'n_training': len(y), 'n_testing': len(ytest), 'n_features': X.shape[1], 'learners': {}}
+    predictions = {}
+    for name, fit in learners:
+        start = time.time()
+        clf = fit()
+        elapsed = time.time() - start
+        predictions[name] = clf.predict(Xtest)
+        report['learners'][name] = {
+            'fit_seconds': elapsed,
+            'accuracy': accuracy_score(ytest, predictions[name]),
+            'log_loss': binary_log_loss(ytest, clf.predict_proba(Xtest)),
+        }
+        print name
+        print(classification_report(ytest, predictions[name]))
+    report['prediction_agreement'] = float(np.mean(predictions['svc'] == predictions['sgd']))
+    return report
 
-    from test_documents import TEST_DOCUMENTS
 
-    train_svm(TEST_DOCUMENTS, ntesting=1)
 
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Train a politeness model")
+    parser.add_argument("input", nargs="?",
+                        help="JSONL file of documents with 'sentences', 'parses' and 'score' "
+                             "(default: train a dummy SVC off the sample request docs)")
+    parser.add_argument("--learner", choices=["sgd", "svc"], default="sgd")
+    parser.add_argument("--compare", action="store_true",
+                        help="fit both learners on the same split and print a JSON report")
+    parser.add_argument("--ntesting", type=int, default=500)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--chunksize", type=int, default=1000)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--alpha", type=float, default=1e-4)
+    parser.add_argument("-o", "--output", help="model file: .npz for sgd (compiled), pickle for svc")
+    args = parser.parse_args()
+
+    if args.input is None:
+        # Train a dummy model off our 4 sample request docs
+        from politeness.test_documents import TEST_DOCUMENTS
+        train_svm(TEST_DOCUMENTS, ntesting=1)
+    elif args.compare:
+        report = compare_learners(list(iter_documents(args.input)), args.ntesting, args.processes,
+                                  args.chunksize, n_epochs=args.epochs, alpha=args.alpha)
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    elif args.learner == "sgd":
+        compiled = train_sgd(args.input, args.ntesting, args.processes, args.chunksize,
+                             n_epochs=args.epochs, alpha=args.alpha)
+        if args.output:
+            compiled.save(args.output)
+    else:
+        clf = train_svm(list(iter_documents(args.input)), args.ntesting, args.processes)
+        if args.output:
+            cPickle.dump(clf, open(args.output, 'w'))
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from itertools import product
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.metrics import accuracy_score
+
+from politeness.artifacts import write_artifact
+from politeness.compiled_model import LinearPolitenessModel
+from politeness.features.vectorizer import PolitenessFeatureVectorizer
+from politeness.features.politeness_strategies import POLITENESS_FEATURES
+from politeness.features.ngram_counts import iter_documents, count_frequent_ngrams
+from politeness.scripts import train_model
+
+"""
+Hyperparameter sweep for the politeness SVM, with
+k-fold cross-validation over a grid of C values and
+unigram/bigram min-count thresholds.
+
+Features are extracted once: ngrams are counted at the
+lowest thresholds in the grid, documents are vectorized
+over that vocabulary, and each higher threshold is a
+subset of its columns. The counts, matrix and labels are
+cached under --cache-dir, keyed by a hash of the corpus
+and the vocabulary version (thresholds and strategy
+features), so repeated sweeps skip vectorization.
+
+Folds are fit in parallel worker processes, which
+inherit the cached matrix when they fork. Prints a
+results table (one row per setting, best first) and
+refits the best setting on all documents into a model
+artifact (see politeness/artifacts.py).
+
+As in train_model, the vocabulary is counted over the
+whole corpus, not per training fold.
+
+Usage:
+    python -m politeness.scripts.tune_model corpus.jsonl --processes 4 -o results.tsv --artifact politeness-model-tuned
+    python -m politeness.scripts.tune_model corpus.jsonl --C 0.01 0.02 0.05 --min-counts 10 20 --folds 10
+"""
+
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_C = [0.005, 0.01, 0.02, 0.05, 0.1]
+DEFAULT_MIN_COUNTS = [10, 20, 40]
+
+
+def corpus_hash(documents):
+    """
+    sha1 of the documents' sentences, parses and scores
+    """
+    version = hashlib.sha1()
+    for d in iter_documents(documents):
+        version.update(json.dumps([d['sentences'], d['parses'], d['score']], separators=(',', ':')))
+        version.update("\n")
+    return version.hexdigest()
+
+
+def vocabulary_version(min_unigram_count, min_bigram_count):
+    return hashlib.sha1(json.dumps({
+        'format_version': CACHE_FORMAT_VERSION,
+        'min_unigram_count': min_unigram_count,
+        'min_bigram_count': min_bigram_count,
+        'strategies': POLITENESS_FEATURES,
+    }, sort_keys=True)).hexdigest()
+
+
+def _save_csr(filename, X):
+    np.savez(filename, data=X.data, indices=X.indices, indptr=X.indptr, shape=X.shape)
+
+
+def _load_csr(filename):
+    arrays = np.load(filename)
+    return csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']))
+
+
+def extract_features(documents, min_unigram_count, min_bigram_count, cache_dir=None,
+                     processes=1, chunksize=1000):
+    """
+    Count ngrams and vectorize documents once, or load
+    the result from cache_dir.
+
+    returns (CSR matrix, labels, vectorizer, unigram counts,
+             bigram counts), counts as lists of (ngram, count)
+    """
+    dirname = None
+    if cache_dir is not None:
+        key = hashlib.sha1(corpus_hash(documents) + vocabulary_version(min_unigram_count, min_bigram_count))
+        dirname = os.path.join(cache_dir, "features-" + key.hexdigest())
+        if os.path.exists(os.path.join(dirname, "counts.json")):
+            print >> sys.stderr, "Loading cached features from %s" % dirname
+            counts = json.load(open(os.path.join(dirname, "counts.json")))
+            unigram_counts = [(u, c) for u, c in counts['unigrams']]
+            bigram_counts = [(tuple(b), c) for b, c in counts['bigrams']]
+            vectorizer = PolitenessFeatureVectorizer(ngrams=([u for u, _ in unigram_counts], [b for b, _ in bigram_counts]))
+            X = _load_csr(os.path.join(dirname, "X.npz"))
+            y = np.load(os.path.join(dirname, "y.npy"))
+            return X, y, vectorizer, unigram_counts, bigram_counts
+
+    start = time.time()
+    unigram_counts, bigram_counts = count_frequent_ngrams(documents, min_unigram_count, min_bigram_count,
+                                                          processes, chunksize, with_counts=True)
+    vectorizer = PolitenessFeatureVectorizer(ngrams=([u for u, _ in unigram_counts], [b for b, _ in bigram_counts]))
+    train_model.use_vectorizer(vectorizer)
+    X, y = train_model.documents2feature_vectors(documents, processes, chunksize)
+    print >> sys.stderr, "Extracted %d x %d features in %.1fs" % (X.shape[0], X.shape[1], time.time() - start)
+
+    if dirname is not None:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        _save_csr(os.path.join(dirname, "X.npz"), X)
+        np.save(os.path.join(dirname, "y.npy"), y)
+        # Written last: its presence marks a complete cache entry
+        json.dump({'unigrams': unigram_counts, 'bigrams': bigram_counts},
+                  open(os.path.join(dirname, "counts.json"), 'w'))
+    return X, y, vectorizer, unigram_counts, bigram_counts
+
+
+def select_columns(vectorizer, unigram_counts, bigram_counts, min_unigram_count, min_bigram_count):
+    """
+    returns (sorted columns of the strategies and the ngrams with
+             count above the thresholds, those unigrams, those bigrams)
+    """
+    unigrams = [u for u, c in unigram_counts if c > min_unigram_count]
+    bigrams = [b for b, c in bigram_counts if c > min_bigram_count]
+    columns = [vectorizer.strategy_columns[f] for f in POLITENESS_FEATURES]
+    columns.extend(vectorizer.unigram_columns[u] for u in unigrams)
+    columns.extend(vectorizer.bigram_columns[b] for b in bigrams)
+    return np.sort(columns), unigrams, bigrams
+
+
+def _stratified_folds(y, n_folds, seed):
+    """
+    returns list of (train, test) index arrays
+    """
+    try:
+        from sklearn.cross_validation import StratifiedKFold
+    except ImportError:
+        # scikit-learn >= 0.20 only has the model_selection API
+        from sklearn.model_selection import StratifiedKFold
+        return list(StratifiedKFold(n_folds, shuffle=True, random_state=seed).split(np.zeros(len(y)), y))
+    return list(StratifiedKFold(y, n_folds, shuffle=True, random_state=seed))
+
+
+# Set in the parent before worker processes fork:
+# (X, y, {(min unigram count, min bigram count): columns})
+_sweep_data = None
+
+
+def _fit_fold(task):
+    C, thresholds, fold, train, test = task
+    X, y, columns = _sweep_data
+    X = X[:, columns[thresholds]]
+    start = time.time()
+    clf = train_model.fit_svm(X[train], y[train], C=C, probability=False)
+    elapsed = time.time() - start
+    return C, thresholds, fold, accuracy_score(y[test], clf.predict(X[test])), elapsed
+
+
+def sweep(X, y, columns, Cs, n_folds=5, processes=1, seed=0):
+    """
+    :param columns- dict of (min unigram count, min bigram count)
+        --> feature columns to use
+    returns list of result dicts, best mean accuracy first
+    """
+    global _sweep_data
+    _sweep_data = (X, y, columns)
+    folds = _stratified_folds(y, n_folds, seed)
+    tasks = [(C, thresholds, fold, train, test) for C, thresholds in product(Cs, sorted(columns))
+             for fold, (train, test) in enumerate(folds)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            outcomes = pool.map(_fit_fold, tasks, chunksize=1)
+            pool.close()
+        finally:
+            pool.join()
+    else:
+        outcomes = map(_fit_fold, tasks)
+
+    by_setting = {}
+    for C, thresholds, fold, accuracy, elapsed in outcomes:
+        by_setting.setdefault((C, thresholds), []).append((fold, accuracy, elapsed))
+    results = []
+    for (C, (min_unigram_count, min_bigram_count)), folds in by_setting.iteritems():
+        accuracies = np.array([a for _, a, _ in sorted(folds)])
+        results.append({
+            'C': C,
+            'min_unigram_count': min_unigram_count,
+            'min_bigram_count': min_bigram_count,
+            'n_features': len(columns[(min_unigram_count, min_bigram_count)]),
+            'mean_accuracy': float(accuracies.mean()),
+            'std_accuracy': float(accuracies.std()),
+            'fold_accuracies': accuracies.tolist(),
+            'fit_seconds': sum(e for _, _, e in folds),
+        })
+    # Ties go to the smaller model, then the stronger regularization
+    results.sort(key=lambda r: (-r['mean_accuracy'], r['n_features'], r['C']))
+    return results
+
+
+def write_results(results, out):
+    fields = ['C', 'min_unigram_count', 'min_bigram_count', 'n_features', 'mean_accuracy', 'std_accuracy', 'fit_seconds']
+    out.write("\t".join(fields) + "\n")
+    for r in results:
+        out.write("\t".join(str(r[f]) for f in fields) + "\n")
+
+
+def tune(documents, Cs=DEFAULT_C, min_unigram_counts=DEFAULT_MIN_COUNTS, min_bigram_counts=DEFAULT_MIN_COUNTS,
+         n_folds=5, processes=1, chunksize=1000, cache_dir=None, artifact=None, seed=0):
+    """
+    :param documents- politeness-annotated documents, as
+        a list or JSONL filename
+    :param artifact- directory to write the best model
+        artifact to, refit on all documents (optional)
+    returns (results, best LinearPolitenessModel or None)
+    """
+    X, y, vectorizer, unigram_counts, bigram_counts = extract_features(
+        documents, min(min_unigram_counts), min(min_bigram_counts), cache_dir, processes, chunksize)
+    columns = {}
+    for thresholds in product(min_unigram_counts, min_bigram_counts):
+        columns[thresholds] = select_columns(vectorizer, unigram_counts, bigram_counts, *thresholds)[0]
+
+    results = sweep(X, y, columns, Cs, n_folds, processes, seed)
+    if artifact is None:
+        return results, None
+
+    best = results[0]
+    best_columns, unigrams, bigrams = select_columns(vectorizer, unigram_counts, bigram_counts,
+                                                     best['min_unigram_count'], best['min_bigram_count'])
+    best_vectorizer = PolitenessFeatureVectorizer(ngrams=(unigrams, bigrams))
+    if [vectorizer.feature_names[i] for i in best_columns] != best_vectorizer.feature_names:
+        raise ValueError("Column selection does not match the vectorizer's column order")
+    clf = train_model.fit_svm(X[:, best_columns], y, C=best['C'])
+    compiled = LinearPolitenessModel.from_svc(clf)
+    write_artifact(compiled, best_vectorizer, artifact)
+    json.dump({'best': best, 'results': results}, open(os.path.join(artifact, "tuning.json"), 'w'),
+              indent=2, sort_keys=True)
+    return results, compiled
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter sweep for the politeness SVM")
+    parser.add_argument("input", help="JSONL file of documents with 'sentences', 'parses' and 'score'")
+    parser.add_argument("--C", type=float, nargs="+", default=DEFAULT_C)
+    parser.add_argument("--min-counts", type=int, nargs="+", help="min count thresholds for both unigrams and bigrams")
+    parser.add_argument("--min-unigram-counts", type=int, nargs="+", default=DEFAULT_MIN_COUNTS)
+    parser.add_argument("--min-bigram-counts", type=int, nargs="+", default=DEFAULT_MIN_COUNTS)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--chunksize", type=int, default=1000)
+    parser.add_argument("--cache-dir", default="feature-cache", help="feature cache directory ('' to disable)")
+    parser.add_argument("--artifact", help="write the best model, refit on all documents, to this artifact directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="-", help="results table (TSV, '-' for stdout)")
+    args = parser.parse_args()
+
+    if args.min_counts:
+        args.min_unigram_counts = args.min_bigram_counts = args.min_counts
+    documents = list(iter_documents(args.input))
+    results, _ = tune(documents, args.C, args.min_unigram_counts, args.min_bigram_counts, args.folds,
+                      args.processes, args.chunksize, args.cache_dir or None, args.artifact, args.seed)
+    write_results(results, sys.stdout if args.output == "-" else open(args.output, "w"))
@@ -0,0 +1,355 @@
+import sys
+import json
+import time
+import Queue
+import argparse
+import threading
+import urlparse
+import SocketServer
+import BaseHTTPServer
+from collections import deque
+
+import numpy as np
+
+import model
+from features import instrumentation
+
+"""
+Local HTTP/JSON scoring server with request coalescing.
+
+Each HTTP request is handled in its own thread, which
+queues its documents and waits. A single batching thread
+collects queued documents into micro-batches--
+    up to max_batch_size documents, or
+    whatever arrived within max_wait seconds of the first
+and scores each micro-batch with one model.score_batch
+call (one vectorization pass, one predict_proba call).
+
+Endpoints--
+    POST /score     body: a document, or {"documents": [...]}
+                    returns {"polite", "impolite"}, or {"results": [...]};
+                    400 unless 'sentences' is a list of strings and
+                    'parses' a list of lists of strings. If a micro-batch
+                    raises, its documents are rescored one by one, so
+                    only requests with a failing document get a 500.
+    GET  /health    {"status": "ok"} once the model is loaded
+    GET  /metrics   queue depth, batch sizes, latency percentiles
+                    and instrumentation counters, as JSON
+                    (?format=prometheus for the text format)
+
+Usage:
+    python -m politeness.server --port 8000 --max-batch-size 64 --max-wait 0.005
+"""
+
+
+class _Pending(object):
+
+    __slots__ = ('document', 'done', 'result', 'error', 'enqueued')
+
+    def __init__(self, document):
+        self.document = document
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.enqueued = time.time()
+
+
+class MicroBatcher(object):
+
+    """
+    Coalesces documents submitted from many threads
+    into micro-batches scored on one batching thread
+    """
+
+    # Latencies kept for percentiles
+    LATENCY_WINDOW = 10000
+
+    def __init__(self, max_batch_size=64, max_wait=0.005, requests_only=False):
+        """
+        :param max_batch_size- max documents per score_batch call
+        :param max_wait- max seconds the first queued document
+            waits for others to join its batch
+        :param requests_only- score_batch(requests_only=True)
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests_only = requests_only
+        self.queue = Queue.Queue()
+        self.batches = 0
+        self.documents = 0
+        self.errors = 0
+        self.document_errors = 0
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._batch_sizes = deque(maxlen=self.LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        # Load before serving, so the first request doesn't pay for it
+        model.ensure_loaded()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, documents):
+        """
+        Queue documents and block until they are scored.
+        returns list of results, as model.score_batch
+        """
+        pending = [_Pending(d) for d in documents]
+        for p in pending:
+            self.queue.put(p)
+        for p in pending:
+            p.done.wait()
+            if p.error is not None:
+                raise p.error
+        return [p.result for p in pending]
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.time() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except Queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._score(batch)
+            if stop:
+                return
+
+    def _score_documents(self, documents):
+        return model.score_batch(documents, chunksize=len(documents), requests_only=self.requests_only)
+
+    def _score(self, batch):
+        failed = 0
+        try:
+            results = self._score_documents([p.document for p in batch])
+        except Exception as e:
+            batch_error = e
+        else:
+            batch_error = None
+            for p, result in zip(batch, results):
+                p.result = result
+        if batch_error is not None and len(batch) == 1:
+            batch[0].error = batch_error
+            failed = 1
+        elif batch_error is not None:
+            # Score each document alone, so only
+            # the documents that raise fail
+            for p in batch:
+                try:
+                    p.result = self._score_documents([p.document])[0]
+                except Exception as e:
+                    p.error = e
+                    failed += 1
+        now = time.time()
+        with self._lock:
+            self.batches += 1
+            self.documents += len(batch)
+            if batch_error is not None:
+                self.errors += 1
+            self.document_errors += failed
+            self._batch_sizes.append(len(batch))
+            self._latencies.extend(now - p.enqueued for p in batch)
+        for p in batch:
+            p.done.set()
+
+    def stats(self):
+        with self._lock:
+            latencies = np.asarray(self._latencies)
+            batch_sizes = np.asarray(self._batch_sizes)
+            stats = {
+                'queue_depth': self.queue.qsize(),
+                'batches': self.batches,
+                'documents': self.documents,
+                'errors': self.errors,
+                'document_errors': self.document_errors,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_s': self.max_wait,
+            }
+        if len(batch_sizes):
+            stats['mean_batch_size'] = float(batch_sizes.mean())
+        if len(latencies):
+            # Queue wait + scoring, per document
+            stats['latency_p50_ms'] = float(np.percentile(latencies, 50)) * 1000.0
+            stats['latency_p99_ms'] = float(np.percentile(latencies, 99)) * 1000.0
+        return stats
+
+    def close(self):
+        """
+        Score what is already queued, then stop
+        """
+        self.queue.put(None)
+        self._thread.join()
+
+
+def document_error(document):
+    """
+    returns why document can't be scored, or None
+    """
+    if not isinstance(document, dict) or 'sentences' not in document or 'parses' not in document:
+        return "documents must have 'sentences' and 'parses'"
+    sentences, parses = document['sentences'], document['parses']
+    if not isinstance(sentences, list) or not all(isinstance(s, basestring) for s in sentences):
+        return "'sentences' must be a list of strings"
+    if not isinstance(parses, list) or not all(
+            isinstance(p, list) and all(isinstance(e, basestring) for e in p) for p in parses):
+        return "'parses' must be a list of lists of strings"
+    return None
+
+
+class ScoringRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # Keep-alive: every response sets Content-Length
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body, content_type="application/json"):
+        if content_type == "application/json":
+            body = json.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        batcher = self.server.batcher
+        if url.path == "/health":
+            self._send(200, {'status': 'ok'})
+        elif url.path == "/metrics":
+            stats = batcher.stats()
+            if urlparse.parse_qs(url.query).get('format') == ['prometheus']:
+                self._send(200, prometheus_text(stats), "text/plain; version=0.0.4")
+            else:
+                stats['instrumentation'] = instrumentation.snapshot()
+                stats['request_filter'] = dict(model.request_filter_counts)
+                if model.result_cache is not None:
+                    stats['result_cache'] = model.result_cache.stats()
+                self._send(200, stats)
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if urlparse.urlparse(self.path).path != "/score":
+            self._send(404, {'error': 'not found'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.getheader('content-length', 0))))
+        except ValueError:
+            self._send(400, {'error': 'invalid JSON'})
+            return
+        single = not (isinstance(body, dict) and 'documents' in body)
+        documents = [body] if single else body['documents']
+        if not isinstance(documents, list):
+            self._send(400, {'error': "'documents' must be a list"})
+            return
+        for i, d in enumerate(documents):
+            error = document_error(d)
+            if error is not None:
+                self._send(400, {'error': error if single else "document %d: %s" % (i, error)})
+                return
+        try:
+            results = self.server.batcher.submit(documents)
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+            return
+        self._send(200, results[0] if single else {'results': results})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ScoringServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, batcher, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ScoringRequestHandler)
+        self.batcher = batcher
+        self.verbose = verbose
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        self.batcher.close()
+
+
+def prometheus_text(stats, prefix="politeness"):
+    """
+    Server gauges, followed by instrumentation.prometheus_text
+    """
+    lines = []
+    for name, help_text, key in [
+            ("queue_depth", "Documents waiting to be batched.", 'queue_depth'),
+            ("batches_total", "Micro-batches scored.", 'batches'),
+            ("documents_total", "Documents scored.", 'documents'),
+            ("batch_errors_total", "Micro-batches that raised.", 'errors'),
+            ("document_errors_total", "Documents that raised when scored alone.", 'document_errors'),
+            ("mean_batch_size", "Mean recent micro-batch size.", 'mean_batch_size'),
+            ("latency_p50_ms", "Median recent per-document latency.", 'latency_p50_ms'),
+            ("latency_p99_ms", "99th percentile recent per-document latency.", 'latency_p99_ms')]:
+        if key in stats:
+            name = "%s_server_%s" % (prefix, name)
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, "counter" if name.endswith("_total") else "gauge"))
+            lines.append("%s %r" % (name, stats[key]))
+    return "\n".join(lines) + "\n" + instrumentation.prometheus_text(prefix)
+
+
+def make_server(host="127.0.0.1", port=8000, max_batch_size=64, max_wait=0.005,
+                requests_only=False, verbose=False):
+    """
+    returns ScoringServer; call serve_forever() to run it
+    (port 0 picks a free port: see server.server_address)
+    """
+    return ScoringServer((host, port), MicroBatcher(max_batch_size, max_wait, requests_only), verbose)
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Politeness scoring server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait", type=float, default=0.005, help="seconds")
+    parser.add_argument("--requests-only", action="store_true",
+                        help="don't score documents that don't look like requests")
+    parser.add_argument("--compiled-model", help="score with a compiled model (see compiled_model.py)")
+    parser.add_argument("--artifact", help="score with a memory-mapped artifact (see artifacts.py)")
+    parser.add_argument("--result-cache", type=int, default=0, metavar="SIZE",
+                        help="cache up to SIZE results by document content (see result_cache.py)")
+    parser.add_argument("--result-cache-file", help="sqlite file shared by server processes")
+    parser.add_argument("--instrument", action="store_true", help="enable per-stage instrumentation")
+    parser.add_argument("--verbose", action="store_true", help="log each request")
+    args = parser.parse_args()
+
+    if args.compiled_model:
+        model.use_compiled_model(args.compiled_model)
+    elif args.artifact:
+        model.use_artifact(args.artifact)
+    if args.instrument:
+        instrumentation.enable()
+    if args.result_cache or args.result_cache_file:
+        model.use_result_cache(args.result_cache or 100000, args.result_cache_file)
+
+    server = make_server(args.host, args.port, args.max_batch_size, args.max_wait,
+                         args.requests_only, args.verbose)
+    sys.stderr.write("Serving on http://%s:%d\n" % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
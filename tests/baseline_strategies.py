@@ -0,0 +1,94 @@
+import re
+
+from politeness.features.politeness_strategies import hedges, polar_set
+
+"""
+Reference copy of the original dependency strategies, which
+worked on raw parse element strings: every accessor re-parses
+the string, and any strategy whose accessor raises (e.g. the
+right side of "punct(Thanks-1, ,-2)") is false for that element.
+The parity tests check the ParseElement strategies and the
+compiled StrategyEngine against these.
+"""
+
+parse_element_split_re = re.compile(r"([-\w!?]+)-(\d+)")
+getleft = lambda p: parse_element_split_re.findall(p)[0][0].lower()
+getleftpos = lambda p: int(parse_element_split_re.findall(p)[0][1])
+getright = lambda p: parse_element_split_re.findall(p)[1][0].lower()
+getrightpos = lambda p: int(parse_element_split_re.findall(p)[1][1])
+remove_numbers = lambda p: re.sub(r"\-(\d+)" , "", p)
+getdeptag = lambda p: p.split("(")[0]
+
+please = lambda p: len(set([getleft(p), getright(p)]).intersection(["please"])) > 0 and 1 not in [getleftpos(p), getrightpos(p)]
+please.__name__ = "Please"
+pleasestart = lambda p: (getleftpos(p) == 1 and getleft(p) == "please") or (getrightpos(p) == 1 and getright(p) == "please")
+pleasestart.__name__ = "Please start"
+hashedges = lambda p:   getdeptag(p) == "nsubj" and  getleft(p) in hedges
+hashedges.__name__ = "Hedges"
+deference = lambda p: (getleftpos(p) == 1 and getleft(p) in ["great","good","nice","good","interesting","cool","excellent","awesome"]) or (getrightpos(p) == 1 and getright(p) in ["great","good","nice","good","interesting","cool","excellent","awesome"])
+deference.__name__ = "Deference"
+gratitude = lambda p: getleft(p).startswith("thank") or getright(p).startswith("thank") or "(appreciate, i)" in remove_numbers(p).lower()
+gratitude.__name__ = "Gratitude"
+apologize = lambda p: getleft(p) in ("sorry","woops","oops") or getright(p) in ("sorry","woops","oops") or remove_numbers(p).lower() in ("dobj(excuse, me)", "nsubj(apologize, i)", "dobj(forgive, me)")
+apologize.__name__ = "Apologizing"
+groupidentity = lambda p: len(set([getleft(p), getright(p)]).intersection(["we", "our", "us", "ourselves"])) > 0
+groupidentity.__name__ = "1st person pl."
+firstperson = lambda p: 1 not in [getleftpos(p), getrightpos(p)] and len(set([getleft(p), getright(p)]).intersection(["i", "my", "mine", "myself"])) > 0
+firstperson.__name__ = "1st person"
+secondperson_start = lambda p: (getleftpos(p) == 1 and getleft(p) in ("you","your","yours","yourself")) or (getrightpos(p) == 1 and getright(p) in ("you","your","yours","yourself"))
+secondperson_start.__name__ = "2nd person start"
+firstperson_start = lambda p: (getleftpos(p) == 1 and getleft(p) in ("i","my","mine","myself")) or (getrightpos(p) == 1 and getright(p) in ("i","my","mine","myself"))
+firstperson_start.__name__ = "1st person start"
+hello = lambda p: (getleftpos(p) == 1 and getleft(p) in ("hi","hello","hey")) or (getrightpos(p) == 1 and getright(p) in ("hi","hello","hey"))
+hello.__name__ = "Indirect (greeting)"
+really = lambda p: (getright(p) == "fact" and getdeptag(p) == "prep_in") or remove_numbers(p) in ("det(point, the)","det(reality, the)","det(truth, the)") or len(set([getleft(p), getright(p)]).intersection(["really", "actually", "honestly", "surely"])) > 0
+really.__name__ = "Factuality"
+why = lambda p: (getleftpos(p) in (1,2) and getleft(p) in ("what","why","who","how")) or (getrightpos(p) in (1,2) and getright(p) in ("what","why","who","how"))
+why.__name__ = "Direct question"
+conj = lambda p: (getleftpos(p) == 1 and getleft(p) in ("so","then","and","but","or")) or (getrightpos(p) == 1 and getright(p) in ("so","then","and","but","or"))
+conj.__name__ = "Direct start"
+btw = lambda p: getdeptag(p) == "prep_by" and getright(p) == "way" and getrightpos(p) == 3
+btw.__name__ = "Indirect (btw)"
+secondperson = lambda p: 1 not in (getleftpos(p), getrightpos(p)) and len(set([getleft(p), getright(p)]).intersection(["you","your","yours","yourself"])) > 0
+secondperson.__name__ = "2nd person"
+initial_polar = lambda p: (getleftpos(p)==1 and getleft(p) in polar_set) or (getrightpos(p)==1 and getright(p) in polar_set)
+initial_polar.__name__ = "Initial Polar"
+aux_polar = lambda p: getdeptag(p) == "aux" and getright(p) in polar_set
+aux_polar.__name__ = "Aux Polar"
+
+
+def check_elems_for_strategy(elems, strategy_fnc):
+    for elem in elems:
+        try:
+            if strategy_fnc(elem):
+                return True
+        except Exception:
+            pass
+    return False
+
+
+DEPENDENCY_STRATEGIES = [
+    please, pleasestart, btw,
+    hashedges, really, deference,
+    gratitude, apologize, groupidentity,
+    firstperson, firstperson_start,
+    secondperson, secondperson_start,
+    hello, why, conj
+]
+
+
+def dependency_features(parses):
+    """
+    strategy name --> 0/1 for parses (lists of element strings)
+    """
+    return dict((fnc.__name__, int(check_elems_for_strategy(parses, lambda p: check_elems_for_strategy(p, fnc))))
+                for fnc in DEPENDENCY_STRATEGIES)
+
+
+def check_is_request(document):
+    for sentence, parse in zip(document['sentences'], document['parses']):
+        if "?" in sentence:
+            return True
+        if check_elems_for_strategy(parse, initial_polar) or check_elems_for_strategy(parse, aux_polar):
+            return True
+    return False
@@ -0,0 +1,88 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from politeness.features.cache import LRUCache, SqliteCache
+
+"""
+features/cache.py: the LRU, and the sqlite cache shared
+between processes (here, between connections) without
+holding a write lock between calls.
+"""
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+
+class SqliteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, "cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_uncommitted_puts_do_not_block_other_writers(self):
+        first = SqliteCache(self.filename, timeout=0.5)
+        second = SqliteCache(self.filename, timeout=0.5)
+        first.put("a", 1)
+        second.put("b", 2)
+        second.commit()
+        self.assertEqual(first.get("b"), 2)
+        # first's own puts are visible to it before commit,
+        # and to the others after
+        self.assertEqual(first.get("a"), 1)
+        self.assertIsNone(second.get("a"))
+        first.commit()
+        self.assertEqual(second.get("a"), 1)
+        self.assertEqual((first.errors, second.errors), (0, 0))
+        first.close()
+        second.close()
+
+    def test_commit_every(self):
+        writer = SqliteCache(self.filename, commit_every=2)
+        reader = SqliteCache(self.filename)
+        writer.put("a", 1)
+        self.assertIsNone(reader.get("a"))
+        writer.put("b", 2)
+        self.assertEqual(reader.get("a"), 1)
+        writer.close()
+        reader.close()
+
+    def test_locked_database_is_a_miss(self):
+        cache = SqliteCache(self.filename, timeout=0.1)
+        cache.put("a", 1)
+        cache.commit()
+        # Another process holding the write lock
+        conn = sqlite3.connect(self.filename, timeout=0.1, isolation_level=None)
+        conn.execute("BEGIN EXCLUSIVE")
+        try:
+            cache.put("b", 2)
+            cache.commit()
+            self.assertEqual(cache.stats()['errors'], 1)
+            self.assertIsNone(cache.get("b"))
+            # Readers don't wait for the writer
+            self.assertEqual(cache.get("a"), 1)
+        finally:
+            conn.execute("ROLLBACK")
+            conn.close()
+        cache.put("b", 2)
+        cache.close()
+        self.assertEqual(SqliteCache(self.filename).get("b"), 2)
+
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,47 @@
+import gc
+import copy
+import shutil
+import tempfile
+import unittest
+
+from politeness.test_documents import TEST_DOCUMENTS
+from politeness.features import tokenizer
+from politeness.features.vectorizer import PolitenessFeatureVectorizer
+from politeness.packed_corpus import write_packed_corpus, PackedCorpus
+
+"""
+packed_corpus.py: transform gives the vectorizer's own rows,
+for each of several vectorizers used in turn on one corpus.
+"""
+
+
+class PackedCorpusTransformTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dirname = tempfile.mkdtemp()
+        write_packed_corpus(copy.deepcopy(TEST_DOCUMENTS), cls.dirname, tokenizer.CachedTokenizer('regex'))
+        full = PolitenessFeatureVectorizer()
+        cls.vocabularies = [(full.unigrams, full.bigrams), (full.unigrams[::2], full.bigrams[1::2])]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dirname)
+
+    def test_each_vectorizer_gets_its_own_columns(self):
+        corpus = PackedCorpus(self.dirname)
+        for ngrams in self.vocabularies * 2:
+            # The previous vectorizer is collected first,
+            # so this one may well reuse its id()
+            gc.collect()
+            vectorizer = PolitenessFeatureVectorizer(tokenize=tokenizer.CachedTokenizer('regex'), ngrams=ngrams)
+            expected = vectorizer.transform(copy.deepcopy(TEST_DOCUMENTS))
+            self.assertEqual((corpus.transform(vectorizer) != expected).nnz, 0)
+            del vectorizer, expected
+        self.assertEqual(len(corpus._columns), 0)
+
+
+
+if __name__ == "__main__":
+
+    unittest.main()
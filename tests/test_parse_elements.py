@@ -0,0 +1,115 @@
+import re
+import copy
+import random
+import shutil
+import tempfile
+import unittest
+
+from politeness.test_documents import TEST_DOCUMENTS
+from politeness.scripts.synthetic_corpus import generate_corpus
+from politeness.features import tokenizer
+from politeness.features.politeness_strategies import (parse_element, ingest_parses, get_politeness_strategy_features,
+                                                       fnc2feature_name, DEPENDENCY_STRATEGIES, NO_POSITION)
+from politeness.request_utils import check_is_request
+from politeness.packed_corpus import write_packed_corpus, PackedCorpus
+from politeness.tests import baseline_strategies
+
+"""
+Parity of parse element ingestion and the dependency
+strategies with the original string-based strategies
+(tests/baseline_strategies.py), including elements with
+a single word-index constituent or none.
+
+Run from the directory containing the politeness package:
+    python -m unittest discover -s politeness/tests -t .
+"""
+
+# One word-index constituent, or none
+INCOMPLETE_PARSES = [
+    ["punct(Thanks-1, ,-2)"],
+    ["punct(Please-1, ,-2)"],
+    ["dep(You-1, ,-2)"],
+    ["dep(Great-1, !)"],
+    ["discourse(Hi-1, ,-2)", "dep(so-1, ,)"],
+    ["advmod(why-2, ,)", "nsubj(think-3, ,)"],
+    ["dep(please-4, ,)", "dep(we-2, ,)", "dep(i-3, ,)", "dep(you-3, ,)", "dep(really-2, ,)"],
+    ["det(point-3, the)", "dobj(excuse-1, me)", "nsubj(appreciate-2, i)", "prep_in(x-2, fact)"],
+    ["prep_by(x-1, way)", "aux(x-2, can)", "aux(can-1, ,)", "dep(sorry-5, ,)", "dep(thanks-4, .)"],
+    ["nsubj(dont, I-1)", "dep(, ,)", "root(ROOT)", ""],
+]
+
+
+def damaged(parse, rng):
+    """
+    Drop the position of some elements' right (or left) word
+    """
+    result = []
+    for p in parse:
+        r = rng.random()
+        if r < 0.2:
+            p = re.sub(r"-(\d+)\)$", ")", p)
+        elif r < 0.3:
+            p = re.sub(r"-(\d+),", ",", p, count=1)
+        result.append(p)
+    return result
+
+
+def documents():
+    rng = random.Random(0)
+    docs = [copy.deepcopy(d) for d in TEST_DOCUMENTS]
+    docs.extend({'sentences': ["A sentence."] * len(parse), 'parses': [[p] for p in parse]}
+                for parse in INCOMPLETE_PARSES)
+    docs.extend({'sentences': ["A sentence"], 'parses': [parse]} for parse in INCOMPLETE_PARSES)
+    for d in generate_corpus(300):
+        docs.append({'sentences': d['sentences'], 'parses': [damaged(p, rng) for p in d['parses']]})
+    return docs
+
+
+class ParseElementTest(unittest.TestCase):
+
+    def test_single_constituent_is_kept(self):
+        elem = parse_element("punct(Thanks-1, ,-2)")
+        self.assertEqual((elem.left, elem.leftpos, elem.right, elem.rightpos), ("thanks", 1, "", NO_POSITION))
+        self.assertFalse(elem.complete)
+        self.assertTrue(parse_element("nsubj(dont-5, I-4)").complete)
+
+    def test_no_constituent_is_dropped(self):
+        self.assertIsNone(parse_element("root(ROOT)"))
+        self.assertEqual(ingest_parses([["root(ROOT)", "dep(so-1, ,)"]])[0][0].left, "so")
+
+
+class BaselineParityTest(unittest.TestCase):
+
+    def test_dependency_strategies(self):
+        for d in documents():
+            expected = baseline_strategies.dependency_features(d['parses'])
+            document = copy.deepcopy(d)
+            document['unigrams'] = []
+            features = get_politeness_strategy_features(document)
+            for fnc in DEPENDENCY_STRATEGIES:
+                self.assertEqual(features[fnc2feature_name(fnc)], expected[fnc.__name__], (fnc.__name__, d['parses']))
+
+    def test_request_check(self):
+        for d in documents():
+            self.assertEqual(check_is_request(copy.deepcopy(d)), baseline_strategies.check_is_request(d), d['parses'])
+
+    def test_packed_corpus(self):
+        docs = documents()
+        dirname = tempfile.mkdtemp()
+        try:
+            write_packed_corpus(copy.deepcopy(docs), dirname, tokenizer.CachedTokenizer('regex'))
+            corpus = PackedCorpus(dirname)
+            for i, d in enumerate(docs):
+                expected = baseline_strategies.dependency_features(d['parses'])
+                detected = dict((fnc.__name__, present) for fnc, present in corpus.strategy_features(i)
+                                if fnc in DEPENDENCY_STRATEGIES)
+                self.assertEqual(detected, expected, d['parses'])
+                self.assertEqual(corpus.is_request(i), baseline_strategies.check_is_request(d), d['parses'])
+        finally:
+            shutil.rmtree(dirname)
+
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+from politeness import model
+from politeness.test_documents import TEST_DOCUMENTS
+from politeness.compiled_model import LinearPolitenessModel
+from politeness.features import tokenizer
+from politeness.features.cache import SqliteCache
+from politeness.features.vectorizer import PolitenessFeatureVectorizer
+from politeness.result_cache import ResultCache
+
+"""
+model's result cache shared through an sqlite file: each
+batch's results are visible to other processes (here, other
+connections), and a locked file never fails scoring.
+"""
+
+
+class SharedResultCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.saved = (model.clf, model.vectorizer, model.result_cache, model._model_version)
+        model.vectorizer = PolitenessFeatureVectorizer(tokenize=tokenizer.regex_tokenize)
+        rng = np.random.RandomState(0)
+        model.clf = LinearPolitenessModel(rng.normal(size=len(model.vectorizer.feature_names)), 0.1, -1.5, 0.2)
+        model._model_version = None
+        model.result_cache = None
+        cls.expected = model._score_documents(TEST_DOCUMENTS)
+
+    @classmethod
+    def tearDownClass(cls):
+        model.clf, model.vectorizer, model.result_cache, model._model_version = cls.saved
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, "results.sqlite")
+
+    def tearDown(self):
+        if model.result_cache is not None:
+            model.result_cache.close()
+            model.result_cache = None
+        shutil.rmtree(self.dirname)
+
+    def use_cache(self, timeout=5.0):
+        cache = ResultCache(filename=self.filename)
+        cache.shared.close()
+        cache.shared = SqliteCache(self.filename, table="results", timeout=timeout)
+        model.result_cache = cache
+        return cache
+
+    def test_batch_results_are_shared(self):
+        self.use_cache()
+        np.testing.assert_allclose(model._score_documents(TEST_DOCUMENTS), self.expected)
+        other = ResultCache(filename=self.filename)
+        try:
+            version = model.model_version()
+            for d, p in zip(TEST_DOCUMENTS, self.expected):
+                np.testing.assert_allclose(other.get(other.key(d, version)), p)
+        finally:
+            other.close()
+
+    def test_locked_file_does_not_fail_scoring(self):
+        cache = self.use_cache(timeout=0.1)
+        lock = sqlite3.connect(self.filename, isolation_level=None)
+        lock.execute("BEGIN EXCLUSIVE")
+        try:
+            np.testing.assert_allclose(model._score_documents(TEST_DOCUMENTS), self.expected)
+        finally:
+            lock.execute("ROLLBACK")
+            lock.close()
+        self.assertGreater(cache.stats()['shared']['errors'], 0)
+        # Results stay cached in memory
+        np.testing.assert_allclose(model._score_documents(TEST_DOCUMENTS), self.expected)
+        self.assertEqual(cache.hits, len(TEST_DOCUMENTS))
+
+
+
+if __name__ == "__main__":
+
+    unittest.main()
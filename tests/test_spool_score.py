@@ -0,0 +1,97 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from politeness import model
+from politeness.test_documents import TEST_DOCUMENTS
+from politeness.compiled_model import LinearPolitenessModel
+from politeness.features import tokenizer
+from politeness.features.vectorizer import PolitenessFeatureVectorizer
+from politeness.scripts import spool_score
+from politeness.scripts.spool_score import (LeaseLost, _path, _write_atomic, acquire_lease, release_lease,
+                                            lease_owner, score_shard)
+
+"""
+scripts/spool_score.py: lease ownership, so a slow worker whose
+lease was taken over neither releases the new owner's lease nor
+writes the shard's result, and temporary file cleanup.
+"""
+
+
+class SpoolLeaseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.saved = (model.clf, model.vectorizer, model.result_cache, model._model_version)
+        model.vectorizer = PolitenessFeatureVectorizer(tokenize=tokenizer.regex_tokenize)
+        rng = np.random.RandomState(0)
+        model.clf = LinearPolitenessModel(rng.normal(size=len(model.vectorizer.feature_names)), 0.1, -1.5, 0.2)
+        model._model_version = None
+        model.result_cache = None
+
+    @classmethod
+    def tearDownClass(cls):
+        model.clf, model.vectorizer, model.result_cache, model._model_version = cls.saved
+
+    def setUp(self):
+        self.spool = tempfile.mkdtemp()
+        for kind in ("shards", "leases", "results", "errors"):
+            os.makedirs(os.path.join(self.spool, kind))
+        with open(_path(self.spool, "shards", 0), "w") as f:
+            f.writelines(json.dumps(d) + "\n" for d in TEST_DOCUMENTS)
+
+    def tearDown(self):
+        shutil.rmtree(self.spool)
+
+    def take_over(self, worker_id):
+        # Any lease is stale with a negative timeout
+        self.assertTrue(acquire_lease(self.spool, 0, worker_id, lease_timeout=-1))
+
+    def leftovers(self):
+        return [f for kind in ("results", "errors") for f in os.listdir(os.path.join(self.spool, kind))]
+
+    def test_write_atomic_keeps_original_error(self):
+        missing = os.path.join(self.spool, "missing", "result.jsonl")
+        self.assertRaises(IOError, _write_atomic, missing, lambda f: None)
+
+        def write(f):
+            raise KeyError("document")
+        self.assertRaises(KeyError, _write_atomic, _path(self.spool, "results", 0), write)
+        self.assertEqual(self.leftovers(), [])
+
+    def test_release_only_own_lease(self):
+        self.assertTrue(acquire_lease(self.spool, 0, "slow"))
+        self.take_over("new")
+        release_lease(self.spool, 0, "slow")
+        self.assertEqual(lease_owner(self.spool, 0), "new")
+        release_lease(self.spool, 0, "new")
+        self.assertEqual(lease_owner(self.spool, 0), None)
+
+    def test_takeover_removes_temporary_files(self):
+        self.assertTrue(acquire_lease(self.spool, 0, "killed"))
+        for kind in ("results", "errors"):
+            open(_path(self.spool, kind, 0) + ".tmp-host-1234", "w").close()
+        self.take_over("new")
+        self.assertEqual(self.leftovers(), [])
+
+    def test_lost_lease_does_not_write_result(self):
+        # Lost before the last chunk (heartbeat), and after it (before the rename)
+        for chunksize in (1, len(TEST_DOCUMENTS) + 1):
+            self.assertTrue(acquire_lease(self.spool, 0, "slow"))
+            self.take_over("new")
+            self.assertRaises(LeaseLost, score_shard, self.spool, 0, "slow", chunksize)
+            self.assertEqual(self.leftovers(), [])
+            release_lease(self.spool, 0, "new")
+        self.assertTrue(acquire_lease(self.spool, 0, "new"))
+        self.assertEqual(score_shard(self.spool, 0, "new", 2), len(TEST_DOCUMENTS))
+        self.assertEqual(self.leftovers(), [spool_score.shard_name(0) + ".jsonl"])
+
+
+
+if __name__ == "__main__":
+
+    unittest.main()
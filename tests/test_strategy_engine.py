@@ -0,0 +1,126 @@
+import re
+import random
+import unittest
+from itertools import chain
+
+from politeness.test_documents import TEST_DOCUMENTS
+from politeness.scripts.synthetic_corpus import generate_corpus
+from politeness.features.strategy_engine import StrategyEngine, WordRule, ElementRule
+from politeness.features.politeness_strategies import (ingest_parses, check_elems_for_strategy,
+                                                       DEPENDENCY_STRATEGIES, initial_polar, aux_polar)
+from politeness.tests import baseline_strategies
+from politeness.tests.test_parse_elements import INCOMPLETE_PARSES, damaged
+
+"""
+Parity of the compiled StrategyEngine, and of the ParseElement
+strategy lambdas it falls back to, with the original string
+strategies (tests/baseline_strategies.py) applied to the raw
+element strings-- including elements with one word-index
+constituent or none, which the original accessors half-parsed.
+
+Run from the directory containing the politeness package:
+    python -m unittest discover -s politeness/tests -t .
+"""
+
+STRATEGIES = DEPENDENCY_STRATEGIES + [initial_polar, aux_polar]
+BASELINE = baseline_strategies.DEPENDENCY_STRATEGIES + [baseline_strategies.initial_polar,
+                                                        baseline_strategies.aux_polar]
+TAGS = ["nsubj", "aux", "prep_in", "prep_by", "dep"]
+
+
+def rule_words():
+    words, elements = set(["x", "thanks", "thankful", "the"]), set()
+    for fnc in STRATEGIES:
+        for rule in fnc.rules:
+            if isinstance(rule, WordRule):
+                words.update(rule.words)
+            else:
+                elements.update(rule.elements)
+    return sorted(words), sorted(elements)
+
+
+def element_strings():
+    """
+    Every rule word on either side, at several positions and
+    with the other side missing, plus numbered variants of
+    the whole-element rules and real (and damaged) parses
+    """
+    words, elements = rule_words()
+    strings = []
+    for w in words:
+        w = w.replace(" ", "_")
+        for tag in TAGS:
+            for i in (1, 2, 3):
+                strings.extend(["%s(%s-%d, x-%d)" % (tag, w, i, j) for j in (1, 4)])
+                strings.extend(["%s(x-%d, %s-%d)" % (tag, j, w, i) for j in (1, 4)])
+                strings.append("%s(%s-%d, ,-%d)" % (tag, w, i, i + 1))
+                strings.append("%s(%s, x-%d)" % (tag, w, i))
+            strings.append("%s(%s-1, x)" % (tag, w.capitalize()))
+    for e in elements:
+        numbered = re.sub(r"(\w+), (\w+)\)", r"\1-2, \2-1)", e)
+        strings.extend([e, numbered, numbered.upper(), re.sub(r", (\w+)-1\)", r", \1)", numbered),
+                        re.sub(r"\((\w+)-2,", r"(\1,", numbered)])
+    rng = random.Random(0)
+    for d in chain(TEST_DOCUMENTS, generate_corpus(100)):
+        for parse in d['parses']:
+            strings.extend(parse)
+            strings.extend(damaged(parse, rng))
+    strings.extend(chain.from_iterable(INCOMPLETE_PARSES))
+    return strings
+
+
+def uncompiled(fnc):
+    # Same function, without rules: the engine calls it per element
+    wrapper = lambda p: fnc(p)
+    wrapper.__name__ = fnc.__name__
+    return wrapper
+
+
+class StrategyEngineParityTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.strings = element_strings()
+        cls.expected = [[int(baseline_strategies.check_elems_for_strategy([p], fnc)) for fnc in BASELINE]
+                        for p in cls.strings]
+
+    def check_engine(self, engine):
+        names = [fnc.__name__ for fnc in STRATEGIES]
+        for p, expected in zip(self.strings, self.expected):
+            detected = engine.detect(ingest_parses([[p]]))
+            mismatched = [n for n, a, b in zip(names, detected, expected) if a != b]
+            self.assertEqual(mismatched, [], (p, mismatched))
+
+    def test_baseline_names(self):
+        self.assertEqual([f.__name__ for f in STRATEGIES], [f.__name__ for f in BASELINE])
+
+    def test_compiled_rules(self):
+        self.check_engine(StrategyEngine(STRATEGIES, check_elems=check_elems_for_strategy))
+
+    def test_strategy_functions(self):
+        self.check_engine(StrategyEngine(map(uncompiled, STRATEGIES), check_elems=check_elems_for_strategy))
+
+    def test_documents(self):
+        engine = StrategyEngine(STRATEGIES, check_elems=check_elems_for_strategy)
+        rng = random.Random(1)
+        for _ in xrange(300):
+            parses = [rng.sample(self.strings, rng.randint(1, 8)) for _ in xrange(rng.randint(1, 3))]
+            expected = [int(any(baseline_strategies.check_elems_for_strategy(parse, fnc) for parse in parses))
+                        for fnc in BASELINE]
+            self.assertEqual(engine.detect(ingest_parses(parses)), expected, parses)
+
+    def test_element_rule_only_engine(self):
+        # A custom strategy with only element rules never
+        # matches an element missing its right side
+        fnc = lambda p: p.complete and p.lnonum == "dobj(excuse, me)"
+        fnc.__name__ = "Excuse me"
+        fnc.rules = [ElementRule(["dobj(excuse, me)"])]
+        engine = StrategyEngine([fnc])
+        self.assertEqual(engine.detect(ingest_parses([["dobj(excuse-1, me-2)"]])), [1])
+        self.assertEqual(engine.detect(ingest_parses([["dobj(excuse-1, me)"]])), [0])
+
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from politeness.test_documents import TEST_DOCUMENTS
+from politeness.features.tokenizer import CachedTokenizer, regex_tokenize
+
+"""
+Conformance of tokenizer.regex_tokenize with nltk (the
+test form of scripts/check_tokenizer.py), and of
+CachedTokenizer with the tokenizer it wraps.
+
+The regex port follows nltk 3.0's Treebank tokenizer.
+Later nltk versions also treat '' after a space as an
+opening quote, so no sentence here has one.
+"""
+
+try:
+    import nltk
+    from nltk.tokenize import TreebankWordTokenizer
+except ImportError:
+    nltk = None
+
+
+def _has_punkt():
+    try:
+        nltk.data.find("tokenizers/punkt")
+    except LookupError:
+        return False
+    return True
+
+
+SENTENCES = [s for d in TEST_DOCUMENTS for s in d['sentences']] + [
+    "Could you please take a look?",
+    "Thanks!! I can't believe it's done.",
+    "He said \"hi\" -- can't you?",
+    "I'd like (maybe) 3.5 items; isn't it?",
+    "Gimme that, wanna go?",
+    "We're here... aren't we?",
+    "What's the URL: http://example.com/a?b=1",
+    "She'll say 'yes' or 'no'.",
+    "Cost is $5.00 & 10% off [today] {ok}.",
+    "They've gotta be kidding... right?",
+    "Don't, won't, shouldn't-- cannot.",
+    "e-mail me at foo@bar.com, please.",
+    "``Quoted'' text",
+    "Hi :) is there another way?",
+    "Why can't you just store the 'Range'?",
+]
+
+
+@unittest.skipIf(nltk is None, "nltk is not installed")
+class NltkConformanceTest(unittest.TestCase):
+
+    def test_treebank(self):
+        treebank = TreebankWordTokenizer()
+        for s in SENTENCES:
+            self.assertEqual(list(regex_tokenize(s)), treebank.tokenize(s), s)
+
+    @unittest.skipUnless(nltk is not None and _has_punkt(), "nltk punkt data is not installed")
+    def test_word_tokenize(self):
+        # One sentence each, so punkt does not split them
+        for s in SENTENCES:
+            self.assertEqual(list(regex_tokenize(s)), nltk.word_tokenize(s), s)
+
+
+class CachedTokenizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, "tokens.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_same_tokens(self):
+        tokenize = CachedTokenizer('regex')
+        for s in SENTENCES + SENTENCES:
+            self.assertEqual(tokenize(s), tuple(regex_tokenize(s)))
+        self.assertEqual(tokenize.stats()['misses'], len(set(SENTENCES)))
+
+    def test_persistent_cache_is_shared(self):
+        first = CachedTokenizer('regex', persistent=self.filename)
+        second = CachedTokenizer('regex', persistent=self.filename)
+        first(SENTENCES[0])
+        first.commit()
+        self.assertEqual(second(SENTENCES[0]), tuple(regex_tokenize(SENTENCES[0])))
+        self.assertEqual(second.stats()['persistent']['hits'], 1)
+        # Both write without waiting on each other
+        for s in SENTENCES:
+            second(s + " again")
+            first(s + " once more")
+        first.commit()
+        second.commit()
+        self.assertEqual(first.stats()['persistent']['errors'], 0)
+        self.assertEqual(second.stats()['persistent']['errors'], 0)
+        first.close()
+        second.close()
+
+
+
+if __name__ == "__main__":
+
+    unittest.main()